@@ -0,0 +1,214 @@
+"""
+BatchSolve: Solve many games of Towers of Anne Hoy from the command line,
+across a pool of processes.
+
+parse_configurations: Turn specifications like '5-10:3,4' into games
+solve_configuration: Solve one game and describe the result
+run_batch: Solve many games, writing each result as soon as it is done
+
+Games with 3 stools are solved by Tour.three_stool_hanoi, with 4 stools by
+Tour.tour_of_four_stools and with more by Tour.tour_of_k_stools. Results
+are written as JSON lines (one object per line) or CSV rows, each one
+flushed as soon as its game is solved, so a killed run only loses the
+games it was in the middle of. Running again with the same output file
+skips the games already in it:
+
+    python BatchSolve.py 1-20:3 1-30:4,5 --output results.jsonl --packed
+"""
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from TOAHModel import TOAHModel, PackedMoveSequence
+from Tour import (three_stool_hanoi, tour_of_four_stools, tour_of_k_stools,
+                  frame_stewart_moves)
+import base64
+import csv
+import json
+import os
+import time
+
+# Columns of the results, in the order they are written to CSV
+FIELDS = ('cheeses', 'stools', 'moves', 'optimal_moves', 'solved', 'seconds',
+          'packed_moves')
+
+
+def _parse_numbers(text):
+    '''
+    (str) -> list of int
+    Return the numbers in text, a comma separated list of numbers and
+    ranges like 3-6, which include both ends.
+    >>> _parse_numbers('1,3-5')
+    [1, 3, 4, 5]
+    '''
+    result = []
+    for part in text.split(','):
+        if ('-' in part):
+            low, high = part.split('-')
+            result.extend(range(int(low), int(high) + 1))
+        else:
+            result.append(int(part))
+    return result
+
+
+def parse_configurations(specifications) -> list:
+    '''
+    (iterable of str) -> list of (int, int)
+    Return the (cheeses, stools) games given by specifications, each
+    CHEESES:STOOLS where both are lists of numbers and ranges, meaning every
+    combination of them. Games given more than once are only listed once.
+    >>> parse_configurations(['1-2:3,4', '2:4'])
+    [(1, 3), (1, 4), (2, 3), (2, 4)]
+    '''
+    result = []
+    seen = set()
+    for specification in specifications:
+        cheeses, stools = specification.split(':')
+        for num_cheese in _parse_numbers(cheeses):
+            for num_stools in _parse_numbers(stools):
+                if ((num_cheese, num_stools) not in seen):
+                    seen.add((num_cheese, num_stools))
+                    result.append((num_cheese, num_stools))
+    return result
+
+
+def solve_configuration(job) -> dict:
+    '''
+    ((int, int, bool)) -> dict
+    Solve the game of job, (cheeses, stools, packed), and return its number
+    of moves, the least number of moves, whether every cheese ended up on
+    the last stool, the time the solver took in seconds, and if packed, the
+    moves packed by PackedMoveSequence and encoded in base64 (None for more
+    stools than it can pack).
+    REQ: cheeses >= 1 and stools >= 3
+    >>> result = solve_configuration((3, 4, True))
+    >>> result['moves'], result['solved'], result['packed_moves']
+    (5, True, 'Ejtw')
+    '''
+    num_cheese, num_stools, packed = job
+    model = TOAHModel(num_stools)
+    model.fill_first_stool(num_cheese)
+    start_time = time.perf_counter()
+    if (num_stools == 3):
+        three_stool_hanoi(model, num_cheese, 0, 1, 2, False)
+    elif (num_stools == 4):
+        tour_of_four_stools(model, console_animate=False)
+    else:
+        tour_of_k_stools(model, console_animate=False)
+    seconds = time.perf_counter() - start_time
+    result = {'cheeses': num_cheese, 'stools': num_stools,
+              'moves': model.number_of_moves(),
+              'optimal_moves': frame_stewart_moves(num_cheese, num_stools),
+              'solved': (model.stool_assignment() ==
+                         [num_stools - 1] * num_cheese),
+              'seconds': seconds, 'packed_moves': None}
+    moves = model.get_move_seq()
+    if (packed and isinstance(moves, PackedMoveSequence)):
+        result['packed_moves'] = base64.b64encode(
+            moves.to_bytes()).decode('ascii')
+    return result
+
+
+def _finished_games(path, output_format):
+    '''
+    (str, str) -> set of (int, int)
+    Return the (cheeses, stools) games with results in the file at path,
+    ignoring a last line cut short by a killed run.
+    '''
+    result = set()
+    if (os.path.exists(path)):
+        with open(path, newline='') as results:
+            if (output_format == 'csv'):
+                rows = csv.DictReader(results)
+            else:
+                rows = []
+                for line in results:
+                    try:
+                        rows.append(json.loads(line))
+                    except ValueError:
+                        pass
+            for row in rows:
+                try:
+                    result.add((int(row['cheeses']), int(row['stools'])))
+                except (KeyError, TypeError, ValueError):
+                    pass
+    return result
+
+
+def run_batch(configurations, output: str, output_format: str='json',
+              workers: int=None, packed: bool=False,
+              verbose: bool=False) -> int:
+    '''
+    (list of (int, int), str, str, int, bool, bool) -> int
+    Solve every (cheeses, stools) game in configurations that doesn't have
+    a result in the file at output yet, with workers processes (one per CPU
+    by default), and add each result to output as soon as it is done, in
+    output_format: 'json' for JSON lines or 'csv'. If packed, include the
+    packed moves. If verbose, print each result as it is written. Return
+    the number of games solved.
+    REQ: output_format in ('json', 'csv')
+    '''
+    done = _finished_games(output, output_format)
+    jobs = [(num_cheese, num_stools, packed)
+            for (num_cheese, num_stools) in configurations
+            if (num_cheese, num_stools) not in done]
+    if (workers is None):
+        workers = os.cpu_count() or 1
+    new_file = not os.path.exists(output) or os.path.getsize(output) == 0
+    # A killed run can leave a line cut short; start on a line of our own
+    cut_short = False
+    if (not new_file):
+        with open(output, 'rb') as results:
+            results.seek(-1, os.SEEK_END)
+            cut_short = results.read(1) != b'\n'
+    solved = 0
+    with open(output, 'a', newline='') as results:
+        if (cut_short):
+            results.write('\n')
+        writer = None
+        if (output_format == 'csv'):
+            writer = csv.DictWriter(results, FIELDS)
+            if (new_file):
+                writer.writeheader()
+        pool = ProcessPoolExecutor(max_workers=workers)
+        try:
+            futures = [pool.submit(solve_configuration, job) for job in jobs]
+            for future in as_completed(futures):
+                result = future.result()
+                if (writer is None):
+                    results.write(json.dumps(result, sort_keys=True) + '\n')
+                else:
+                    writer.writerow(result)
+                # Write it out now, so a killed run keeps it
+                results.flush()
+                solved += 1
+                if (verbose):
+                    print(result['cheeses'], 'cheeses,', result['stools'],
+                          'stools:', result['moves'], 'moves in',
+                          format(result['seconds'], '.3f'), 's')
+        finally:
+            pool.shutdown(cancel_futures=True)
+    return solved
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Solve many games of Towers of Anne Hoy in parallel.")
+    parser.add_argument('games', nargs='+',
+                        help="CHEESES:STOOLS, each a list of numbers and "
+                        "ranges, e.g. 1-20:3,4")
+    parser.add_argument('--output', required=True,
+                        help="file to add the results to; games already in "
+                        "it are skipped")
+    parser.add_argument('--format', choices=('json', 'csv'), default=None,
+                        help="JSON lines or CSV (default: from the output "
+                        "file's extension)")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--packed', action='store_true',
+                        help="include the moves, packed and base64 encoded")
+    args = parser.parse_args()
+    output_format = args.format
+    if (output_format is None):
+        output_format = 'csv' if args.output.endswith('.csv') else 'json'
+    solved = run_batch(parse_configurations(args.games), args.output,
+                       output_format, args.workers, args.packed, True)
+    print(solved, 'games solved')
@@ -0,0 +1,450 @@
+"""
+Benchmark: Measure the solvers, model operations, replay and rendering of
+Towers of Anne Hoy, and catch performance regressions.
+
+run_benchmarks: Run the scenario matrix and return the results
+compare: List the scenarios that got slower or bigger than a baseline
+
+Every scenario is run a number of times. The results give the operations
+per second of the fastest run, the 50th, 90th and 99th percentile of the
+run times, and the peak memory of one extra run traced by tracemalloc.
+Run this module to print the results, save them as JSON, and compare them
+with a saved baseline:
+
+    python Benchmark.py --output results.json --baseline baseline.json
+"""
+
+from TOAHModel import TOAHModel, CompactTOAHModel, Cheese, MoveSequence
+from Tour import (three_stool_hanoi, four_stool_hanoi, iter_moves,
+                  iter_move_chunks, recursive_solution)
+from TextRenderer import TextRenderer
+from itertools import islice
+import io
+import json
+import math
+import platform
+import time
+import tracemalloc
+import types
+
+# How much slower or bigger than the baseline counts as a regression
+DEFAULT_TOLERANCE = 0.10
+
+
+def _solver_scenario(solver, num_cheese, num_stools):
+    '''
+    (function, int, int) -> function
+    Return a scenario that solves a fresh model with num_cheese cheeses
+    and num_stools stools using solver.
+    '''
+    def setup():
+        model = TOAHModel(num_stools)
+        model.fill_first_stool(num_cheese)
+        stools = list(range(num_stools))
+
+        def run():
+            solver(model, num_cheese, *stools, False)
+            return model.number_of_moves()
+        return run
+    return setup
+
+
+def _move_scenario(model_class, num_cheese, num_stools):
+    '''
+    (type, int, int) -> function
+    Return a scenario that applies a precomputed solution to a fresh
+    model_class model through move.
+    '''
+    moves = list(iter_moves(num_cheese, num_stools))
+
+    def setup():
+        model = model_class(num_stools)
+        model.fill_first_stool(num_cheese)
+
+        def run():
+            move = model.move
+            for (src, dest) in moves:
+                move(src, dest)
+            return len(moves)
+        return run
+    return setup
+
+
+def _apply_scenario(model_class, num_cheese, num_stools):
+    '''
+    (type, int, int) -> function
+    Return a scenario that applies a precomputed solution, packed one move
+    per byte, to a fresh model_class model through apply_moves.
+    '''
+    moves = b''.join(iter_move_chunks(num_cheese, num_stools))
+
+    def setup():
+        model = model_class(num_stools)
+        model.fill_first_stool(num_cheese)
+
+        def run():
+            model.apply_moves(moves)
+            return len(moves)
+        return run
+    return setup
+
+
+def _location_scenario(model_class, num_cheese, calls=1000):
+    '''
+    (type, int, int) -> function
+    Return a scenario that looks up the stool of calls cheeses spread over
+    a model_class model with 3 stools.
+    '''
+    def setup():
+        model = model_class(3)
+        model.fill_stools([size % 3 for size in range(num_cheese)])
+        cheeses = [Cheese(1 + (i * 7919) % num_cheese) for i in range(calls)]
+
+        def run():
+            location = model.cheese_location
+            for cheese in cheeses:
+                location(cheese)
+            return calls
+        return run
+    return setup
+
+
+def _replay_scenario(packed, num_cheese, num_stools):
+    '''
+    (bool, int, int) -> function
+    Return a scenario that rebuilds a model from a recorded solution with
+    MoveSequence.generate_TOAHModel, recorded packed or as a list.
+    '''
+    model = TOAHModel(num_stools)
+    model.fill_first_stool(num_cheese)
+    four_stool_hanoi(model, num_cheese, 0, 1, 2, 3, False)
+    sequence = model.get_move_seq()
+    if (not packed):
+        sequence = MoveSequence(list(sequence))
+
+    def setup():
+        def run():
+            sequence.generate_TOAHModel(num_stools, num_cheese)
+            return sequence.length()
+        return run
+    return setup
+
+
+def _recursive_scenario(num_cheese, num_stools, lookups=1000):
+    '''
+    (int, int, int) -> function
+    Return a scenario that looks up lookups spread out moves of the
+    RecursiveMoveSequence solving a game with num_cheese cheeses and
+    num_stools stools.
+    '''
+    def setup():
+        sequence = recursive_solution(num_cheese, num_stools)
+        end = sequence.length()
+        indexes = [(i * 7919 * 7907) % end for i in range(lookups)]
+
+        def run():
+            get_move = sequence.get_move
+            for i in indexes:
+                get_move(i)
+            return lookups
+        return run
+    return setup
+
+
+def _seek_scenario(num_cheese, interval, seeks=100):
+    '''
+    (int, int, int) -> function
+    Return a scenario that seeks seeks times to spread out points of a
+    solved 3-stool game with num_cheese cheeses, keeping a checkpoint
+    every interval moves.
+    '''
+    def setup():
+        model = CompactTOAHModel(3, interval)
+        model.fill_first_stool(num_cheese)
+        three_stool_hanoi(model, num_cheese, 0, 1, 2, False)
+        end = model.number_of_moves()
+        positions = [(i * 7919 * 7907) % (end + 1) for i in range(seeks)]
+
+        def run():
+            for position in positions:
+                model.seek(position)
+            return seeks
+        return run
+    return setup
+
+
+def _render_scenario(num_cheese, num_stools, frames=10):
+    '''
+    (int, int, int) -> function
+    Return a scenario that renders frames frames of a model with __str__.
+    '''
+    def setup():
+        model = TOAHModel(num_stools)
+        model.fill_stools([size % num_stools for size in range(num_cheese)])
+
+        def run():
+            for i in range(frames):
+                str(model)
+            return frames
+        return run
+    return setup
+
+
+def _incremental_render_scenario(num_cheese, num_stools, moves=1000):
+    '''
+    (int, int, int) -> function
+    Return a scenario that makes the first moves moves of a solution on a
+    model followed by a TextRenderer, redrawing the changed rows after
+    each one.
+    '''
+    solution = list(islice(iter_moves(num_cheese, num_stools), moves))
+
+    def setup():
+        model = TOAHModel(num_stools)
+        model.fill_first_stool(num_cheese)
+        renderer = TextRenderer(model)
+        model.attach_observer(renderer)
+        renderer.render()
+        sink = io.StringIO()
+
+        def run():
+            move = model.move
+            for (src, dest) in solution:
+                move(src, dest)
+                renderer.redraw(sink)
+            return len(solution)
+        return run
+    return setup
+
+
+def _gui_startup_scenario(num_cheese):
+    '''
+    (int) -> function
+    Return a scenario that opens and closes a GUIController window with
+    num_cheese cheeses on 4 stools.
+    '''
+    def setup():
+        # Imported here, so that only the GUI scenarios need tkinter
+        from GUIController import GUIController
+
+        def run():
+            gui = GUIController(num_cheese, 4, 780, 440, 20)
+            gui.root.update()
+            gui.root.destroy()
+            return 1
+        return run
+    return setup
+
+
+def _gui_click_scenario(num_cheese, clicks=1000):
+    '''
+    (int, int) -> function
+    Return a scenario that clicks a cheese near the bottom of the tower of
+    a GUIController window with num_cheese cheeses clicks times, selecting
+    and unselecting its top cheese.
+    '''
+    def setup():
+        from GUIController import GUIController
+        gui = GUIController(num_cheese, 4, 780, 440, 20)
+        stool = gui.get_stool(0)
+        event = types.SimpleNamespace(x=stool.x_center,
+                                      y=stool.y_center - 20)
+
+        def run():
+            for i in range(clicks):
+                gui._canvas_clicked(event)
+            gui.root.update()
+            gui.root.destroy()
+            return clicks
+        return run
+    return setup
+
+
+def scenarios(quick: bool=False, gui: bool=False) -> list:
+    '''
+    (bool, bool) -> list of (str, str, function)
+    Return the standard scenario matrix as (name, unit, setup) triples.
+    Calling setup returns a function that runs the scenario once and
+    returns how many units it did. If quick, use smaller games. If gui,
+    add the GUIController scenarios, which need a display.
+    '''
+    three_sizes = (8, 12) if quick else (10, 14, 18)
+    four_sizes = (10, 20) if quick else (20, 40, 80)
+    location_sizes = (10, 100) if quick else (10, 100, 1000)
+    render_sizes = (10, 50) if quick else (10, 50, 200)
+    result = []
+    for cheeses in three_sizes:
+        result.append(('three_stool_hanoi/' + str(cheeses), 'moves',
+                       _solver_scenario(three_stool_hanoi, cheeses, 3)))
+    for cheeses in four_sizes:
+        result.append(('four_stool_hanoi/' + str(cheeses), 'moves',
+                       _solver_scenario(four_stool_hanoi, cheeses, 4)))
+    for model_class in (TOAHModel, CompactTOAHModel):
+        for cheeses in three_sizes:
+            result.append(('move/' + model_class.__name__ + '/' +
+                           str(cheeses), 'moves',
+                           _move_scenario(model_class, cheeses, 3)))
+            result.append(('apply_moves/' + model_class.__name__ + '/' +
+                           str(cheeses), 'moves',
+                           _apply_scenario(model_class, cheeses, 3)))
+        for cheeses in location_sizes:
+            result.append(('cheese_location/' + model_class.__name__ + '/' +
+                           str(cheeses), 'calls',
+                           _location_scenario(model_class, cheeses)))
+    for packed in (False, True):
+        for cheeses in four_sizes:
+            result.append(('generate_TOAHModel/' +
+                           ('packed' if packed else 'list') + '/' +
+                           str(cheeses), 'moves',
+                           _replay_scenario(packed, cheeses, 4)))
+    for cheeses in four_sizes:
+        result.append(('recursive_get_move/' + str(cheeses), 'lookups',
+                       _recursive_scenario(cheeses, 4)))
+    for interval in (64, 1024):
+        result.append(('seek/' + str(three_sizes[-1]) + '/' + str(interval),
+                       'seeks', _seek_scenario(three_sizes[-1], interval)))
+    for cheeses in render_sizes:
+        result.append(('__str__/' + str(cheeses), 'frames',
+                       _render_scenario(cheeses, 4)))
+        result.append(('TextRenderer/' + str(cheeses), 'moves',
+                       _incremental_render_scenario(cheeses, 4)))
+    if (gui):
+        for cheeses in ((10, 1000) if quick else (10, 1000, 5000)):
+            result.append(('gui_startup/' + str(cheeses), 'windows',
+                           _gui_startup_scenario(cheeses)))
+            result.append(('gui_click/' + str(cheeses), 'clicks',
+                           _gui_click_scenario(cheeses)))
+    return result
+
+
+def _percentile(values, fraction):
+    '''
+    (list of float, float) -> float
+    Return the nearest-rank percentile of values at fraction.
+    REQ: values != [] and 0 < fraction <= 1
+    '''
+    ordered = sorted(values)
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[rank - 1]
+
+
+def run_scenario(unit: str, setup, repeat: int=5) -> dict:
+    '''
+    (str, function, int) -> dict
+    Run the scenario made by setup repeat times, plus once more under
+    tracemalloc, and return its measurements.
+    REQ: repeat > 0
+    '''
+    times = []
+    count = 0
+    for i in range(repeat):
+        run = setup()
+        start_time = time.perf_counter()
+        count = run()
+        times.append(time.perf_counter() - start_time)
+    # Tracing slows everything down, so it gets a run of its own
+    run = setup()
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'unit': unit, 'count': count,
+            'per_second': count / max(min(times), 1e-9),
+            'p50_seconds': _percentile(times, 0.5),
+            'p90_seconds': _percentile(times, 0.9),
+            'p99_seconds': _percentile(times, 0.99),
+            'peak_bytes': peak}
+
+
+def run_benchmarks(repeat: int=5, quick: bool=False,
+                   only: str=None, gui: bool=False) -> dict:
+    '''
+    (int, bool, str, bool) -> dict
+    Run every scenario (only those whose name contains only, if given)
+    and return the results with a description of the machine. If gui, run
+    the GUIController scenarios too.
+    REQ: repeat > 0
+    '''
+    results = {}
+    for (name, unit, setup) in scenarios(quick, gui):
+        if (only is None or only in name):
+            results[name] = run_scenario(unit, setup, repeat)
+    return {'python': platform.python_version(),
+            'machine': platform.machine(), 'time': time.time(),
+            'scenarios': results}
+
+
+def compare(results: dict, baseline: dict,
+            tolerance: float=DEFAULT_TOLERANCE) -> list:
+    '''
+    (dict, dict, float) -> list of str
+    Return a description of every scenario in both results and baseline
+    that does more than tolerance fewer operations per second, or uses more
+    than tolerance more peak memory, in results than in baseline.
+    REQ: results and baseline were returned by run_benchmarks
+    '''
+    regressions = []
+    for (name, now) in sorted(results['scenarios'].items()):
+        before = baseline['scenarios'].get(name)
+        if (before is not None):
+            if (now['per_second'] < before['per_second'] * (1 - tolerance)):
+                regressions.append(
+                    name + ': ' + format(now['per_second'], '.0f') + ' ' +
+                    now['unit'] + '/s, was ' +
+                    format(before['per_second'], '.0f'))
+            if (now['peak_bytes'] > before['peak_bytes'] * (1 + tolerance)):
+                regressions.append(
+                    name + ': peak ' + str(now['peak_bytes']) +
+                    ' bytes, was ' + str(before['peak_bytes']))
+    return regressions
+
+
+def format_results(results: dict) -> str:
+    '''
+    (dict) -> str
+    Return the results of run_benchmarks as a table.
+    '''
+    lines = [format('scenario', '<40') + format('rate', '>22') +
+             format('p50 ms', '>10') + format('p99 ms', '>10') +
+             format('peak KiB', '>10')]
+    for (name, result) in sorted(results['scenarios'].items()):
+        lines.append(format(name, '<40') +
+                     format(format(result['per_second'], ',.0f') + ' ' +
+                            result['unit'] + '/s', '>22') +
+                     format(result['p50_seconds'] * 1000, '>10.2f') +
+                     format(result['p99_seconds'] * 1000, '>10.2f') +
+                     format(result['peak_bytes'] / 1024, '>10.1f'))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+    parser = argparse.ArgumentParser(description="Benchmark Towers of Anne "
+                                     "Hoy and compare with a baseline.")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--quick', action='store_true',
+                        help="use smaller games")
+    parser.add_argument('--only', default=None,
+                        help="only run scenarios whose name contains this")
+    parser.add_argument('--output', default=None,
+                        help="save the results as JSON here")
+    parser.add_argument('--baseline', default=None,
+                        help="compare with results saved here")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument('--gui', action='store_true',
+                        help="also time GUIController startup and clicks "
+                        "(needs a display)")
+    args = parser.parse_args()
+    results = run_benchmarks(args.repeat, args.quick, args.only, args.gui)
+    print(format_results(results))
+    if (args.output is not None):
+        with open(args.output, 'w') as out:
+            json.dump(results, out, indent=2, sort_keys=True)
+    if (args.baseline is not None):
+        with open(args.baseline) as saved:
+            regressions = compare(results, json.load(saved), args.tolerance)
+        for regression in regressions:
+            print('REGRESSION', regression)
+        if (regressions != []):
+            sys.exit(1)
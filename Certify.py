@@ -0,0 +1,390 @@
+"""
+Certify: Prove the least number of moves for the 4-stool Towers of Anne Hoy
+with an exhaustive breadth-first search, and compare it to
+Tour.tour_of_four_stools.
+
+certify: Return the least number of moves for a number of cheeses
+compare_with_tour: certify a range of cheese counts against the tour
+
+Configurations are packed two bits per cheese into unsigned 64-bit
+integers, the cheese of size i + 1 in bits 2i and 2i + 1. Stools 1 and 2
+are empty at the start and at the goal, so swapping them changes no
+distances and each configuration is stored as the one of the pair whose
+largest cheese off stools 0 and 3 is on stool 1.
+
+The search is bidirectional without searching twice: swapping stools 0 and
+3 turns the goal into the start, so the distance from a configuration to
+the goal is the distance from its mirror image to the start. After each
+level L of the search from the start, the least number of moves is 2L - 1
+if level L meets the mirror of level L - 1, or 2L if it meets its own
+mirror.
+
+Levels live on disk as sorted arrays. Each level is split into chunks that
+worker processes expand into sorted runs, and the runs are merged into the
+next level, leaving out the two levels before it (in an undirected graph a
+configuration's neighbours are in the level before, the same level, or the
+level after). Memory use is therefore bounded by the chunk size, and
+progress.json records the last finished level so a killed run can resume.
+
+Each cheese more costs about 3 to 5 times the time. Measured with one
+worker process: 13 cheeses take 9 s, 15 take 50 s, and 16 take about 4.5
+minutes, with about 2.9 million configurations (23 MB) in the widest
+level. From there, 20 cheeses would take somewhere between hours and days
+of CPU time, and levels of gigabytes, so about 16 is the practical reach
+of a single run; more workers divide the time by up to their number.
+"""
+
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from Tour import tour_of_four_stools
+from TOAHModel import TOAHModel
+import heapq
+import json
+import os
+import shutil
+import tempfile
+
+# States per chunk handed to a worker, and per block read from a file
+DEFAULT_CHUNK_SIZE = 1 << 20
+_BLOCK_SIZE = 1 << 16
+# Bits 0 of every two-bit group
+_LOW_BITS = int('01' * 32, 2)
+
+
+def _canonical(state, low_bits):
+    '''
+    (int, int) -> int
+    Return state with stools 1 and 2 swapped if its largest cheese on
+    either of them is on stool 2, else return state.
+    REQ: low_bits has bit 2i set for every cheese of size i + 1
+    '''
+    # A two-bit group is 1 or 2 exactly when its two bits differ
+    off = (state ^ (state >> 1)) & low_bits
+    if (off != 0 and (state >> (off.bit_length() - 1)) & 3 == 2):
+        state ^= off | (off << 1)
+    return state
+
+
+def _mirror(state, low_bits):
+    '''
+    (int, int) -> int
+    Return the canonical form of state with stools 0 and 3 swapped.
+    REQ: low_bits has bit 2i set for every cheese of size i + 1
+    '''
+    # Flipping every bit swaps 0 with 3 and 1 with 2, and swapping 1 with 2
+    # makes no difference to the canonical form
+    return _canonical(state ^ (low_bits | (low_bits << 1)), low_bits)
+
+
+def _read_blocks(path, offset=0, count=None):
+    '''
+    (str, int, int) -> generator of array
+    Yield the states in the file at path in blocks, starting at the
+    offset-th state and stopping after count states (or at the end).
+    '''
+    with open(path, 'rb') as states:
+        states.seek(offset * 8)
+        left = count
+        while (left is None or left > 0):
+            block = array('Q')
+            size = _BLOCK_SIZE if left is None else min(_BLOCK_SIZE, left)
+            data = states.read(size * 8)
+            block.frombytes(data)
+            if (len(block) == 0):
+                break
+            if (left is not None):
+                left -= len(block)
+            yield block
+
+
+def _read_states(path):
+    '''
+    (str) -> generator of int
+    Yield every state in the file at path, in order.
+    '''
+    for block in _read_blocks(path):
+        yield from block
+
+
+def _write_states(path, states):
+    '''
+    (str, iterable of int) -> int
+    Write states to the file at path and return how many there were.
+    '''
+    count = 0
+    block = array('Q')
+    with open(path, 'wb') as out:
+        for state in states:
+            block.append(state)
+            if (len(block) == _BLOCK_SIZE):
+                block.tofile(out)
+                count += len(block)
+                block = array('Q')
+        block.tofile(out)
+        count += len(block)
+    return count
+
+
+def _unique(states):
+    '''
+    (iterable of int) -> generator of int
+    Yield the sorted states without repeats.
+    '''
+    last = None
+    for state in states:
+        if (state != last):
+            yield state
+            last = state
+
+
+def _without(states, excluded):
+    '''
+    (iterable of int, iterable of int) -> generator of int
+    Yield the sorted states that aren't in the sorted excluded.
+    '''
+    excluded = iter(excluded)
+    other = next(excluded, None)
+    for state in states:
+        while (other is not None and other < state):
+            other = next(excluded, None)
+        if (other != state):
+            yield state
+
+
+def _meets(first, second):
+    '''
+    (iterable of int, iterable of int) -> bool
+    Return whether the sorted first and second share a state.
+    '''
+    second = iter(second)
+    other = next(second, None)
+    result = False
+    for state in first:
+        while (other is not None and other < state):
+            other = next(second, None)
+        if (other == state):
+            result = True
+            break
+    return result
+
+
+def _expand_chunk(job):
+    '''
+    (tuple) -> NoneType
+    Expand one chunk of a level in a worker: write the sorted successors
+    of its states to one run file and their sorted mirror images to
+    another.
+    '''
+    path, offset, count, num_cheese, run_path, mirror_path = job
+    low_bits = _LOW_BITS & ((1 << (2 * num_cheese)) - 1)
+    successors = []
+    mirrors = []
+    for block in _read_blocks(path, offset, count):
+        for state in block:
+            mirrors.append(_mirror(state, low_bits))
+            # The smallest cheese on each stool is its top one
+            tops = [-1, -1, -1, -1]
+            left = 4
+            size = 0
+            while (left > 0 and size < num_cheese):
+                stool = (state >> (2 * size)) & 3
+                if (tops[stool] < 0):
+                    tops[stool] = size
+                    left -= 1
+                size += 1
+            for src in range(4):
+                top = tops[src]
+                if (top >= 0):
+                    for dest in range(4):
+                        if (dest != src and
+                                (tops[dest] < 0 or tops[dest] > top)):
+                            successors.append(_canonical(
+                                state + ((dest - src) << (2 * top)),
+                                low_bits))
+    successors.sort()
+    mirrors.sort()
+    _write_states(run_path, _unique(successors))
+    _write_states(mirror_path, mirrors)
+
+
+def _level_path(work_dir, kind, level):
+    return os.path.join(work_dir, kind + '_' + str(level) + '.bin')
+
+
+def _remove_level(work_dir, level):
+    '''
+    (str, int) -> NoneType
+    Remove the files of level and its mirror from work_dir, if they are
+    still there.
+    '''
+    for kind in ('level', 'mirror'):
+        try:
+            os.remove(_level_path(work_dir, kind, level))
+        except FileNotFoundError:
+            pass
+
+
+def _write_progress(path, progress):
+    '''
+    (str, dict) -> NoneType
+    Replace the checkpoint at path with progress, all at once, and make
+    sure it is on disk before returning.
+    '''
+    with open(path + '.tmp', 'w') as checkpoint:
+        json.dump(progress, checkpoint)
+        checkpoint.flush()
+        os.fsync(checkpoint.fileno())
+    os.replace(path + '.tmp', path)
+
+
+def certify(num_cheese: int, work_dir: str=None, workers: int=None,
+            chunk_size: int=DEFAULT_CHUNK_SIZE, verbose: bool=False) -> int:
+    '''
+    (int, str, int, int, bool) -> int
+    Return the least number of moves that takes num_cheese cheeses from the
+    first of 4 stools to the last, found by exhaustive search.
+    The levels of the search are kept in work_dir (a temporary directory
+    that is removed afterwards by default); if work_dir holds a checkpoint
+    of the same search, the search resumes from it. Chunks of chunk_size
+    configurations are expanded by workers processes (one per CPU by
+    default). If verbose, print the size of each level.
+    REQ: 1 <= num_cheese <= 32
+    >>> certify(3, workers=1)
+    5
+    '''
+    if (workers is None):
+        workers = os.cpu_count() or 1
+    temporary = work_dir is None
+    if (temporary):
+        work_dir = tempfile.mkdtemp(prefix='toah_certify_')
+    os.makedirs(work_dir, exist_ok=True)
+    low_bits = _LOW_BITS & ((1 << (2 * num_cheese)) - 1)
+    progress_path = os.path.join(work_dir, 'progress.json')
+    # Resume from the last finished level, or start with level 0 and its
+    # mirror
+    progress = None
+    if (os.path.exists(progress_path)):
+        with open(progress_path) as checkpoint:
+            progress = json.load(checkpoint)
+        if (progress['cheeses'] != num_cheese):
+            progress = None
+        else:
+            # A run killed after its last checkpoint may have left the
+            # level before the last two behind
+            _remove_level(work_dir, progress['level'] - 2)
+    if (progress is None):
+        progress = {'cheeses': num_cheese, 'level': 0, 'sizes': [1],
+                    'moves': None}
+        _write_states(_level_path(work_dir, 'level', 0), [0])
+        _write_states(_level_path(work_dir, 'mirror', 0),
+                      [_mirror(0, low_bits)])
+    pool = None
+    if (workers > 1):
+        pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        while (progress['moves'] is None):
+            level = progress['level']
+            current = _level_path(work_dir, 'level', level)
+            size = progress['sizes'][level]
+            # Expand the current level chunk by chunk, writing sorted runs
+            jobs = []
+            for (j, offset) in enumerate(range(0, size, chunk_size)):
+                jobs.append((current, offset, min(chunk_size, size - offset),
+                             num_cheese,
+                             _level_path(work_dir, 'run', j),
+                             _level_path(work_dir, 'runmirror', j)))
+            if (pool is None):
+                for job in jobs:
+                    _expand_chunk(job)
+            else:
+                list(pool.map(_expand_chunk, jobs))
+            # Merge the runs into the next level, without the current level
+            # and the one before it
+            runs = heapq.merge(*[_read_states(job[4]) for job in jobs])
+            excluded = [_read_states(current)]
+            if (level > 0):
+                excluded.append(_read_states(
+                    _level_path(work_dir, 'level', level - 1)))
+            next_size = _write_states(
+                _level_path(work_dir, 'level', level + 1),
+                _without(_unique(runs), heapq.merge(*excluded)))
+            # The current level's mirror is made by the same workers
+            if (level > 0):
+                _write_states(_level_path(work_dir, 'mirror', level),
+                              heapq.merge(*[_read_states(job[5])
+                                            for job in jobs]))
+            for job in jobs:
+                os.remove(job[4])
+                os.remove(job[5])
+            # Does the current level meet the mirror of the one before it,
+            # or its own mirror?
+            moves = None
+            if (level > 0 and _meets(
+                    _read_states(current),
+                    _read_states(_level_path(work_dir, 'mirror',
+                                             level - 1)))):
+                moves = 2 * level - 1
+            elif (_meets(_read_states(current),
+                         _read_states(_level_path(work_dir, 'mirror',
+                                                  level)))):
+                moves = 2 * level
+            if (verbose):
+                print('level', level, 'has', size, 'configurations')
+            # Record the finished level before moving on
+            progress['level'] = level + 1
+            progress['sizes'].append(next_size)
+            progress['moves'] = moves
+            _write_progress(progress_path, progress)
+            # Only the last two levels and mirrors are needed from now on,
+            # and the checkpoint no longer names the one before them
+            if (level > 0):
+                _remove_level(work_dir, level - 1)
+    finally:
+        if (pool is not None):
+            pool.shutdown()
+    if (temporary):
+        shutil.rmtree(work_dir)
+    return progress['moves']
+
+
+def compare_with_tour(cheese_counts, work_dir: str=None, workers: int=None,
+                      chunk_size: int=DEFAULT_CHUNK_SIZE) -> list:
+    '''
+    (iterable of int, str, int, int) -> list of (int, int, int)
+    Return (cheeses, least number of moves, moves made by
+    tour_of_four_stools) for every number of cheeses in cheese_counts.
+    Each search keeps its checkpoints in a subdirectory of work_dir, if
+    given.
+    REQ: 1 <= each count <= 32
+    '''
+    result = []
+    for cheeses in cheese_counts:
+        model = TOAHModel(4)
+        model.fill_first_stool(cheeses)
+        tour_of_four_stools(model, console_animate=False)
+        directory = None
+        if (work_dir is not None):
+            directory = os.path.join(work_dir, str(cheeses))
+        result.append((cheeses, certify(cheeses, directory, workers,
+                                        chunk_size),
+                       model.number_of_moves()))
+    return result
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Certify the least number of moves for 4 stools.")
+    parser.add_argument('cheeses', type=int, nargs='+',
+                        help="numbers of cheeses to certify (16 takes "
+                        "minutes, and each one more several times longer)")
+    parser.add_argument('--work-dir', default=None,
+                        help="keep levels and checkpoints here to resume")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+    for (cheeses, least, tour) in compare_with_tour(
+            args.cheeses, args.work_dir, args.workers, args.chunk_size):
+        print(cheeses, 'cheeses:', least, 'moves certified,',
+              tour, 'moves by tour_of_four_stools',
+              '(optimal)' if least == tour else '(NOT optimal)')
@@ -0,0 +1,167 @@
+"""
+ConsoleAnimator: Show the moves made on a TOAHModel in the console, paced
+and at a bounded frame rate.
+
+ConsoleAnimator: MoveObserver that times the moves and draws the frames
+
+Attach it to a model before solving, and call finish when done:
+
+    >>> from TOAHModel import TOAHModel
+    >>> import io
+    >>> model = TOAHModel(3)
+    >>> model.fill_first_stool(1)
+    >>> out = io.StringIO()
+    >>> animator = ConsoleAnimator(0, output=out)
+    >>> model.attach_observer(animator)
+    >>> model.move(0, 2)
+    >>> animator.finish(model)
+    >>> model.detach_observer(animator)
+    >>> animator.frames_drawn()
+    1
+
+Move i (counting from 0) is shown delay_btw_moves * i seconds after the
+first, holding up the solver until then, so the delays never add up to
+more than asked for. A frame is drawn when a move is shown unless one was
+drawn less than a frame interval before, so moves arriving faster than the
+frame rate skip frames instead of flooding the console. Frames are drawn by
+a TextRenderer that follows every move; on a terminal each frame after the
+first only rewrites the rows that changed, in place.
+"""
+
+from MoveMetrics import MoveObserver
+from TextRenderer import TextRenderer
+import sys
+import time
+
+# Frames per second drawn at most, by default
+DEFAULT_FPS = 30
+
+
+class ConsoleAnimator(MoveObserver):
+    """Draws a model to the console as moves are made on it, showing
+    them delay_btw_moves seconds apart and drawing at most fps frames a
+    second.
+    """
+
+    def __init__(self: 'ConsoleAnimator', delay_btw_moves: float=0.5,
+                 fps: float=DEFAULT_FPS, output=None, in_place: bool=None):
+        '''
+        (ConsoleAnimator, float, float, file, bool) -> NoneType
+        Create an animator showing moves delay_btw_moves seconds apart in
+        frames written to output (standard output by default), at most fps
+        of them a second. If in_place (by default, if output is a
+        terminal), redraw each frame over the one before.
+        REQ: delay_btw_moves >= 0 and fps > 0
+        '''
+        # REPRESENTATION INVARIANT
+        # self._delay is the time between moves, and self._interval the
+        # least time between frames, in seconds
+        # self._start is time.perf_counter() at the first move, or None
+        # before it
+        # self._moves is the number of moves shown
+        # self._last_frame is time.perf_counter() at the latest frame, or
+        # None before it
+        # self._pending is whether a move was shown without a frame
+        # self._drawn and self._skipped count the frames drawn and the
+        # moves that didn't get one
+        # self._renderer is a TextRenderer following the moves since the
+        # first, or None before it
+        # self._in_place is whether frames after the first are redrawn
+        # over the one before
+        self._delay = delay_btw_moves
+        self._interval = 1 / fps
+        self._output = output
+        self._start = None
+        self._moves = 0
+        self._last_frame = None
+        self._pending = False
+        self._drawn = 0
+        self._skipped = 0
+        self._renderer = None
+        if (in_place is None):
+            in_place = (output or sys.stdout).isatty()
+        self._in_place = in_place
+
+    def moved(self: 'ConsoleAnimator', model, curr_stool: int,
+              dest_stool: int, check_ns: int, apply_ns: int):
+        now = time.perf_counter()
+        if (self._start is None):
+            self._start = now
+            self._renderer = TextRenderer(model)
+        else:
+            self._renderer.moved(model, curr_stool, dest_stool, check_ns,
+                                 apply_ns)
+        # Wait for this move's time, counted from the first move so that
+        # the time spent solving and drawing doesn't add up
+        due = self._start + self._moves * self._delay
+        if (now < due):
+            time.sleep(due - now)
+            now = time.perf_counter()
+        self._moves += 1
+        if (self._last_frame is None or
+                now - self._last_frame >= self._interval):
+            self.draw(model)
+            self._last_frame = now
+        else:
+            self._pending = True
+            self._skipped += 1
+
+    def draw(self: 'ConsoleAnimator', model):
+        '''
+        (ConsoleAnimator, TOAHModel) -> NoneType
+        Draw a frame of model.
+        '''
+        output = self._output or sys.stdout
+        if (self._renderer is None):
+            self._renderer = TextRenderer(model)
+        if (self._in_place and self._drawn > 0):
+            self._renderer.redraw(output)
+        else:
+            output.write(self._renderer.render() + '\n')
+        self._pending = False
+        self._drawn += 1
+
+    def finish(self: 'ConsoleAnimator', model):
+        '''
+        (ConsoleAnimator, TOAHModel) -> NoneType
+        Draw the final state of model if the last move skipped its frame.
+        '''
+        if (self._pending):
+            # The last move skipped its frame
+            self._skipped -= 1
+            self.draw(model)
+            self._last_frame = time.perf_counter()
+        output = self._output or sys.stdout
+        output.flush()
+
+    def frames_drawn(self: 'ConsoleAnimator') -> int:
+        return self._drawn
+
+    def frames_skipped(self: 'ConsoleAnimator') -> int:
+        return self._skipped
+
+
+def animate(model, moves, delay_btw_moves: float=0.5, fps: float=DEFAULT_FPS,
+            output=None, in_place: bool=None) -> ConsoleAnimator:
+    '''
+    (TOAHModel, iterable of (int, int), float, float, file, bool) ->
+        ConsoleAnimator
+    Make every move in moves on model, animating them with a
+    ConsoleAnimator, and return the animator.
+    REQ: every move is legal in model
+    '''
+    animator = ConsoleAnimator(delay_btw_moves, fps, output, in_place)
+    model.attach_observer(animator)
+    try:
+        move = model.move
+        for (src, dest) in moves:
+            move(src, dest)
+        animator.finish(model)
+    finally:
+        model.detach_observer(animator)
+    return animator
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod(verbose=True)
@@ -1,15 +1,32 @@
 """
 ConsoleController: User interface for manually solving Anne Hoy's problems
-from the console.
+from the console, or for playing a stream of moves from a file or a pipe.
 
 move: Apply one move to the given model, and print any error message
 to the console.
+
+To play moves as fast as they come, one "<from> <to>" pair a line or as a
+move log (see MoveLog), printing only the final state:
+
+    cat moves.txt | python ConsoleController.py --batch - --cheeses 20
+    python MoveLog.py solution.toahlog 20 4
+    python ConsoleController.py --batch solution.toahlog --binary --every 1000
 """
 
 from TOAHModel import TOAHModel, Cheese, IllegalMoveError
-import tkinter as TI
+from Hint import next_move
+from TOAHSearch import SearchLimitError
+from MoveMetrics import MoveMetrics
+from TextRenderer import TextRenderer
+from Snapshot import save_snapshot, load_snapshot
+from itertools import islice
+import shutil
+import sys
 import time
 
+# The most stools whose moves play_batch looks up instead of parsing
+_LOOKUP_STOOLS = 64
+
 
 def move(model: TOAHModel, origin: int, dest: int):
     '''
@@ -46,11 +63,33 @@ class ConsoleController:
         # self._number_of_stools is an integer which represents the number
         # of stools in the game
         # self._model is a TOAHModel, which represents the game as a whole
+        # self._metrics is a MoveMetrics attached to self._model
+        # self._renderer is a TextRenderer attached to self._model
+        # self._in_place is whether the game is played on a terminal, where
+        # the picture of the game can be redrawn over the last one
+        # self._lines_after is the number of lines on the terminal after
+        # the last picture of the game, or None before the first one
+        self._in_place = sys.stdin.isatty() and sys.stdout.isatty()
+        self._new_game(number_of_cheeses, number_of_stools)
+
+    def _new_game(self: 'ConsoleController', number_of_cheeses: int,
+                  number_of_stools: int):
+        '''
+        (ConsoleController, int, int) -> NoneType
+        Start a game with number_of_cheeses cheeses on the first of
+        number_of_stools stools.
+        REQ: number_of_cheeses > 0 and number_of_stools > 0
+        '''
         self._number_of_cheeses = number_of_cheeses
         self._number_of_stools = number_of_stools
         self._model = TOAHModel(self._number_of_stools)
         # Fill the first stool with the amount of cheese entered
         self._model.fill_first_stool(self._number_of_cheeses)
+        self._metrics = MoveMetrics()
+        self._model.attach_observer(self._metrics)
+        self._renderer = TextRenderer(self._model)
+        self._model.attach_observer(self._renderer)
+        self._lines_after = None
 
     def play_loop(self: 'ConsoleController'):
         '''
@@ -76,40 +115,311 @@ class ConsoleController:
         print("To move a cheese from the nth stool, enter 'n-1'")
         print("You may only stack smaller cheeses on top of eachother")
         print("To exit the game, type 'END' at any time.")
+        print("For a hint about the best next move, type 'HINT'.")
+        print("For statistics about your moves, type 'STATS'.")
+        print("To take back a move, type 'UNDO', and 'REDO' to make it again.")
+        print("To save the game, type 'SAVE <file>', and 'LOAD <file>' to "
+              "load it.")
         # Create a while loop to await user input
         while(exit is False):
             # Get the stool index from the user to move the first cheese
-            print("<Enter a stool index to move its' top cheese>")
-            origin = input()
+            self._say("<Enter a stool index to move its' top cheese>")
+            origin = self._read()
             # If the input was "END", then end the game
             if origin == "END":
                 exit = True
-            # Otherwise continue
+            # If the input was "HINT", then suggest a move and ask again
+            elif origin == "HINT":
+                self.print_hint()
+            # If the input was "STATS", then show the metrics and ask again
+            elif origin == "STATS":
+                self._say(str(self._metrics))
+            # If the input was "UNDO" or "REDO", then go back or forward a
+            # move and show the game
+            elif origin == "UNDO" or origin == "REDO":
+                self.undo(origin == "REDO")
+            # If the input was "SAVE <file>" or "LOAD <file>", then save or
+            # load the game
+            elif origin.startswith("SAVE "):
+                self.save_game(origin[5:].strip())
+            elif origin.startswith("LOAD "):
+                self.load_game(origin[5:].strip())
+            # Otherwise continue, telling the user what was wrong with
+            # the input instead of stopping the game
+            else:
+                try:
+                    exit = self._play_move(origin)
+                except ValueError:
+                    self._say("Please enter a stool index, or one of the "
+                              "commands above.")
+                except IllegalMoveError as error:
+                    self._say(str(error))
+
+    def _read(self: 'ConsoleController') -> str:
+        '''
+        (ConsoleController) -> str
+        Return the next line the user enters, without surrounding spaces,
+        or "END" if there are no more.
+        REQ: None
+        '''
+        try:
+            result = input().strip()
+        except EOFError:
+            result = "END"
+        else:
+            # The terminal echoes the line
+            if (self._lines_after is not None):
+                self._lines_after += 1
+        return result
+
+    def _say(self: 'ConsoleController', text: str):
+        '''
+        (ConsoleController, str) -> NoneType
+        Print text, keeping count of the lines after the picture of the
+        game.
+        REQ: None
+        '''
+        print(text)
+        if (self._lines_after is not None):
+            self._lines_after += text.count("\n") + 1
+
+    def _show(self: 'ConsoleController'):
+        '''
+        (ConsoleController) -> NoneType
+        Show the game: on a terminal that still shows the last picture
+        whole, redraw only the rows changed since, erasing the lines after
+        it, and otherwise print the whole picture.
+        REQ: None
+        '''
+        size = shutil.get_terminal_size()
+        width = self._number_of_stools * (2 * self._number_of_cheeses + 3)
+        if (self._in_place and self._lines_after is not None and
+                self._number_of_cheeses + 1 + self._lines_after < size.lines
+                and width < size.columns):
+            self._renderer.redraw(sys.stdout, self._lines_after)
+        else:
+            print(self._renderer.render())
+        self._lines_after = 0
+
+    def _play_move(self: 'ConsoleController', origin: str) -> bool:
+        '''
+        (ConsoleController, str) -> bool
+        Ask for the stool to move the top cheese of stool origin to, make
+        the move and print the game. Return whether the user ended the
+        game instead.
+        REQ: None
+        '''
+        # Check if the user entered a valid stool index
+        if (int(origin) < 0 or
+                int(origin) >= self._model.number_of_stools()):
+            raise IllegalMoveError("Given stool does not exist.")
+        # Get the stool index for the destination of the cheese
+        self._say("<Enter a stool index to place the cheese on>")
+        destination = self._read()
+        # Again, check if the user wants to end
+        if destination == "END":
+            return True
+        # Check if the user entered a valid stool index
+        if (int(destination) < 0 or
+                int(destination) >= self._model.number_of_stools()):
+            raise IllegalMoveError("Given stool does not exist.")
+        # Call the move method
+        move(self._model, int(origin), int(destination))
+        # Show the state of the game, only redoing the rows the move
+        # changed if it can
+        self._show()
+        return False
+
+    def play_batch(self: 'ConsoleController', source, binary: bool=False,
+                   every: int=None, output=None, errors=None) -> int:
+        '''
+        (ConsoleController, file, bool, int, file, file) -> int
+        Make the moves read from source without asking for anything: one
+        "<from> <to>" pair a line (blank lines and lines starting with #
+        are skipped), or if binary, a move log as MoveLog writes it, which
+        starts a new game if it is of a game with other numbers of cheeses
+        or stools. Print the game to output (standard output by default)
+        every every moves read, and after the last one. Report each move
+        that can't be made to errors (standard error by default) with its
+        line number, or its number in a move log, and go on with the next
+        one. Return the number of moves that couldn't be made.
+        REQ: source is open in binary mode if binary, and in text mode if not
+        REQ: every is None or every > 0
+        '''
+        output = output or sys.stdout
+        errors = errors or sys.stderr
+        failed = 0
+
+        def report(number, message):
+            nonlocal failed
+            failed += 1
+            errors.write(where + str(number) + ": " + message + "\n")
+        if (binary):
+            # Imported here, since MoveLog needs Tour, which imports this
+            from MoveLog import read_moves
+            (number_of_stools, number_of_cheeses, moves) = read_moves(source)
+            if (number_of_stools != self._number_of_stools or
+                    number_of_cheeses != self._number_of_cheeses):
+                self._new_game(number_of_cheeses, number_of_stools)
+            moves = enumerate(moves, 1)
+            where = "move "
+        else:
+            moves = self._text_moves(source, report)
+            where = "line "
+        # The observers would cost more than the moves, so they are left
+        # out, and the picture is redone for each frame instead
+        self._model.detach_observer(self._metrics)
+        self._model.detach_observer(self._renderer)
+        model_move = self._model.move
+        start_time = time.perf_counter()
+        made = 0
+        try:
+            while (True):
+                read = 0
+                for (number, (curr_stool, dest_stool)) in islice(moves, every):
+                    read += 1
+                    try:
+                        model_move(curr_stool, dest_stool)
+                    except IllegalMoveError as error:
+                        report(number, str(error))
+                made += read
+                # Don't draw the last frame twice
+                if (read == 0 and made > 0):
+                    break
+                self._renderer.sync(self._model)
+                output.write(self._renderer.render() + "\n")
+                if (every is None or read < every):
+                    break
+        finally:
+            self._model.attach_observer(self._metrics)
+            self._model.attach_observer(self._renderer)
+        seconds = time.perf_counter() - start_time
+        errors.write(str(made) + " moves read in " + format(seconds, '.2f') +
+                     " s, " + str(failed) + " errors\n")
+        return failed
+
+    def _text_moves(self: 'ConsoleController', lines, report):
+        '''
+        (ConsoleController, iterable of str, function) ->
+            generator of (int, (int, int))
+        Yield the line number and the move of every line of lines holding
+        one, and call report with the line number and a message for the
+        lines holding something else.
+        '''
+        # Lines written the usual way, like "0 2\n", are looked up rather
+        # than parsed
+        stools = range(min(self._number_of_stools, _LOOKUP_STOOLS))
+        usual = {str(src) + " " + str(dest) + "\n": (src, dest)
+                 for src in stools for dest in stools}
+        for (number, line) in enumerate(lines, 1):
+            move = usual.get(line)
+            if (move is not None):
+                yield (number, move)
+                continue
+            words = line.split()
+            if (len(words) == 2 and words[0].isdigit() and
+                    words[1].isdigit()):
+                yield (number, (int(words[0]), int(words[1])))
+            elif (words != [] and not words[0].startswith("#")):
+                report(number, "Expected two stool indexes, got " +
+                       repr(line.strip()))
+
+    def undo(self: 'ConsoleController', redo: bool=False):
+        '''
+        (ConsoleController, bool) -> NoneType
+        Take back the last move, or make the last move taken back again if
+        redo, and print the game, or why it can't be done.
+        REQ: None
+        '''
+        try:
+            if (redo):
+                self._model.redo()
             else:
-                # Check if the user entered a valid stool index
-                if (int(origin) < 0 or
-                        int(origin) >= self._model.number_of_stools()):
-                    raise IllegalMoveError("Given stool does not exist.")
-                # Get the stool index for the destination of the cheese
-                print ("<Enter a stool index to place the cheese on>")
-                destination = input()
-                # Again, check if the user wants to end
-                if destination == "END":
-                    exit = True
-                # If not, then continue the game
-                else:
-                    # Check if the user entered a valid stool index
-                    if (int(destination) < 0 or
-                            int(
-                            destination) >= self._model.number_of_stools()):
-                        raise IllegalMoveError("Given stool does not exit.")
-                    # Call the move method
-                    move(self._model, int(origin), int(destination))
-                    # Print the state of the game
-                    print(self._model)
+                self._model.undo()
+        except IllegalMoveError as error:
+            self._say(str(error))
+        else:
+            # The renderer only follows moves, so draw the game again
+            self._renderer.sync(self._model)
+            self._show()
+
+    def save_game(self: 'ConsoleController', path: str):
+        '''
+        (ConsoleController, str) -> NoneType
+        Save the game, with its moves, to a snapshot file at path (see
+        Snapshot), and print why if it can't be.
+        REQ: None
+        '''
+        try:
+            save_snapshot(self._model, path)
+        except OSError as error:
+            self._say(str(error))
+        else:
+            self._say("Saved the game to " + path)
+
+    def load_game(self: 'ConsoleController', path: str):
+        '''
+        (ConsoleController, str) -> NoneType
+        Load the game saved at path by save_game and print it, or print why
+        it can't be loaded.
+        REQ: None
+        '''
+        try:
+            load_snapshot(path, self._model)
+        except (OSError, ValueError) as error:
+            self._say(str(error))
+        else:
+            self._renderer.sync(self._model)
+            self._show()
+
+    def print_hint(self: 'ConsoleController'):
+        '''
+        (ConsoleController) -> NoneType
+        Print the next move of a shortest way to put every cheese on the
+        last stool, or say that there is none if finding it would take too
+        much search.
+        REQ: None
+        '''
+        try:
+            hint = next_move(self._model)
+        except SearchLimitError:
+            self._say("No hint is available for a game this big.")
+        else:
+            if (hint is None):
+                self._say("Every cheese is already on the last stool.")
+            else:
+                self._say("Hint: move the top cheese of stool " +
+                          str(hint[0]) + " to stool " + str(hint[1]))
 
 
 if __name__ == '__main__':
-    # Initiate gameplay
-    game = ConsoleController(3, 3)
-    game.play_loop()
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Play Towers of Anne Hoy in the console.")
+    parser.add_argument('--cheeses', type=int, default=3)
+    parser.add_argument('--stools', type=int, default=3)
+    parser.add_argument('--batch', default=None, metavar='FILE',
+                        help="make the moves in FILE ('-' for standard "
+                        "input) instead of asking for them")
+    parser.add_argument('--binary', action='store_true',
+                        help="the moves are a move log, not text; its "
+                        "game replaces --cheeses and --stools")
+    parser.add_argument('--every', type=int, default=None, metavar='N',
+                        help="print the game every N moves, not only at "
+                        "the end")
+    args = parser.parse_args()
+    game = ConsoleController(args.cheeses, args.stools)
+    if (args.batch is None):
+        # Initiate gameplay
+        game.play_loop()
+    else:
+        try:
+            if (args.batch == '-'):
+                source = sys.stdin.buffer if args.binary else sys.stdin
+            else:
+                source = open(args.batch, 'rb' if args.binary else 'r')
+            with source:
+                failed = game.play_batch(source, args.binary, args.every)
+        except (OSError, ValueError) as error:
+            sys.exit(error)
+        sys.exit(1 if failed else 0)
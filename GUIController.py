@@ -1,21 +1,42 @@
 """
-GUIController: GUI window for manually solving Anne Hoy's problems.
+GUIController: GUI window for manually solving Anne Hoy's problems, and
+for playing solutions back.
 """
 
 
-from TOAHModel import TOAHModel, IllegalMoveError
-from GUIViewables import CheeseView, PlatformView, StoolView
+from TOAHModel import TOAHModel, IllegalMoveError, MoveSequence
+from GUIViewables import CheeseView, PlatformView, StoolView, BandedStackView
+from Hint import next_move
+from TOAHSearch import SearchLimitError
+from MoveMetrics import MoveMetrics
+from Snapshot import save_snapshot, load_snapshot
 import tkinter as TI
+import tkinter.filedialog
+import math
 import time
 import sys
 
+# Moves per second played back by default
+DEFAULT_SPEED = 4
+# Milliseconds between playback frames, and between blinks of a cheese
+# moved illegally
+_FRAME_MS = 33
+_BLINK_MS = 100
+# Times a cheese moved illegally changes colour
+_BLINKS = 10
+# Towers of this many cheeses or more are drawn in bands by default
+LARGE_TOWER = 100
+# The most configurations a hint may search, so that it keeps the window
+# waiting for well under a second
+_HINT_MAX_STATES = 20000
+
 
 class GUIController:
 
     def __init__(self: 'GUIController',
                  number_of_cheeses: int, number_of_stools: int,
                  content_width: float, content_height: float,
-                 cheese_scale: float):
+                 cheese_scale: float, large: bool=None):
         """
         Initialize a new GUIView.
 
@@ -26,37 +47,105 @@ class GUIController:
         content_height - height in pixels of the working area
         cheese_scale - height in pixels for showing cheese thicknesses,
                        and to scale cheese diameters
+        large - whether to shrink the cheeses to fit the working area and
+                draw them in bands (see GUIViewables.BandedStackView);
+                by default, if there are LARGE_TOWER cheeses or more
         """
 
+        # self._heights[s] is the number of cheeses on stool s
+        # self._origin_index is the index of the stool whose top cheese is
+        # selected to move, or None
+        # self._thickness and self._unit_width are the height of a cheese
+        # and the width of a cheese of size 1, in pixels
+        # self._bands is None if every cheese is a CheeseView; otherwise
+        # self._bands[s] is the BandedStackView of stool s
+        # While a playback is loaded, self._playback_moves is the
+        # MoveSequence played back, or the list of moves taken so far from
+        # self._playback_source, an iterator; self._playback_position is the
+        # number of moves played; self._playback_due is the part of a move
+        # due at self._playback_time; self._paused is whether it is paused.
+        # Otherwise self._playback_moves is None.
+        # self._frame_job is the id of the next scheduled playback frame,
+        # or None
         self._model = TOAHModel(number_of_stools)
+        self._metrics = MoveMetrics()
+        self._model.attach_observer(self._metrics)
         self._stools = []
-        self._cheese_to_move = None
+        self._heights = [number_of_cheeses] + [0] * (number_of_stools - 1)
+        self._origin_index = None
         self._blinking = False
+        self._playback_moves = None
+        self._playback_source = None
+        self._playback_position = 0
+        self._playback_due = 0.0
+        self._playback_time = 0.0
+        self._paused = False
+        self._speed = DEFAULT_SPEED
+        self._frame_job = None
+        self._controls = None
         self._number_of_stools = number_of_stools
         self.cheese_scale = cheese_scale
+        if large is None:
+            large = number_of_cheeses >= LARGE_TOWER
+        self._thickness = cheese_scale
+        self._unit_width = cheese_scale
+        if large:
+            # Shrink the cheeses so the tower and the stools fit
+            self._thickness = min(cheese_scale, (content_height -
+                                                 cheese_scale) /
+                                  max(number_of_cheeses, 1))
+            self._unit_width = min(cheese_scale, content_width /
+                                   ((number_of_stools + 1.0) *
+                                    (number_of_cheeses + 1)))
 
         self.root = TI.Tk()
         canvas = TI.Canvas(self.root,
                            background="blue",
                            width=content_width, height=content_height)
         canvas.pack(expand=True, fill=TI.BOTH)
+        # One handler for the whole canvas works out what was clicked from
+        # the coordinates, rather than a binding on every rectangle
+        canvas.bind('<ButtonRelease>', self._canvas_clicked)
+        self._canvas = canvas
 
         self.moves_label = TI.Label(self.root)
         self.show_number_of_moves()
         self.moves_label.pack()
+        self.hint_button = TI.Button(self.root, text='Hint',
+                                     command=self.show_hint)
+        self.hint_button.pack()
+        TI.Button(self.root, text='Save', command=self._ask_save).pack()
+        TI.Button(self.root, text='Load', command=self._ask_load).pack()
         # the dimensions of a stool are the same as a cheese that's
         # one size bigger than the biggest of the number_of_cheeses cheeses.
+        self._stool_width = self._unit_width * (number_of_cheeses + 1)
         for stool_ind in range(number_of_stools):
-            width = self.cheese_scale * (number_of_cheeses + 1)
             x_cent = content_width * (stool_ind + 1) / (number_of_stools + 1.0)
             y_cent = content_height - cheese_scale / 2
-            stool = StoolView(width,
-                              lambda s: self.stoolClicked(s),
+            stool = StoolView(self._stool_width,
+                              None,
                               canvas,
                               self.cheese_scale,
                               x_cent,
                               y_cent)
             self._stools.append(stool)
+        self._column_width = content_width / (number_of_stools + 1.0)
+        self._base_top = content_height - cheese_scale
+
+        self._bands = None
+        if large:
+            # Bands at least a pixel tall, so there are at most about as
+            # many rectangles per stool as the canvas is high
+            band = max(1, math.ceil(1 / self._thickness))
+            self._bands = [BandedStackView(canvas, stool.x_center,
+                                           self._base_top, self._unit_width,
+                                           self._thickness, band,
+                                           number_of_cheeses)
+                           for stool in self._stools]
+            self._model.fill_first_stool(number_of_cheeses)
+            for band_index in range(-(-number_of_cheeses // band)):
+                self._draw_band(0, band_index)
+            return
 
         # Can't use self._model.fill_first_stool because we need to
         # use CheeseView objects instead of just Cheese objects.
@@ -68,7 +157,7 @@ class GUIController:
             y_cent = content_height - cheese_scale / 2 - total_size
             cheese = CheeseView(size,
                                 width,
-                                lambda c: self.cheeseClicked(c),
+                                None,
                                 canvas,
                                 self.cheese_scale,
                                 x_cent,
@@ -76,13 +165,44 @@ class GUIController:
             self._model.add(0, cheese)
             total_size += self.cheese_scale
 
+    def locate(self: 'GUIController', x: float, y: float) -> tuple:
+        """Return (index of the stool, height) under the point (x, y) of
+        the canvas, where height is -1 on the stool itself and may be past
+        the top of the stool's cheeses, or None if no stool is under it.
+        Takes O(1) time.
+        """
+        result = None
+        stool_index = round(x / self._column_width) - 1
+        if (0 <= stool_index < self._number_of_stools and
+                abs(x - self._stools[stool_index].x_center) <=
+                self._stool_width / 2):
+            height = -1
+            if y < self._base_top:
+                height = int((self._base_top - y) / self._thickness)
+            result = (stool_index, height)
+        return result
+
+    def _canvas_clicked(self: 'GUIController', event):
+        """React to a click on the canvas: if it is on a cheese, as if the
+        cheese was clicked, and if it is on a stool or above its cheeses,
+        as if the stool was clicked."""
+        where = self.locate(event.x, event.y)
+        if (where is not None and not self._blinking and
+                self._playback_moves is None):
+            (stool_index, height) = where
+            if 0 <= height < self._heights[stool_index]:
+                self._select_on_stool(stool_index)
+            elif (self._origin_index is not None and
+                    self._origin_index != stool_index):
+                self._move_selected(stool_index)
+
     def cheeseClicked(self: 'GUIController', cheese: 'CheeseView'):
         """React to cheese being clicked: if not in the middle of blinking
            then select cheese for moving, or for moving onto.
 
            cheese - clicked cheese
         """
-        if not self._blinking:
+        if not self._blinking and self._playback_moves is None:
             self.select_cheese(cheese)
 
     def stoolClicked(self: 'GUIController', stool: 'StoolView'):
@@ -91,7 +211,7 @@ class GUIController:
 
         cheese - clicked cheese
         """
-        if not self._blinking:
+        if not self._blinking and self._playback_moves is None:
             self.select_stool(stool)
 
     def select_cheese(self: 'GUIController', cheese: CheeseView):
@@ -101,80 +221,383 @@ class GUIController:
         top of clicked_cheese's stool (which may be clicked_cheese
         itself) and highlight it.
         If selected_cheese is already highlighted, then unhighlight it.
-        Otherwise try to move self._cheese_to_move onto the stool that
+        Otherwise try to move the selected cheese onto the stool that
         clicked_cheese is on.
         """
-        stool = self._stools[self._model.cheese_location(cheese)]
-        stool_index = self.stool_index(stool)
-        cheese = self._model.top_cheese(stool_index)
-        # print(stool, stool_index, cheese)
-        if self._cheese_to_move is None:
-            self._cheese_to_move = cheese
-            self._cheese_to_move.highlight(True)
-            self.root.update()
-        elif self._cheese_to_move is cheese:
-            self._cheese_to_move.highlight(False)
-            self._cheese_to_move = None
-            self.root.update()
+        self._select_on_stool(self._model.cheese_location(cheese))
+
+    def _select_on_stool(self: 'GUIController', stool_index: int):
+        """Select the top cheese of stool stool_index, unselect it if it
+        is selected, or try to move the selected cheese onto it."""
+        if self._origin_index is None:
+            self._origin_index = stool_index
+            self._highlight_top(stool_index, True)
+        elif self._origin_index == stool_index:
+            self._highlight_top(stool_index, False)
+            self._origin_index = None
         else:
-            self.select_platform_for_move(cheese, stool_index)
+            self._move_selected(stool_index)
 
     def select_stool(self: 'GUIController', dest_stool: StoolView):
         """
         Called by stoolClicked. Initiate a move if there is already some
-        cheese highlighted (i.e. self._cheese_to_move is not None), unless
-        self._cheese_to_move is on dest_stool, in which case do nothing.
+        cheese highlighted (i.e. self._origin_index is not None), unless
+        the selected cheese is on dest_stool, in which case do nothing.
         """
-        if self._cheese_to_move is not None:
-            origin_stool = self._stools[
-                self._model.cheese_location(self._cheese_to_move)]
-            dest_stool_index = self.stool_index(dest_stool)
-            origin_stool_index = self.stool_index(origin_stool)
-            if origin_stool_index != dest_stool_index:
-                self.select_platform_for_move(dest_stool, dest_stool_index)
+        dest_stool_index = self.stool_index(dest_stool)
+        if (self._origin_index is not None and
+                self._origin_index != dest_stool_index):
+            self._move_selected(dest_stool_index)
 
     def select_platform_for_move(self: 'GUIController',
                                  platform: PlatformView, stool_index: int):
         """
-        Actually responsible for showing the cheese move on the screen, and
-        for telling the model to update itself.
-        Change self._cheese_to_move's coordinates so that it's on top of
-        platform.
+        Move the selected cheese onto platform.
 
         platform - the StoolView or CheeseView that we want to move
-        self._cheese_to_move onto.
+        the selected cheese onto.
         stool_index - if platform is a stool, then this is its index, and
         if platform is a cheese then this is the index of the stool that
         it is on.
         """
+        self._move_selected(stool_index)
 
-        if self._cheese_to_move is not None:
+    def _move_selected(self: 'GUIController', stool_index: int):
+        """
+        Actually responsible for showing the cheese move on the screen, and
+        for telling the model to update itself: move the selected cheese
+        onto stool stool_index, or blink it if that move is illegal.
+        """
+        if self._origin_index is not None:
+            origin = self._origin_index
+            self._highlight_top(origin, False)
             try:
-                from_stool = self._model.cheese_location(
-                    self._cheese_to_move)
-                self._model.move(from_stool, stool_index)
-                self._cheese_to_move.place(platform.x_center,
-                                           platform.y_center -
-                                           self.cheese_scale)
-                self.show_number_of_moves()
+                touched = {}
+                self._move_cheese(origin, stool_index, touched)
+                self._place_cheeses(touched)
             except IllegalMoveError as e:
                 print(e)
+                # Blink from the event loop, so the window stays responsive
                 self._blinking = True
-                for i in range(10):
-                    self._cheese_to_move.highlight(i % 2 != 0)
-                    self.root.update()
-                    time.sleep(0.1)
-                self._blinking = False
-            self._cheese_to_move.highlight(False)
-            self._cheese_to_move = None
+                self._blink(origin, 0)
+            self._origin_index = None
+
+    def _highlight_top(self: 'GUIController', stool_index: int,
+                       highlighting: bool):
+        """Set the colour of the top cheese of stool stool_index, or of its
+        band, to highlighted or not."""
+        if self._bands is None:
+            self._model.top_cheese(stool_index).highlight(highlighting)
+        else:
+            stack = self._bands[stool_index]
+            stack.highlight((self._heights[stool_index] - 1) // stack.band,
+                            highlighting)
+
+    def _blink(self: 'GUIController', stool_index: int, count: int):
+        """Show the count-th blink of the top cheese of stool stool_index,
+        and schedule the next one."""
+        if count < _BLINKS:
+            self._highlight_top(stool_index, count % 2 != 0)
+            self.root.after(_BLINK_MS, self._blink, stool_index, count + 1)
+        else:
+            self._highlight_top(stool_index, False)
+            self._blinking = False
+
+    def show_hint(self: 'GUIController'):
+        """Select the cheese that the best next move would move, and say
+        where it should go, or that there is no hint if finding it would
+        take too much search."""
+        if self._blinking or self._playback_moves is not None:
+            return
+        try:
+            hint = next_move(self._model, max_states=_HINT_MAX_STATES)
+        except SearchLimitError:
+            self.moves_label.config(text='Number of moves: ' +
+                                    str(self._model.number_of_moves()) +
+                                    '   No hint available')
+            return
+        if hint is None:
+            self.moves_label.config(text='Every cheese is on the last stool')
+            return
+        # Select the cheese to move, as if its stool had been clicked
+        if self._origin_index is not None:
+            self._highlight_top(self._origin_index, False)
+        self._origin_index = hint[0]
+        self._highlight_top(self._origin_index, True)
+        self.moves_label.config(text='Number of moves: ' +
+                                str(self._model.number_of_moves()) +
+                                '   Hint: move it to stool ' +
+                                str(hint[1] + 1) + ' from the left')
+
+    def play(self: 'GUIController', moves,
+             moves_per_second: float=DEFAULT_SPEED):
+        """Play moves back from the current state, moves_per_second of them
+        a second, without blocking the window. Clicks on cheeses and stools
+        are ignored until the playback ends.
+
+        moves - a MoveSequence, or any iterable of (origin, destination)
+                pairs, such as a generator from Tour.iter_moves
+        """
+        self.stop()
+        if self._origin_index is not None:
+            self._highlight_top(self._origin_index, False)
+            self._origin_index = None
+        if isinstance(moves, MoveSequence):
+            self._playback_moves = moves
+            self._playback_source = None
+        else:
+            self._playback_moves = []
+            self._playback_source = iter(moves)
+        self._playback_position = 0
+        self._playback_due = 0.0
+        self._playback_time = time.perf_counter()
+        self._paused = False
+        self._speed = moves_per_second
+        self._show_controls()
+        self._frame_job = self.root.after(_FRAME_MS, self._playback_frame)
+
+    def pause(self: 'GUIController'):
+        """Pause the playback, or resume it if paused."""
+        if self._playback_moves is not None:
+            self._paused = not self._paused
+            self._playback_due = 0.0
+            self._playback_time = time.perf_counter()
+            self._show_controls()
+
+    def step(self: 'GUIController'):
+        """Pause the playback, and play its next move."""
+        if self._playback_moves is not None:
+            if not self._paused:
+                self.pause()
+            self._advance(1)
+
+    def seek(self: 'GUIController', position: int):
+        """Go to the state after the first position moves of the playback,
+        undoing moves or making them as needed.
+        REQ: position >= 0
+        """
+        if self._playback_moves is not None:
+            if position > self._playback_position:
+                self._advance(position - self._playback_position)
+            elif position < self._playback_position:
+                touched = {}
+                while self._playback_position > position:
+                    self._playback_position -= 1
+                    # Take the move back, rather than making the reverse
+                    # move, so it doesn't count as a move
+                    (src, dest) = self._model.undo()
+                    self._track_cheese(dest, src, touched)
+                self._place_cheeses(touched)
+
+    def stop(self: 'GUIController'):
+        """End the playback, leaving the cheeses where they are."""
+        if self._frame_job is not None:
+            self.root.after_cancel(self._frame_job)
+            self._frame_job = None
+        self._playback_moves = None
+        self._playback_source = None
+        self._paused = False
+        if self._controls is not None:
+            self._controls.pack_forget()
+        self.show_number_of_moves()
+
+    def _playback_move(self: 'GUIController', index: int) -> tuple:
+        """Return the move of the playback at index, or None if there are
+        no more moves."""
+        moves = self._playback_moves
+        if isinstance(moves, MoveSequence):
+            result = moves.get_move(index) if index < moves.length() else None
+        else:
+            # Take moves from the iterator as they are needed
+            while len(moves) <= index and self._playback_source is not None:
+                move = next(self._playback_source, None)
+                if move is None:
+                    self._playback_source = None
+                else:
+                    moves.append(move)
+            result = moves[index] if index < len(moves) else None
+        return result
+
+    def _move_cheese(self: 'GUIController', origin: int, dest: int,
+                     touched: dict):
+        """Move the top cheese of stool origin to stool dest in the model,
+        recording in touched what has to be redrawn: the stool and height
+        the cheese ends up at, or the bands it left and joined."""
+        self._model.move(origin, dest)
+        self._track_cheese(origin, dest, touched)
+
+    def _track_cheese(self: 'GUIController', origin: int, dest: int,
+                      touched: dict):
+        """Record in touched what has to be redrawn now that the top cheese
+        of stool origin was moved to stool dest in the model."""
+        self._heights[origin] -= 1
+        if self._bands is None:
+            # Cheeses compare by size, so they are told apart by id
+            cheese = self._model.top_cheese(dest)
+            touched[id(cheese)] = (cheese, dest, self._heights[dest])
+        else:
+            band = self._bands[origin].band
+            touched[(origin, self._heights[origin] // band)] = None
+            touched[(dest, self._heights[dest] // band)] = None
+        self._heights[dest] += 1
+
+    def _place_cheeses(self: 'GUIController', touched: dict):
+        """Move the pictures of the cheeses in touched to their stool and
+        height, or redraw the bands in it, once each however many moves
+        touched them."""
+        if self._bands is None:
+            for (cheese, stool_index, height) in touched.values():
+                stool = self._stools[stool_index]
+                cheese.place(stool.x_center,
+                             stool.y_center - self._thickness * (height + 1))
+        else:
+            for (stool_index, band_index) in touched:
+                self._draw_band(stool_index, band_index)
+        self.show_number_of_moves()
+
+    def _draw_band(self: 'GUIController', stool_index: int,
+                   band_index: int):
+        """Redraw band band_index of stool stool_index from the model."""
+        stack = self._bands[stool_index]
+        bottom = band_index * stack.band
+        count = max(0, min(stack.band, self._heights[stool_index] - bottom))
+        size = 0
+        if count > 0:
+            size = self._model._cheese_at(stool_index, bottom).size
+        stack.draw_band(band_index, count, size)
+
+    def _advance(self: 'GUIController', count: int) -> int:
+        """Play the next count moves of the playback, drawing each cheese
+        once at the end, and return how many there were. If one of them is
+        illegal, stop the playback there and say why."""
+        touched = {}
+        made = 0
+        try:
+            while made < count:
+                move = self._playback_move(self._playback_position)
+                if move is None:
+                    break
+                self._move_cheese(move[0], move[1], touched)
+                self._playback_position += 1
+                made += 1
+        except IllegalMoveError as e:
+            print(e)
+            self._place_cheeses(touched)
+            self.stop()
+            self.moves_label.config(text='Number of moves: ' +
+                                    str(self._model.number_of_moves()) +
+                                    '   Playback stopped: ' + str(e))
+        else:
+            self._place_cheeses(touched)
+        return made
+
+    def _playback_frame(self: 'GUIController'):
+        """Play the moves due since the last frame, and schedule the next
+        frame."""
+        self._frame_job = None
+        now = time.perf_counter()
+        if not self._paused:
+            self._playback_due += (now - self._playback_time) * self._speed
+            due = int(self._playback_due)
+            self._playback_due -= due
+            self._advance(due)
+        self._playback_time = now
+        if self._playback_moves is None:
+            # The playback stopped at an illegal move
+            pass
+        elif self._playback_move(self._playback_position) is not None:
+            self._frame_job = self.root.after(_FRAME_MS,
+                                              self._playback_frame)
+        elif not self._paused:
+            # Leave the controls up while paused, to seek back
+            self.stop()
+
+    def _show_controls(self: 'GUIController'):
+        """Show the playback controls, making them the first time."""
+        if self._controls is None:
+            self._controls = TI.Frame(self.root)
+            self._pause_button = TI.Button(self._controls,
+                                           command=self.pause)
+            self._pause_button.pack(side=TI.LEFT)
+            TI.Button(self._controls, text='Step',
+                      command=self.step).pack(side=TI.LEFT)
+            TI.Button(self._controls, text='Restart',
+                      command=lambda: self.seek(0)).pack(side=TI.LEFT)
+            TI.Button(self._controls, text='Stop',
+                      command=self.stop).pack(side=TI.LEFT)
+        self._pause_button.config(text='Resume' if self._paused else 'Pause')
+        self._controls.pack()
+
+    def save_game(self: 'GUIController', path: str, history: bool=True):
+        """Save the game to a snapshot file at path (see Snapshot), with
+        the moves made if history."""
+        save_snapshot(self._model, path, history)
+
+    def load_game(self: 'GUIController', path: str):
+        """Load the game saved at path by save_game, putting every cheese
+        straight where it was instead of replaying the moves, and ending
+        any playback.
+        REQ: the saved game has as many cheeses and stools as this one
+        """
+        self.stop()
+        if self._origin_index is not None:
+            self._highlight_top(self._origin_index, False)
+            self._origin_index = None
+        load_snapshot(path, self._model)
+        self._heights = [0] * self._number_of_stools
+        for stool_index in self._model.stool_assignment():
+            self._heights[stool_index] += 1
+        # Redraw every cheese, or every band, once
+        touched = {}
+        for stool_index in range(self._number_of_stools):
+            if self._bands is None:
+                for height in range(self._heights[stool_index]):
+                    cheese = self._model._cheese_at(stool_index, height)
+                    touched[id(cheese)] = (cheese, stool_index, height)
+            else:
+                for band_index in range(
+                        len(self._bands[stool_index].indexes)):
+                    touched[(stool_index, band_index)] = None
+        self._place_cheeses(touched)
+
+    def _ask_save(self: 'GUIController'):
+        """Ask where to save the game, and save it there."""
+        path = tkinter.filedialog.asksaveasfilename(
+            defaultextension='.toah')
+        if path:
+            self.save_game(path)
+
+    def _ask_load(self: 'GUIController'):
+        """Ask which saved game to load, and load it."""
+        path = tkinter.filedialog.askopenfilename()
+        if path:
+            try:
+                self.load_game(path)
+            except ValueError as error:
+                self.moves_label.config(text=str(error))
 
     def stool_index(self: 'GUIView', stool: 'StoolView') -> int:
         return self._stools.index(stool)
 
     def show_number_of_moves(self: 'GUIView'):
-        """Show the number of moves so far."""
-        self.moves_label.config(text='Number of moves: ' +
-                                str(self._model.number_of_moves()))
+        """Show the number of moves so far, or how far the playback is."""
+        if self._playback_moves is None:
+            self.moves_label.config(text='Number of moves: ' +
+                                    str(self._model.number_of_moves()))
+        else:
+            if isinstance(self._playback_moves, MoveSequence):
+                total = str(self._playback_moves.length())
+            elif self._playback_source is None:
+                total = str(len(self._playback_moves))
+            else:
+                total = '?'
+            self.moves_label.config(text='Playing move ' +
+                                    str(self._playback_position) + ' of ' +
+                                    total)
+
+    def get_metrics(self: 'GUIController') -> MoveMetrics:
+        """Return the metrics of the moves made in this game."""
+        return self._metrics
 
     def get_stool(self: 'GUIController', i: int) -> 'StoolView':
         return self._stools[i]
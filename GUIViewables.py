@@ -22,7 +22,11 @@ CheeseView objects can be moved and highlighted.
 Note that CheeseView inherits from both Cheese and PlatformView
 
 PlatformView objects receive a function to call in order to report to some
-UI object (e.g. GUIController) that their rectangle was clicked on.
+UI object (e.g. GUIController) that their rectangle was clicked on, or None
+if the UI object handles clicks on the whole canvas itself.
+
+BandedStackView: The cheeses on a stool of a very tall tower, drawn in bands
+of several cheeses each.
 """
 
 from TOAHModel import Cheese
@@ -66,9 +70,10 @@ class PlatformView:
         # Tell the canvas to report when the rectangle is clicked.
         # The report is a call to click_handler, passing it this CheeseView
         # instance so the controller knows which one was clicked.
-        canvas.tag_bind(self.index,
-                        '<ButtonRelease>',
-                        lambda _: click_handler(self))    
+        if click_handler is not None:
+            canvas.tag_bind(self.index,
+                            '<ButtonRelease>',
+                            lambda _: click_handler(self))
         
     def place(self: 'PlatformView', x_center: float,
               y_center: float):
@@ -136,3 +141,59 @@ class StoolView(PlatformView):
                               click_handler, canvas, thickness, 
                               x_center, y_center)
         self.canvas.itemconfigure(self.index, fill='black')        
+
+
+class BandedStackView:
+    """The cheeses on one stool, when there are too many to draw one by one.
+
+    Heights on the stool are grouped in bands of band heights each, and each
+    band is drawn as one rectangle as wide as the bottom cheese in it and as
+    tall as the cheeses in it. The number of rectangles is bounded by the
+    height of the canvas rather than the number of cheeses, and a move only
+    redraws the band it took a cheese from or put one in.
+    """
+
+    def __init__(self: 'BandedStackView', canvas: Canvas, x_center: float,
+                 y_bottom: float, unit_width: float, thickness: float,
+                 band: int, max_height: int):
+        """
+        Initialize a new BandedStackView with every band empty.
+
+        canvas - space to draw the cheeses
+        x_center - center of the stool horizontally
+        y_bottom - top of the stool, where the lowest cheese sits
+        unit_width - width in pixels of a cheese of size 1
+        thickness - vertical extent of one cheese
+        band - number of heights in each band
+        max_height - most cheeses the stool can hold
+        """
+        self.canvas = canvas
+        self.x_center = x_center
+        self.y_bottom = y_bottom
+        self.unit_width = unit_width
+        self.thickness = thickness
+        self.band = band
+        self.indexes = [canvas.create_rectangle(0, 0, 0, 0, fill='orange',
+                                                width=0)
+                        for i in range(-(-max_height // band))]
+
+    def draw_band(self: 'BandedStackView', band_index: int, count: int,
+                  size: int):
+        """Draw band band_index holding count cheeses, the bottom one of
+        size size, or hide it if count is 0."""
+        if count == 0:
+            self.canvas.coords(self.indexes[band_index], 0, 0, 0, 0)
+        else:
+            bottom = self.y_bottom - band_index * self.band * self.thickness
+            half_width = size * self.unit_width / 2
+            self.canvas.coords(self.indexes[band_index],
+                               round(self.x_center - half_width),
+                               round(bottom - count * self.thickness),
+                               round(self.x_center + half_width),
+                               round(bottom))
+
+    def highlight(self: 'BandedStackView', band_index: int,
+                  highlighting: bool):
+        """Set the colour of band band_index to highlighted or not."""
+        self.canvas.itemconfigure(self.indexes[band_index],
+                                  fill=('red' if highlighting else 'orange'))
@@ -0,0 +1,499 @@
+"""
+GameServer: Host many games of Towers of Anne Hoy at once, over a TCP or
+Unix socket, in one process.
+
+Session: One player's game, driven by lines of the protocol
+GameServer: asyncio server running a Session for every connection
+run_load: Play many games against a server at once, and measure it
+
+Every connection gets a game of its own. The player sends one command a
+line, and gets one line back, starting with OK or ERR:
+
+    NEW <cheeses> <stools>  start a game with every cheese on stool 0
+    MOVE <from> <to>        move a cheese; OK <moves made>, and SOLVED
+                            once every cheese is on the last stool
+    UNDO / REDO             take a move back or make it again; OK <from> <to>
+    STATE                   OK <stool of each cheese, smallest first>
+    STATS                   OK <moves made> <moves undone> <bytes used>
+    QUIT                    BYE, and the connection is closed
+
+    >>> session = Session()
+    >>> session.execute('NEW 2 3')
+    'OK'
+    >>> session.execute('MOVE 0 1')
+    'OK 1'
+    >>> session.execute('MOVE 0 1')
+    'ERR Impossible to stack a larger cheese on top.'
+    >>> session.execute('UNDO')
+    'OK 0 1'
+
+A connection that sends nothing for idle_timeout seconds is closed, and a
+game can't hold more than memory_cap bytes of cheeses, history and
+checkpoints: moves past that are refused until some are undone or a NEW
+game is started. Run this module to serve, or with --load to start a
+server and play games against it from many connections at once:
+
+    python GameServer.py --port 7000
+    python GameServer.py --load 1000 --seconds 10
+"""
+
+from TOAHModel import (CompactTOAHModel, IllegalMoveError,
+                       _PACKED_MAX_STOOLS, _NIBBLE_MAX_STOOLS)
+from Tour import iter_moves
+import asyncio
+import math
+import os
+import time
+
+# Seconds a connection can stay silent before it is closed, by default
+DEFAULT_IDLE_TIMEOUT = 300
+# Bytes a game can use, by default
+DEFAULT_MEMORY_CAP = 1 << 20
+# Moves between the checkpoints of a game
+_CHECKPOINT_INTERVAL = 1024
+# Bytes a game takes besides its cheeses and moves, and for each
+# checkpoint besides its cheeses
+_GAME_BYTES = 2048
+_CHECKPOINT_BYTES = 96
+# The longest command line read
+_LINE_LIMIT = 256
+
+
+class Session:
+    """A player's game, played by lines of the protocol.
+
+    Sessions don't do any input or output, so a server can run thousands
+    of them in one process.
+    """
+
+    def __init__(self: 'Session', memory_cap: int=DEFAULT_MEMORY_CAP):
+        '''
+        (Session, int) -> NoneType
+        Create a session without a game, whose games can use at most
+        memory_cap bytes.
+        REQ: memory_cap > 0
+        '''
+        # REPRESENTATION INVARIANT
+        # self._model is the CompactTOAHModel of the game, or None before
+        # the first NEW
+        # self._made and self._undone are the numbers of moves made and of
+        # moves undone that can be redone
+        # self._cheese_bytes and self._move_bytes are the bytes the game
+        # uses for its cheeses, and for each move it keeps
+        self._memory_cap = memory_cap
+        self._model = None
+        self._made = 0
+        self._undone = 0
+        self._cheese_bytes = 0
+        self._move_bytes = 0.0
+
+    def memory(self: 'Session', moves: int=None) -> int:
+        '''
+        (Session, int) -> int
+        Return about how many bytes the game uses, or would use keeping
+        moves moves instead of those it keeps.
+        '''
+        if (moves is None):
+            moves = self._made + self._undone
+        return math.ceil(self._cheese_bytes + moves * self._move_bytes)
+
+    def _new(self: 'Session', arguments: list) -> str:
+        '''
+        (Session, list of str) -> str
+        Start a game of arguments[0] cheeses on arguments[1] stools, and
+        return the reply.
+        '''
+        number_of_cheeses, number_of_stools = int(arguments[0]), int(
+            arguments[1])
+        if (number_of_cheeses < 1 or number_of_stools < 1 or
+                number_of_stools > _PACKED_MAX_STOOLS):
+            return ("ERR A game needs at least 1 cheese and 1 to " +
+                    str(_PACKED_MAX_STOOLS) + " stools.")
+        # Each cheese takes a location byte and a slot on its stool, and
+        # each checkpoint holds a location byte per cheese
+        cheese_bytes = _GAME_BYTES + 5 * number_of_cheeses
+        per_move = 0.5 if number_of_stools <= _NIBBLE_MAX_STOOLS else 1
+        per_move += (_CHECKPOINT_BYTES + number_of_cheeses) / (
+            _CHECKPOINT_INTERVAL)
+        if (cheese_bytes > self._memory_cap):
+            return "ERR Too many cheeses for the memory cap."
+        self._model = CompactTOAHModel(number_of_stools,
+                                       _CHECKPOINT_INTERVAL)
+        self._model.fill_first_stool(number_of_cheeses)
+        self._made = 0
+        self._undone = 0
+        self._cheese_bytes = cheese_bytes
+        self._move_bytes = per_move
+        return "OK"
+
+    def _move(self: 'Session', arguments: list) -> str:
+        '''
+        (Session, list of str) -> str
+        Move a cheese from stool arguments[0] to stool arguments[1], and
+        return the reply.
+        '''
+        curr_stool, dest_stool = int(arguments[0]), int(arguments[1])
+        # A move drops the undone moves, and adds one
+        if (self.memory(self._made + 1) > self._memory_cap):
+            return "ERR Memory cap reached; UNDO moves or start a NEW game."
+        self._model.move(curr_stool, dest_stool)
+        self._made += 1
+        self._undone = 0
+        reply = "OK " + str(self._made)
+        # Solved once the last stool is as high as all the cheeses
+        if (self._model._cheese_at(self._model.number_of_stools() - 1,
+                                   self._model.number_of_cheeses() - 1)
+                is not None):
+            reply += " SOLVED"
+        return reply
+
+    def execute(self: 'Session', line: str) -> str:
+        '''
+        (Session, str) -> str
+        Carry out the command on line, and return the reply, without a
+        newline.
+        '''
+        words = line.split()
+        command = words[0].upper() if words != [] else ""
+        arguments = words[1:]
+        try:
+            if (command == "NEW" and len(arguments) == 2):
+                reply = self._new(arguments)
+            elif (command == "QUIT"):
+                reply = "BYE"
+            elif (command not in ("NEW", "MOVE", "UNDO", "REDO", "STATE",
+                                  "STATS")):
+                reply = "ERR Unknown command."
+            elif (self._model is None and command != "NEW"):
+                reply = "ERR Start a game with NEW <cheeses> <stools> first."
+            elif (command == "MOVE" and len(arguments) == 2):
+                reply = self._move(arguments)
+            elif (command == "UNDO"):
+                move = self._model.undo()
+                self._made -= 1
+                self._undone += 1
+                reply = "OK " + str(move[0]) + " " + str(move[1])
+            elif (command == "REDO"):
+                move = self._model.redo()
+                self._made += 1
+                self._undone -= 1
+                reply = "OK " + str(move[0]) + " " + str(move[1])
+            elif (command == "STATE"):
+                reply = "OK " + " ".join(
+                    map(str, self._model.stool_assignment()))
+            elif (command == "STATS"):
+                reply = ("OK " + str(self._made) + " " + str(self._undone) +
+                         " " + str(self.memory()))
+            else:
+                reply = "ERR Wrong number of arguments."
+        except IllegalMoveError as error:
+            reply = "ERR " + str(error)
+        except ValueError:
+            reply = "ERR Stools and cheeses are given by numbers."
+        return reply
+
+
+class _Connection(asyncio.Protocol):
+    """A connection to a GameServer, running a Session.
+
+    Commands are carried out as soon as their line arrives, and the replies
+    to the lines that arrive together are written together.
+    """
+
+    def __init__(self: '_Connection', server: 'GameServer'):
+        # REPRESENTATION INVARIANT
+        # self._server is the GameServer that accepted the connection
+        # self._session is its Session
+        # self._buffer holds the start of a line not received in full
+        # self._transport is the connection's transport, or None until it
+        # is made
+        # self.last_active is the event loop time of the last line
+        # received, or of the connection being made
+        self._server = server
+        self._session = Session(server._memory_cap)
+        self._buffer = b""
+        self._transport = None
+        self.last_active = 0.0
+
+    def connection_made(self: '_Connection', transport):
+        self._transport = transport
+        self.last_active = self._server._loop.time()
+        if (self._server._max_sessions is not None and
+                len(self._server._connections) >=
+                self._server._max_sessions):
+            transport.write(b"ERR Too many players; try again later.\n")
+            transport.close()
+        else:
+            self._server._connections.add(self)
+
+    def connection_lost(self: '_Connection', error):
+        self._server._connections.discard(self)
+
+    def data_received(self: '_Connection', data: bytes):
+        lines = (self._buffer + data).split(b"\n")
+        self._buffer = lines.pop()
+        if (len(self._buffer) > _LINE_LIMIT):
+            self.close(b"ERR Line too long.\n")
+        elif (lines != []):
+            self.last_active = self._server._loop.time()
+            self._server._commands += len(lines)
+            replies = []
+            for line in lines:
+                reply = self._session.execute(line.decode('ascii', 'replace'))
+                replies.append(reply)
+                if (reply == "BYE"):
+                    break
+            self._transport.write(("\n".join(replies) + "\n").encode())
+            if (replies[-1] == "BYE"):
+                self._transport.close()
+
+    def close(self: '_Connection', message: bytes):
+        '''
+        (_Connection, bytes) -> NoneType
+        Write message and close the connection.
+        '''
+        self._transport.write(message)
+        self._transport.close()
+
+
+class GameServer:
+    """Runs a Session for every connection to a TCP or Unix socket, all in
+    one asyncio event loop.
+    """
+
+    def __init__(self: 'GameServer',
+                 idle_timeout: float=DEFAULT_IDLE_TIMEOUT,
+                 memory_cap: int=DEFAULT_MEMORY_CAP,
+                 max_sessions: int=None):
+        '''
+        (GameServer, float, int, int) -> NoneType
+        Create a server closing connections idle for idle_timeout seconds,
+        whose games use at most memory_cap bytes each, and that takes at
+        most max_sessions connections at once (any number if None).
+        REQ: idle_timeout > 0 and memory_cap > 0
+        '''
+        # REPRESENTATION INVARIANT
+        # self._connections is the set of open _Connections
+        # self._server is the asyncio server, self._loop its event loop,
+        # and self._sweeper the task closing idle connections, or None
+        # before start
+        # self._commands is the number of commands carried out
+        self._idle_timeout = idle_timeout
+        self._memory_cap = memory_cap
+        self._max_sessions = max_sessions
+        self._connections = set()
+        self._server = None
+        self._loop = None
+        self._sweeper = None
+        self._commands = 0
+
+    async def start(self: 'GameServer', host: str='127.0.0.1',
+                    port: int=0, path: str=None):
+        '''
+        (GameServer, str, int, str) -> NoneType
+        Start listening on the Unix socket at path, or if path is None, on
+        port of host (any free port if 0).
+        '''
+        self._loop = asyncio.get_running_loop()
+        if (path is not None):
+            if (os.path.exists(path)):
+                os.unlink(path)
+            self._server = await self._loop.create_unix_server(
+                lambda: _Connection(self), path)
+        else:
+            self._server = await self._loop.create_server(
+                lambda: _Connection(self), host, port)
+        self._sweeper = self._loop.create_task(self._sweep())
+
+    def address(self: 'GameServer'):
+        '''
+        (GameServer) -> (str, int) or str
+        Return the (host, port) the server listens on, or the path of its
+        Unix socket.
+        REQ: the server was started
+        '''
+        address = self._server.sockets[0].getsockname()
+        if (isinstance(address, tuple)):
+            address = address[:2]
+        return address
+
+    def number_of_sessions(self: 'GameServer') -> int:
+        return len(self._connections)
+
+    def number_of_commands(self: 'GameServer') -> int:
+        return self._commands
+
+    async def close(self: 'GameServer'):
+        '''
+        (GameServer) -> NoneType
+        Stop listening, and close every connection.
+        '''
+        self._sweeper.cancel()
+        self._server.close()
+        for connection in list(self._connections):
+            connection.close(b"ERR The server is closing.\n")
+        await self._server.wait_closed()
+
+    async def serve_forever(self: 'GameServer'):
+        await self._server.serve_forever()
+
+    async def _sweep(self: 'GameServer'):
+        '''
+        (GameServer) -> NoneType
+        Close the connections idle for longer than the idle timeout, every
+        quarter of it, rather than timing every read.
+        '''
+        while (True):
+            await asyncio.sleep(self._idle_timeout / 4)
+            oldest = self._loop.time() - self._idle_timeout
+            for connection in list(self._connections):
+                if (connection.last_active < oldest):
+                    connection.close(b"ERR Idle for too long.\n")
+
+
+def _percentile(values, fraction):
+    '''
+    (list of float, float) -> float
+    Return the nearest-rank percentile of values at fraction.
+    REQ: values != [] and 0 < fraction <= 1
+    '''
+    ordered = sorted(values)
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[rank - 1]
+
+
+async def _connect(address):
+    '''
+    (str or (str, int)) -> (StreamReader, StreamWriter)
+    Open a connection to the server at address, a Unix socket path or a
+    (host, port).
+    '''
+    if (isinstance(address, str)):
+        return await asyncio.open_unix_connection(address)
+    return await asyncio.open_connection(address[0], address[1])
+
+
+async def _play(address, new: bytes, lines: list, deadline: float,
+                latencies: list) -> int:
+    '''
+    (str or (str, int), bytes, list of bytes, float, list of float) -> int
+    Play the game started by new with the moves in lines, over and over,
+    until time.perf_counter() reaches deadline, adding the time to answer
+    each move to latencies. Return the number of moves made.
+    '''
+    reader, writer = await _connect(address)
+    made = 0
+    try:
+        while (time.perf_counter() < deadline):
+            writer.write(new)
+            if (not (await reader.readline()).startswith(b"OK")):
+                raise ConnectionError("The server refused a NEW game.")
+            for line in lines:
+                start = time.perf_counter()
+                writer.write(line)
+                reply = await reader.readline()
+                now = time.perf_counter()
+                if (not reply.startswith(b"OK")):
+                    raise ConnectionError("The server refused a move: " +
+                                          reply.decode().strip())
+                latencies.append(now - start)
+                made += 1
+                if (now >= deadline):
+                    break
+        writer.write(b"QUIT\n")
+        await reader.readline()
+    finally:
+        writer.close()
+    return made
+
+
+async def run_load(address, clients: int=100, seconds: float=5,
+                   number_of_cheeses: int=10,
+                   number_of_stools: int=4) -> dict:
+    '''
+    (str or (str, int), int, float, int, int) -> dict
+    Have clients connections play the solution of a game of
+    number_of_cheeses cheeses and number_of_stools stools over and over
+    against the server at address, a Unix socket path or a (host, port),
+    for seconds seconds, and return the moves made, the moves per second,
+    and the 50th and 99th percentile of the time to answer a move, in
+    milliseconds.
+    REQ: clients > 0 and seconds > 0
+    '''
+    new = ("NEW " + str(number_of_cheeses) + " " + str(number_of_stools) +
+           "\n").encode()
+    lines = [("MOVE " + str(src) + " " + str(dest) + "\n").encode()
+             for (src, dest) in iter_moves(number_of_cheeses,
+                                           number_of_stools)]
+    latencies = []
+    start_time = time.perf_counter()
+    made = await asyncio.gather(*[
+        _play(address, new, lines, start_time + seconds, latencies)
+        for client in range(clients)])
+    elapsed = time.perf_counter() - start_time
+    return {'clients': clients, 'moves': sum(made), 'seconds': elapsed,
+            'moves_per_second': sum(made) / elapsed,
+            'p50_ms': _percentile(latencies, 0.5) * 1000 if latencies else 0,
+            'p99_ms': _percentile(latencies, 0.99) * 1000 if latencies else 0}
+
+
+async def _serve_until_cancelled(server, host, port, path):
+    '''
+    (GameServer, str, int, str) -> NoneType
+    Start server on path, or on port of host, and serve until cancelled.
+    '''
+    await server.start(host, port, path)
+    print("Serving on", server.address())
+    await server.serve_forever()
+
+
+async def _load_locally(server, host, port, path, *load) -> dict:
+    '''
+    (GameServer, str, int, str, ...) -> dict
+    Start server on path, or on port of host, return what run_load
+    returns for it with the arguments load, and close it.
+    '''
+    await server.start(host, port, path)
+    try:
+        return await run_load(server.address(), *load)
+    finally:
+        await server.close()
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Host games of Towers of Anne Hoy over a socket.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7000)
+    parser.add_argument('--unix', default=None,
+                        help="serve on the Unix socket at this path instead")
+    parser.add_argument('--idle-timeout', type=float,
+                        default=DEFAULT_IDLE_TIMEOUT)
+    parser.add_argument('--memory-cap', type=int, default=DEFAULT_MEMORY_CAP,
+                        help="bytes each game can use")
+    parser.add_argument('--max-sessions', type=int, default=None)
+    parser.add_argument('--load', type=int, default=None, metavar='CLIENTS',
+                        help="start a server and play games against it "
+                        "from this many connections, then report")
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--cheeses', type=int, default=10)
+    parser.add_argument('--stools', type=int, default=4)
+    args = parser.parse_args()
+    game_server = GameServer(args.idle_timeout, args.memory_cap,
+                             args.max_sessions)
+    if (args.load is not None):
+        result = asyncio.run(_load_locally(
+            game_server, args.host, 0, args.unix, args.load, args.seconds,
+            args.cheeses, args.stools))
+        print(result['clients'], 'clients:', result['moves'], 'moves in',
+              format(result['seconds'], '.2f'), 's,',
+              format(result['moves_per_second'], '.0f'), 'moves/s, p50',
+              format(result['p50_ms'], '.2f'), 'ms, p99',
+              format(result['p99_ms'], '.2f'), 'ms')
+    else:
+        try:
+            asyncio.run(_serve_until_cancelled(game_server, args.host,
+                                               args.port, args.unix))
+        except KeyboardInterrupt:
+            pass
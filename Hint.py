@@ -0,0 +1,193 @@
+"""
+Hint: Suggest the next move of a shortest solution from the current state
+of a game of Towers of Anne Hoy.
+
+next_move: Return the best next move for a model
+moves_left: Return the least number of moves left for a model
+
+With 3 stools both take O(number of cheeses) steps, straight from the
+configuration. With more stools, small games look up an exact distance
+table (a PatternDatabase over every cheese, built once and cached on disk),
+and bigger games search once with TOAHSearch and remember the whole
+solution, so the following hints along it are lookups. Those solutions are
+kept apart by number of cheeses, since a configuration's code is the same
+with or without more large cheeses on stool 0:
+
+    >>> from TOAHModel import TOAHModel, MoveSequence
+    >>> small = TOAHModel(5)
+    >>> small.fill_first_stool(9)
+    >>> next_move(small)
+    (0, 1)
+    >>> big = TOAHModel(5)
+    >>> big.fill_first_stool(10)
+    >>> big.load_state([3, 3, 3, 1, 1, 1, 2, 2, 0, 0], MoveSequence([]), 0)
+    >>> left = moves_left(big)
+    >>> big.move(*next_move(big))
+    >>> moves_left(big) == left - 1
+    True
+"""
+
+from PatternDatabase import (default_group_size, open_pattern_database,
+                             solve, DEFAULT_DIRECTORY, _FARTHEST)
+from TOAHSearch import (encode_state, _bits_per_cheese, _successors,
+                        DEFAULT_MAX_STATES)
+
+# Exact tables that have been opened, by (stools, cheeses)
+_TABLES = {}
+# Next move along a solution found by search, by (stools, cheeses, goal
+# stool) then encoded configuration
+_SOLUTIONS = {}
+
+
+def _three_stool_plan(locations, goal_stool):
+    '''
+    (list of int, int) -> (int, (int, int))
+    Return the least number of moves that puts every cheese on goal_stool
+    with 3 stools, where the cheese of size i + 1 is on locations[i], and
+    the first of those moves (None if there are none).
+    Going from the largest cheese down: if a cheese isn't on the stool it
+    should go to, it has to move there once, after every smaller cheese is
+    moved out of the way to the third stool, 2 ** (size - 1) moves in all.
+    The last such cheese found, the smallest, can be moved right away.
+    REQ: 0 <= locations[i] < 3 and 0 <= goal_stool < 3
+    >>> _three_stool_plan([0, 0, 0], 2)
+    (7, (0, 2))
+    >>> _three_stool_plan([1, 1, 2], 2)
+    (3, (1, 0))
+    '''
+    target = goal_stool
+    moves = 0
+    move = None
+    for size in range(len(locations), 0, -1):
+        stool = locations[size - 1]
+        if (stool != target):
+            moves += 1 << (size - 1)
+            move = (stool, target)
+            # The smaller cheeses have to get out of the way first
+            target = 3 - stool - target
+    return moves, move
+
+
+def _table(num_cheese, num_stools):
+    '''
+    (int, int) -> PatternDatabase
+    Return the exact distance table for num_cheese cheeses and num_stools
+    stools, or None if it would be too big.
+    '''
+    key = (num_stools, num_cheese)
+    if (key not in _TABLES):
+        table = None
+        if (num_cheese <= default_group_size(num_stools)):
+            table = open_pattern_database(num_cheese, num_stools,
+                                          DEFAULT_DIRECTORY)
+        _TABLES[key] = table
+    return _TABLES[key]
+
+
+def _table_distance(table, locations, goal_stool):
+    '''
+    (PatternDatabase, list of int, int) -> int
+    Return the distance to goal_stool in table, which is for the last stool.
+    '''
+    last = table.number_of_stools() - 1
+    swap = {goal_stool: last, last: goal_stool}
+    return table.distance([swap.get(stool, stool) for stool in locations])
+
+
+def _searched_move(model, locations, goal_stool, max_states):
+    '''
+    (TOAHModel, list of int, int, int) -> (int, int)
+    Return the next move along a shortest solution found by search,
+    searching only if the configuration isn't on a solution found before.
+    Raise SearchLimitError if the search needs more than max_states
+    configurations.
+    '''
+    num_stools = model.number_of_stools()
+    known = _SOLUTIONS.setdefault((num_stools, len(locations), goal_stool),
+                                  {})
+    start = encode_state(locations, num_stools)
+    if (start not in known):
+        # Remember the next move from every configuration on the solution
+        bits = _bits_per_cheese(num_stools)
+        state = start
+        for (src, dest) in solve(model, goal_stool,
+                                 max_states=max_states):
+            known[state] = (src, dest)
+            # The top cheese of src is the smallest one on it
+            size = locations.index(src)
+            locations[size] = dest
+            state += (dest - src) << (bits * size)
+    return known[start]
+
+
+def next_move(model, goal_stool: int=-1,
+              max_states: int=DEFAULT_MAX_STATES):
+    '''
+    (TOAHModel, int, int) -> (int, int)
+    Return the (origin, destination) of the next move of a shortest way to
+    put every cheese of model on goal_stool (the last stool by default), or
+    None if they are all there already.
+    Raise SearchLimitError if finding it needs a search through more than
+    max_states configurations.
+    REQ: the cheeses in model have sizes 1 to number_of_cheeses
+    REQ: number_of_stools >= 3
+    '''
+    num_stools = model.number_of_stools()
+    goal_stool %= num_stools
+    locations = model.stool_assignment()
+    result = None
+    if (locations.count(goal_stool) == len(locations)):
+        pass
+    elif (num_stools == 3):
+        result = _three_stool_plan(locations, goal_stool)[1]
+    else:
+        table = _table(len(locations), num_stools)
+        distance = None
+        if (table is not None):
+            distance = _table_distance(table, locations, goal_stool)
+        # Look for a move that gets one step closer, unless the distance
+        # was too long to store exactly
+        if (distance is not None and distance < _FARTHEST):
+            state = encode_state(locations, num_stools)
+            bits = _bits_per_cheese(num_stools)
+            mask = (1 << bits) - 1
+            for (after, src, dest) in _successors(state, len(locations),
+                                                  num_stools):
+                closer = [(after >> (bits * size)) & mask
+                          for size in range(len(locations))]
+                if (_table_distance(table, closer, goal_stool) ==
+                        distance - 1):
+                    result = (src, dest)
+                    break
+        else:
+            result = _searched_move(model, locations, goal_stool,
+                                    max_states)
+    return result
+
+
+def moves_left(model, goal_stool: int=-1) -> int:
+    '''
+    (TOAHModel, int) -> int
+    Return the least number of moves that puts every cheese of model on
+    goal_stool (the last stool by default).
+    REQ: the cheeses in model have sizes 1 to number_of_cheeses
+    REQ: number_of_stools >= 3
+    '''
+    num_stools = model.number_of_stools()
+    goal_stool %= num_stools
+    locations = model.stool_assignment()
+    if (num_stools == 3):
+        result = _three_stool_plan(locations, goal_stool)[0]
+    else:
+        table = _table(len(locations), num_stools)
+        result = None
+        if (table is not None):
+            result = _table_distance(table, locations, goal_stool)
+        if (result is None or result >= _FARTHEST):
+            result = solve(model, goal_stool).length()
+    return result
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod(verbose=True)
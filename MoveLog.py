@@ -0,0 +1,554 @@
+"""
+MoveLog: Keep very long solutions of Towers of Anne Hoy on disk.
+
+MoveLogWriter: Write moves to a move log file as they are made
+MoveLog: Read a move log file through a memory map
+read_moves: Read the moves of a move log from a stream, such as a pipe
+write_move_log: Write the Frame-Stewart solution of a game to a move log,
+in parallel across a pool of processes if asked
+
+A move log starts with a 24-byte header: the magic string b'TOAHLOG1', the
+number of stools and cheeses of the game (2 bytes each, little endian), 4
+bytes of padding, and the number of moves (8 bytes, little endian). The
+moves follow, packed as PackedMoveSequence packs them: half a byte each
+with at most 4 stools, a byte each with at most 16. While the writer is
+still open the number of moves is _UNFINISHED, and readers count the moves
+written so far from the file size:
+
+    >>> import os, tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), 'solution.toahlog')
+    >>> write_move_log(path, 3, 3)
+    7
+    >>> log = MoveLog(path)
+    >>> log[2:4]
+    PackedMoveSequence(3, [(2, 1), (0, 2)])
+    >>> log.generate_TOAHModel().stool_assignment()
+    [2, 2, 2]
+    >>> log.close()
+"""
+
+from TOAHModel import (TOAHModel, PackedMoveSequence, IllegalMoveError,
+                       _BYTE_MOVES, _NIBBLE_MOVES, _NIBBLE_PAIRS,
+                       _PACKED_MAX_STOOLS, _NIBBLE_MAX_STOOLS, _pack_nibbles)
+from Tour import (iter_packed_chunks, iter_move_chunks, frame_stewart_moves,
+                  _iter_move_pieces)
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
+import mmap
+import os
+import struct
+import time
+
+_MAGIC = b'TOAHLOG1'
+_HEADER = struct.Struct('<8sHH4xQ')
+# The number of moves in the header of a log still being written
+_UNFINISHED = (1 << 64) - 1
+# Moves the writer collects before packing and writing them
+_BUFFER_MOVES = 1 << 22
+# Bytes read_moves reads at a time
+_READ_BYTES = 1 << 16
+# The most moves write_move_log gives a worker to pack at a time
+_TASK_MOVES = 1 << 22
+
+
+class MoveLogWriter:
+    """Writes the moves of a game to a move log file as they are made.
+
+    Moves can be given one at a time with add_move, but write_chunk takes
+    them packed one per byte, as Tour.iter_move_chunks makes them, and
+    write_packed takes them already packed, as Tour.iter_packed_chunks makes
+    them, and writes them as they are.
+    """
+
+    def __init__(self: 'MoveLogWriter', path: str, number_of_cheeses: int,
+                 number_of_stools: int):
+        '''
+        (MoveLogWriter, str, int, int) -> NoneType
+        Create the move log at path for a game with number_of_cheeses
+        cheeses and number_of_stools stools, replacing any file there.
+        REQ: 0 < number_of_stools <= 16
+        '''
+        # REPRESENTATION INVARIANT
+        # self._file is the open log file, holding the header and the moves
+        # written so far, packed
+        # self._pending holds the moves not written yet, one per byte
+        # self._length is the number of moves given so far
+        # self._nibbles is True iff moves are packed half a byte each
+        if (number_of_stools > _PACKED_MAX_STOOLS):
+            raise IllegalMoveError("Too many stools to pack the moves.")
+        self._number_of_stools = number_of_stools
+        self._number_of_cheeses = number_of_cheeses
+        self._nibbles = number_of_stools <= _NIBBLE_MAX_STOOLS
+        self._pending = bytearray()
+        self._length = 0
+        self._file = open(path, 'wb')
+        self._file.write(_HEADER.pack(_MAGIC, number_of_stools,
+                                      number_of_cheeses, _UNFINISHED))
+
+    def add_move(self: 'MoveLogWriter', src_stool: int, dest_stool: int):
+        '''
+        (MoveLogWriter, int, int) -> NoneType
+        Add the move from src_stool to dest_stool to the log.
+        '''
+        if (src_stool < 0 or dest_stool < 0 or
+                src_stool >= self._number_of_stools or
+                dest_stool >= self._number_of_stools):
+            raise IllegalMoveError("Invalid stool index.")
+        self._pending.append((src_stool << 4) | dest_stool)
+        self._length += 1
+        if (len(self._pending) >= _BUFFER_MOVES):
+            self._flush()
+
+    def write_moves(self: 'MoveLogWriter', moves):
+        '''
+        (MoveLogWriter, iterable of (int, int)) -> NoneType
+        Add every move in moves to the log.
+        '''
+        for (src_stool, dest_stool) in moves:
+            self.add_move(src_stool, dest_stool)
+
+    def write_chunk(self: 'MoveLogWriter', chunk: bytes):
+        '''
+        (MoveLogWriter, bytes) -> NoneType
+        Add the moves in chunk, packed one per byte as
+        (origin << 4) | destination, to the log.
+        REQ: every move in chunk is between stools of the game
+        '''
+        self._pending += chunk
+        self._length += len(chunk)
+        if (len(self._pending) >= _BUFFER_MOVES):
+            self._flush()
+
+    def _flush(self: 'MoveLogWriter'):
+        '''
+        (MoveLogWriter) -> NoneType
+        Write the pending moves, keeping back the last one if it would
+        only fill half a byte.
+        '''
+        if (not self._nibbles):
+            self._file.write(self._pending)
+            self._pending = bytearray()
+        else:
+            even = len(self._pending) & ~1
+            self._file.write(_pack_nibbles(self._pending[:even]))
+            del self._pending[:even]
+
+    def write_packed(self: 'MoveLogWriter', data, number_of_moves: int):
+        '''
+        (MoveLogWriter, bytes-like, int) -> NoneType
+        Add number_of_moves moves, packed in data as PackedMoveSequence packs
+        them, to the log.
+        REQ: the moves given so far fill whole bytes
+        REQ: data holds number_of_moves moves in whole bytes, except that
+             the last nibble may be unused if this is the last call
+        '''
+        self._flush()
+        if (len(self._pending) != 0):
+            raise ValueError("The moves so far end in the middle of a byte.")
+        self._file.write(data)
+        self._length += number_of_moves
+
+    def write_solution(self: 'MoveLogWriter', workers: int=1):
+        '''
+        (MoveLogWriter, int) -> NoneType
+        Add the Frame-Stewart solution of the game, from the first stool to
+        the last, to the log, straight from Tour.iter_packed_chunks. With
+        more than one worker, its sub-towers of up to _TASK_MOVES moves
+        are given in order to a pool of workers processes, at most two per
+        worker waiting, and each process writes the bytes its sub-tower
+        fills on its own straight into their place in the file. The bytes
+        shared by two sub-towers, a nibble each, are put together here as
+        the sub-towers come back, in order.
+        REQ: no moves were given yet
+        REQ: workers >= 1
+        '''
+        total = frame_stewart_moves(self._number_of_cheeses,
+                                    self._number_of_stools)
+        if (workers == 1):
+            per_byte = 2 if self._nibbles else 1
+            for chunk in iter_packed_chunks(self._number_of_cheeses,
+                                            self._number_of_stools):
+                self.write_packed(chunk, min(len(chunk) * per_byte,
+                                             total - self._length))
+        else:
+            self._file.flush()
+            # Where the moves start in the file, the number of moves given
+            # out so far, and the high nibble of the byte they end in the
+            # middle of
+            start = self._file.tell()
+            position = 0
+            carry = None
+            waiting = deque()
+            pool = ProcessPoolExecutor(max_workers=workers)
+            try:
+                for (cheese, labels) in _iter_move_pieces(
+                        self._number_of_cheeses,
+                        tuple(range(self._number_of_stools)), _TASK_MOVES):
+                    # A single move is a sub-tower of one cheese
+                    if (cheese is None):
+                        cheese = 1
+                    offset = start + (position >> 1 if self._nibbles
+                                      else position)
+                    waiting.append((pool.submit(
+                        _write_sub_tower, (self._file.name, offset, cheese,
+                                           labels, self._nibbles, position)),
+                        offset))
+                    position += frame_stewart_moves(cheese, len(labels))
+                    while (len(waiting) > 2 * workers or
+                           (len(waiting) != 0 and waiting[0][0].done())):
+                        carry = self._join_halves(waiting.popleft(), carry)
+                while (len(waiting) != 0):
+                    carry = self._join_halves(waiting.popleft(), carry)
+            finally:
+                pool.shutdown(cancel_futures=True)
+            # A last odd move goes in the high nibble of a byte of its own
+            if (carry is not None):
+                _write_at(self._file.fileno(), bytes([carry]),
+                          start + (total >> 1))
+            self._length = total
+
+    def _join_halves(self: 'MoveLogWriter', piece: tuple, carry: int) -> int:
+        '''
+        (MoveLogWriter, (Future, int), int) -> int
+        Wait for the sub-tower of piece, (the future writing it, its offset
+        in the file), and if its first byte is shared, write that byte,
+        with carry in its high nibble. Return the high nibble of the byte
+        it ends in the middle of, or carry if it ends on a whole byte.
+        REQ: carry is not None if the sub-tower starts in a shared byte
+        '''
+        (future, offset) = piece
+        (first, last) = future.result()
+        if (first is not None):
+            _write_at(self._file.fileno(), bytes([carry | first]), offset)
+            carry = None
+        if (last is not None):
+            carry = last
+        return carry
+
+    def length(self: 'MoveLogWriter') -> int:
+        return self._length
+
+    def close(self: 'MoveLogWriter'):
+        '''
+        (MoveLogWriter) -> NoneType
+        Write the remaining moves and the number of moves, and close the
+        file.
+        '''
+        if (not self._file.closed):
+            self._flush()
+            # A last odd move goes in the high nibble of a byte of its own
+            if (len(self._pending) == 1):
+                self._file.write(_pack_nibbles(self._pending + b'\0'))
+            self._file.seek(0)
+            self._file.write(_HEADER.pack(_MAGIC, self._number_of_stools,
+                                          self._number_of_cheeses,
+                                          self._length))
+            self._file.close()
+
+    def __enter__(self: 'MoveLogWriter') -> 'MoveLogWriter':
+        return self
+
+    def __exit__(self: 'MoveLogWriter', *exception):
+        self.close()
+
+
+class MoveLog:
+    """The moves in a move log file, read through a memory map.
+
+    Iterating copies the mapped bytes a 64 KiB block at a time, so only the
+    pages that are read are loaded, and an iteration stopped part way
+    doesn't keep close from unmapping the file. Only chunks gives views of
+    the map without copying, and those have to be released before closing.
+    Slices become PackedMoveSequences copied straight from the packed
+    bytes.
+    """
+
+    def __init__(self: 'MoveLog', path: str):
+        '''
+        (MoveLog, str) -> NoneType
+        Open the move log at path.
+        REQ: path was written by a MoveLogWriter
+        '''
+        # REPRESENTATION INVARIANT
+        # self._file is the open log file, and self._map maps all of it
+        # self._moves is a memoryview of the packed moves in self._map
+        # self._length is the number of moves in the log
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if (len(self._map) < _HEADER.size):
+            self.close()
+            raise ValueError(path + " is not a move log.")
+        magic, stools, cheeses, length = _HEADER.unpack_from(self._map, 0)
+        nibbles = stools <= _NIBBLE_MAX_STOOLS
+        size = len(self._map) - _HEADER.size
+        # A log still being written has every move up to its size
+        if (length == _UNFINISHED):
+            length = size * 2 if nibbles else size
+        if (magic != _MAGIC or
+                size < ((length + 1) >> 1 if nibbles else length)):
+            self.close()
+            raise ValueError(path + " is not a move log.")
+        self._number_of_stools = stools
+        self._number_of_cheeses = cheeses
+        self._nibbles = nibbles
+        self._length = length
+        self._moves = memoryview(self._map)[_HEADER.size:]
+
+    def number_of_stools(self: 'MoveLog') -> int:
+        return self._number_of_stools
+
+    def number_of_cheeses(self: 'MoveLog') -> int:
+        return self._number_of_cheeses
+
+    def length(self: 'MoveLog') -> int:
+        return self._length
+
+    def __len__(self: 'MoveLog') -> int:
+        return self._length
+
+    def get_move(self: 'MoveLog', i: int) -> tuple:
+        '''
+        (MoveLog, int) -> (int, int)
+        Return the move at index i, counting from the end if i < 0.
+        '''
+        if (i < 0):
+            i += self._length
+        if (i < 0 or i >= self._length):
+            raise IndexError("Move index out of range.")
+        if (self._nibbles):
+            code = self._moves[i >> 1]
+            # Even moves are in the high nibble, odd ones in the low
+            if (i & 1 == 0):
+                code >>= 4
+            result = _NIBBLE_MOVES[code & 15]
+        else:
+            result = _BYTE_MOVES[self._moves[i]]
+        return result
+
+    def __getitem__(self: 'MoveLog', index):
+        '''
+        (MoveLog, int or slice) -> (int, int) or PackedMoveSequence
+        Return the move at index, or a PackedMoveSequence holding the moves
+        in the slice index.
+        '''
+        if (not isinstance(index, slice)):
+            return self.get_move(index)
+        start, stop, step = index.indices(self._length)
+        if (step == 1 and stop > start and
+                (not self._nibbles or start & 1 == 0)):
+            first = start >> 1 if self._nibbles else start
+            result = PackedMoveSequence.from_bytes(
+                self._number_of_stools, self._moves[first:], stop - start)
+        else:
+            result = PackedMoveSequence(self._number_of_stools)
+            for i in range(start, stop, step):
+                result.add_move(*self.get_move(i))
+        return result
+
+    def __iter__(self: 'MoveLog'):
+        # Decode whole bytes through the tables, as PackedMoveSequence does,
+        # a copied block at a time, so that an iteration stopped part way
+        # leaves no view of the map for close to trip over
+        length = self._length
+        end = (length + 1) >> 1 if self._nibbles else length
+        for start in range(0, end, _READ_BYTES):
+            with self._moves[start:min(start + _READ_BYTES, end)] as view:
+                block = bytes(view)
+            if (not self._nibbles):
+                yield from map(_BYTE_MOVES.__getitem__, block)
+            # The last byte only holds one move
+            elif (length & 1 == 1 and start + len(block) == end):
+                yield from chain.from_iterable(
+                    map(_NIBBLE_PAIRS.__getitem__, block[:-1]))
+                yield _NIBBLE_MOVES[block[-1] >> 4]
+            else:
+                yield from chain.from_iterable(
+                    map(_NIBBLE_PAIRS.__getitem__, block))
+
+    def chunks(self: 'MoveLog', size: int=1 << 20):
+        '''
+        (MoveLog, int) -> generator of memoryview
+        Yield the packed moves in memoryviews of the map of at most size
+        bytes each, without copying them. They have to be released before
+        the log is closed.
+        REQ: size > 0
+        '''
+        end = (self._length + 1) >> 1 if self._nibbles else self._length
+        for start in range(0, end, size):
+            yield self._moves[start:min(start + size, end)]
+
+    def replay(self: 'MoveLog', model, start: int=0, stop: int=None):
+        '''
+        (MoveLog, TOAHModel, int, int) -> NoneType
+        Make the moves from index start up to stop (the end by default) on
+        model.
+        REQ: the moves are legal in model
+        '''
+        if (stop is None):
+            stop = self._length
+        move = model.move
+        if (start == 0 and stop == self._length):
+            moves = iter(self)
+        else:
+            moves = iter(self[start:stop])
+        for (src_stool, dest_stool) in moves:
+            move(src_stool, dest_stool)
+
+    def generate_TOAHModel(self: 'MoveLog', model_class=TOAHModel):
+        '''
+        (MoveLog, type) -> TOAHModel
+        Return a model_class model of the game, with its cheeses on the
+        first stool, after every move in the log, as
+        MoveSequence.generate_TOAHModel does.
+        '''
+        model = model_class(self._number_of_stools)
+        model.fill_first_stool(self._number_of_cheeses)
+        self.replay(model)
+        return model
+
+    def close(self: 'MoveLog'):
+        if (hasattr(self, '_moves')):
+            self._moves.release()
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self: 'MoveLog') -> 'MoveLog':
+        return self
+
+    def __exit__(self: 'MoveLog', *exception):
+        self.close()
+
+
+def _stream_moves(stream, nibbles: bool, length: int):
+    '''
+    (binary file, bool, int) -> generator of (int, int)
+    Yield the moves packed in what is left of stream, half a byte each if
+    nibbles, stopping after length of them.
+    '''
+    while (length > 0):
+        data = stream.read(_READ_BYTES)
+        if (not data):
+            break
+        if (nibbles):
+            moves = chain.from_iterable(map(_NIBBLE_PAIRS.__getitem__, data))
+            count = 2 * len(data)
+        else:
+            moves = map(_BYTE_MOVES.__getitem__, data)
+            count = len(data)
+        if (count > length):
+            moves = islice(moves, length)
+            count = length
+        yield from moves
+        length -= count
+
+
+def read_moves(stream) -> tuple:
+    '''
+    (binary file) -> (int, int, iterator of (int, int))
+    Read the header of the move log coming from stream, which doesn't have
+    to be seekable, and return its number of stools and cheeses, and an
+    iterator over its moves, read as they are needed. The moves of a log
+    still being written are read to the end of the stream.
+    >>> import io
+    >>> data = _HEADER.pack(_MAGIC, 3, 2, 3) + bytes([18, 96])
+    >>> stools, cheeses, moves = read_moves(io.BytesIO(data))
+    >>> stools, cheeses, list(moves)
+    (3, 2, [(0, 1), (0, 2), (1, 2)])
+    '''
+    header = stream.read(_HEADER.size)
+    if (len(header) < _HEADER.size or header[:len(_MAGIC)] != _MAGIC):
+        raise ValueError("Not a move log.")
+    magic, stools, cheeses, length = _HEADER.unpack(header)
+    if (length == _UNFINISHED):
+        # No more moves than the longest stream could hold
+        length = _UNFINISHED * 2
+    return (stools, cheeses,
+            _stream_moves(stream, stools <= _NIBBLE_MAX_STOOLS, length))
+
+
+def _write_at(log: int, data, offset: int):
+    '''
+    (int, bytes-like, int) -> NoneType
+    Write all of data into the open file descriptor log, starting at
+    offset, without moving its position.
+    '''
+    data = memoryview(data)
+    while (len(data) > 0):
+        written = os.pwrite(log, data, offset)
+        data = data[written:]
+        offset += written
+
+
+def _write_sub_tower(job) -> tuple:
+    '''
+    ((str, int, int, tuple of int, bool, int)) -> (int, int)
+    Pack the moves of the sub-tower of job, (path, offset, cheeses,
+    stools, nibbles, position), as they are in a move log where they start
+    after position moves: half a byte each if nibbles, by
+    Tour.iter_packed_chunks, and a byte each otherwise, by
+    Tour.iter_move_chunks. Write the bytes they fill on their own into the
+    log at path, starting at offset, and return the bytes they only fill
+    half of, at their start and at their end, or None for each they don't.
+    REQ: the sub-tower has at least one move
+    REQ: every stool in stools is below 4 if nibbles, or below 16
+    '''
+    path, offset, num_cheese, stools, nibbles, position = job
+    first = None
+    last = None
+    if (nibbles):
+        odd = position & 1 == 1
+        data = memoryview(b''.join(iter_packed_chunks(
+            num_cheese, len(stools), stools, odd)))
+        if (odd):
+            first = data[0]
+            data = data[1:]
+            offset += 1
+        if ((position + frame_stewart_moves(num_cheese, len(stools))) & 1 ==
+                1):
+            last = data[-1]
+            data = data[:-1]
+    else:
+        data = b''.join(iter_move_chunks(num_cheese, len(stools), stools))
+    log = os.open(path, os.O_WRONLY)
+    try:
+        _write_at(log, data, offset)
+    finally:
+        os.close(log)
+    return (first, last)
+
+
+def write_move_log(path: str, num_cheese: int, num_stools: int,
+                   workers: int=1) -> int:
+    '''
+    (str, int, int, int) -> int
+    Write the Frame-Stewart solution that takes num_cheese cheeses from the
+    first of num_stools stools to the last to a move log at path, straight
+    from Tour.iter_packed_chunks, and return its number of moves. With
+    more than one worker, it is written by a pool of that many processes,
+    as MoveLogWriter.write_solution does.
+    REQ: num_cheese >= 0 and 3 <= num_stools <= 16
+    REQ: workers >= 1
+    '''
+    with MoveLogWriter(path, num_cheese, num_stools) as writer:
+        writer.write_solution(workers)
+    return writer.length()
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Write the solution of a game to a move log.")
+    parser.add_argument('path')
+    parser.add_argument('cheeses', type=int)
+    parser.add_argument('stools', type=int)
+    parser.add_argument('--workers', type=int, default=1,
+                        help="processes packing the moves (default 1)")
+    args = parser.parse_args()
+    start_time = time.perf_counter()
+    moves = write_move_log(args.path, args.cheeses, args.stools,
+                           args.workers)
+    seconds = time.perf_counter() - start_time
+    size = os.path.getsize(args.path)
+    print(moves, 'moves,', size, 'bytes in', format(seconds, '.2f'), 's,',
+          format(size / seconds / 1e6, '.0f'), 'MB/s')
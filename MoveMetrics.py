@@ -0,0 +1,200 @@
+"""
+MoveMetrics: Count and time the moves made on a TOAHModel.
+
+MoveObserver: Something that is told about every move made on a model
+MoveMetrics: MoveObserver that keeps counters, timings and stool traffic
+
+Attach an observer with TOAHModel.attach_observer. Only models with an
+observer attached pay for the reporting:
+
+    >>> from TOAHModel import TOAHModel, IllegalMoveError
+    >>> model = TOAHModel(3)
+    >>> model.fill_first_stool(2)
+    >>> metrics = MoveMetrics()
+    >>> model.attach_observer(metrics)
+    >>> model.move(0, 1)
+    >>> try:
+    ...     model.move(0, 1)
+    ... except IllegalMoveError:
+    ...     pass
+    >>> metrics.number_of_moves(), metrics.illegal_moves()
+    (1, {'Impossible to stack a larger cheese on top.': 1})
+"""
+
+import time
+
+# Latencies are counted in buckets of powers of two nanoseconds: bucket b
+# holds the moves that took fewer than 2 ** b nanoseconds, and at least half
+# that
+_BUCKETS = 48
+
+
+class MoveObserver:
+    """Something that is told about every move made on a TOAHModel it is
+    attached to. The methods here do nothing; override the ones you need.
+    """
+
+    def moved(self: 'MoveObserver', model, curr_stool: int, dest_stool: int,
+              check_ns: int, apply_ns: int):
+        '''
+        (MoveObserver, TOAHModel, int, int, int, int) -> NoneType
+        React to a cheese moved from curr_stool to dest_stool in model,
+        after check_ns nanoseconds spent checking that the move is legal,
+        and apply_ns making and recording it.
+        '''
+        pass
+
+    def illegal_move(self: 'MoveObserver', model, curr_stool: int,
+                     dest_stool: int, error: Exception, check_ns: int):
+        '''
+        (MoveObserver, TOAHModel, int, int, IllegalMoveError, int) -> NoneType
+        React to an attempt to move a cheese from curr_stool to dest_stool
+        in model, which check_ns nanoseconds of checking found to be
+        illegal because of error.
+        '''
+        pass
+
+
+class MoveMetrics(MoveObserver):
+    """Counters of the moves made on the models this is attached to: how
+    many moves, how many illegal moves for each reason, the time spent
+    checking and recording them, a histogram of how long moves took, and
+    how many cheeses left and arrived at each stool.
+    """
+
+    def __init__(self: 'MoveMetrics'):
+        '''
+        (MoveMetrics) -> NoneType
+        Create MoveMetrics with every counter at 0.
+        '''
+        # REPRESENTATION INVARIANT
+        # self._moves is the number of legal moves seen
+        # self._illegal maps the message of each IllegalMoveError seen to
+        # how many times it was seen
+        # self._check_ns and self._apply_ns are the total nanoseconds spent
+        # checking moves (legal or not) and making legal ones
+        # self._latencies[b] is the number of legal moves that took fewer
+        # than 2 ** b nanoseconds in all, and at least 2 ** (b - 1)
+        # self._departures[s] and self._arrivals[s] are the numbers of
+        # cheeses moved off and onto stool s
+        # self._first and self._last are time.perf_counter() at the first
+        # and latest legal move, or None before any
+        self._moves = 0
+        self._illegal = {}
+        self._check_ns = 0
+        self._apply_ns = 0
+        self._latencies = [0] * _BUCKETS
+        self._departures = []
+        self._arrivals = []
+        self._first = None
+        self._last = None
+
+    def moved(self: 'MoveMetrics', model, curr_stool: int, dest_stool: int,
+              check_ns: int, apply_ns: int):
+        self._moves += 1
+        self._check_ns += check_ns
+        self._apply_ns += apply_ns
+        self._latencies[min((check_ns + apply_ns).bit_length(),
+                            _BUCKETS - 1)] += 1
+        # Make room for every stool of the model
+        if (len(self._departures) < model.number_of_stools()):
+            extra = model.number_of_stools() - len(self._departures)
+            self._departures.extend([0] * extra)
+            self._arrivals.extend([0] * extra)
+        self._departures[curr_stool] += 1
+        self._arrivals[dest_stool] += 1
+        self._last = time.perf_counter()
+        if (self._first is None):
+            self._first = self._last
+
+    def illegal_move(self: 'MoveMetrics', model, curr_stool: int,
+                     dest_stool: int, error: Exception, check_ns: int):
+        reason = str(error)
+        self._illegal[reason] = self._illegal.get(reason, 0) + 1
+        self._check_ns += check_ns
+
+    def number_of_moves(self: 'MoveMetrics') -> int:
+        '''
+        (MoveMetrics) -> int
+        Return the number of legal moves seen.
+        '''
+        return self._moves
+
+    def illegal_moves(self: 'MoveMetrics') -> dict:
+        '''
+        (MoveMetrics) -> dict of {str: int}
+        Return how many illegal moves were seen for each reason.
+        '''
+        return dict(self._illegal)
+
+    def moves_per_second(self: 'MoveMetrics') -> float:
+        '''
+        (MoveMetrics) -> float
+        Return the rate of legal moves between the first and the latest one.
+        '''
+        result = 0.0
+        if (self._moves > 1 and self._last > self._first):
+            result = (self._moves - 1) / (self._last - self._first)
+        return result
+
+    def stool_traffic(self: 'MoveMetrics') -> list:
+        '''
+        (MoveMetrics) -> list of (int, int)
+        Return (cheeses moved off, cheeses moved onto) for every stool.
+        '''
+        return list(zip(self._departures, self._arrivals))
+
+    def latency_percentile(self: 'MoveMetrics', fraction: float) -> int:
+        '''
+        (MoveMetrics) -> int
+        Return an upper bound, in nanoseconds, on how long the fastest
+        fraction of legal moves took: the top of the histogram bucket
+        holding that percentile.
+        REQ: 0 < fraction <= 1
+        '''
+        wanted = fraction * self._moves
+        seen = 0
+        bucket = 0
+        while (bucket < _BUCKETS - 1 and
+               seen + self._latencies[bucket] < wanted):
+            seen += self._latencies[bucket]
+            bucket += 1
+        return 1 << bucket
+
+    def summary(self: 'MoveMetrics') -> dict:
+        '''
+        (MoveMetrics) -> dict
+        Return every metric in a dict, e.g. to store as JSON.
+        '''
+        return {'moves': self._moves,
+                'illegal_moves': self.illegal_moves(),
+                'moves_per_second': self.moves_per_second(),
+                'check_seconds': self._check_ns / 1e9,
+                'apply_seconds': self._apply_ns / 1e9,
+                'p50_ns': self.latency_percentile(0.5),
+                'p99_ns': self.latency_percentile(0.99),
+                'stool_traffic': self.stool_traffic()}
+
+    def __str__(self: 'MoveMetrics') -> str:
+        """
+        (MoveMetrics) -> str
+        Describe the metrics in a few lines of text.
+        """
+        lines = [str(self._moves) + ' moves, ' +
+                 format(self.moves_per_second(), '.0f') + ' per second',
+                 'checking: ' + format(self._check_ns / 1e6, '.3f') +
+                 ' ms, moving and recording: ' +
+                 format(self._apply_ns / 1e6, '.3f') + ' ms',
+                 'latency p50 < ' + str(self.latency_percentile(0.5)) +
+                 ' ns, p99 < ' + str(self.latency_percentile(0.99)) + ' ns']
+        for (reason, count) in sorted(self._illegal.items()):
+            lines.append('illegal: ' + reason + ' x' + str(count))
+        for (stool, (off, on)) in enumerate(self.stool_traffic()):
+            lines.append('stool ' + str(stool) + ': ' + str(off) + ' off, ' +
+                         str(on) + ' on')
+        return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod(verbose=True)
@@ -0,0 +1,181 @@
+"""
+MoveVerifier: Check many submitted solutions of Towers of Anne Hoy quickly.
+
+verify_moves: Check one sequence of moves and return a VerificationReport
+verify_many: Check many sequences of moves across a pool of processes
+VerificationReport: Result of checking one sequence of moves
+
+Moves are replayed on plain lists of cheese sizes instead of a TOAHModel,
+so no Cheese objects or exceptions are involved while checking.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from TOAHModel import MoveSequence
+from Tour import frame_stewart_moves
+import os
+
+# Below this many submissions, verify_many doesn't start any processes
+_MIN_PARALLEL_SUBMISSIONS = 8
+
+
+class VerificationReport:
+    """The result of checking one sequence of moves.
+
+    legal - whether every move in the sequence was legal
+    solved - whether the sequence ended with every cheese on the
+             destination stool
+    number_of_moves - number of moves applied, not counting an illegal one
+    optimal_moves - number of moves in the Frame-Stewart solution
+    illegal_index - index of the first illegal move, or None
+    reason - why the move at illegal_index is illegal, or None
+    """
+
+    def __init__(self: 'VerificationReport', legal: bool, solved: bool,
+                 number_of_moves: int, optimal_moves: int,
+                 illegal_index: int=None, reason: str=None):
+        '''
+        (VerificationReport, bool, bool, int, int, int, str) -> NoneType
+        Create a report on one sequence of moves.
+        REQ: legal is True iff illegal_index is None
+        '''
+        self.legal = legal
+        self.solved = solved
+        self.number_of_moves = number_of_moves
+        self.optimal_moves = optimal_moves
+        self.illegal_index = illegal_index
+        self.reason = reason
+
+    def is_optimal(self: 'VerificationReport') -> bool:
+        '''
+        (VerificationReport) -> bool
+        Return whether the sequence solved the game in the number of moves of
+        the Frame-Stewart solution (or fewer).
+        REQ: None
+        '''
+        return self.solved and self.number_of_moves <= self.optimal_moves
+
+    def as_dict(self: 'VerificationReport') -> dict:
+        '''
+        (VerificationReport) -> dict
+        Return the fields of this report as a dict, e.g. to store as JSON.
+        REQ: None
+        '''
+        return {'legal': self.legal, 'solved': self.solved,
+                'optimal': self.is_optimal(),
+                'number_of_moves': self.number_of_moves,
+                'optimal_moves': self.optimal_moves,
+                'illegal_index': self.illegal_index, 'reason': self.reason}
+
+    def __repr__(self: 'VerificationReport') -> str:
+        return ("VerificationReport(legal=" + repr(self.legal) +
+                ", solved=" + repr(self.solved) +
+                ", number_of_moves=" + repr(self.number_of_moves) +
+                ", optimal_moves=" + repr(self.optimal_moves) +
+                ", illegal_index=" + repr(self.illegal_index) +
+                ", reason=" + repr(self.reason) + ")")
+
+
+def _move_pairs(moves):
+    '''
+    (MoveSequence or list of (int, int) or list of int) -> iterable
+    Return the (origin, destination) pairs in moves. A flat sequence of
+    integers is read as origin, destination, origin, destination, ...
+    REQ: a flat sequence of integers has an even length
+    '''
+    if (isinstance(moves, MoveSequence)):
+        result = iter(moves)
+    elif (len(moves) != 0 and isinstance(moves[0], int)):
+        # Pair up consecutive integers
+        flat = iter(moves)
+        result = zip(flat, flat)
+    else:
+        result = moves
+    return result
+
+
+def verify_moves(moves, number_of_cheeses: int, number_of_stools: int,
+                 dest_stool: int=-1) -> VerificationReport:
+    '''
+    (MoveSequence or list, int, int, int) -> VerificationReport
+    Replay moves on a game that starts with number_of_cheeses cheeses on
+    the first of number_of_stools stools, stopping at the first illegal move,
+    and report whether they move every cheese to dest_stool (the last stool
+    by default) in as few moves as the Frame-Stewart solution.
+    moves can be a MoveSequence, a list of (origin, destination) pairs, or a
+    flat list or array of integers.
+    REQ: number_of_cheeses > 0 and number_of_stools >= 3
+    >>> verify_moves([(0, 1), (0, 2), (1, 2)], 2, 3)
+    VerificationReport(legal=True, solved=True, number_of_moves=3, \
+optimal_moves=3, illegal_index=None, reason=None)
+    >>> verify_moves([0, 2, 0, 2], 2, 3).reason
+    'Impossible to stack a larger cheese on top.'
+    '''
+    # Each stool is a list of the sizes on it, from the bottom up
+    stools = [[] for i in range(number_of_stools)]
+    stools[0].extend(range(number_of_cheeses, 0, -1))
+    illegal_index = None
+    reason = None
+    count = 0
+    for (src, dest) in _move_pairs(moves):
+        # Check the same things as TOAHModel.move, in the same order
+        if (src < 0 or dest < 0 or src >= number_of_stools or
+                dest >= number_of_stools):
+            reason = "Invalid stool index."
+        else:
+            origin = stools[src]
+            target = stools[dest]
+            if (origin == []):
+                reason = "There is no cheese to be moved."
+            elif (target != [] and origin[-1] >= target[-1]):
+                reason = "Impossible to stack a larger cheese on top."
+            else:
+                target.append(origin.pop())
+                count += 1
+        # Stop at the first illegal move
+        if (reason is not None):
+            illegal_index = count
+            break
+    solved = (reason is None and
+              len(stools[dest_stool]) == number_of_cheeses)
+    return VerificationReport(reason is None, solved, count,
+                              frame_stewart_moves(number_of_cheeses,
+                                                  number_of_stools),
+                              illegal_index, reason)
+
+
+def _verify_job(job):
+    '''
+    (tuple) -> VerificationReport
+    Unpack the arguments of verify_moves sent to a worker process.
+    '''
+    return verify_moves(*job)
+
+
+def verify_many(submissions, number_of_cheeses: int, number_of_stools: int,
+                dest_stool: int=-1, workers: int=None) -> list:
+    '''
+    (list, int, int, int, int) -> list of VerificationReport
+    Check every sequence of moves in submissions as verify_moves does, and
+    return their reports in the same order. The submissions are split
+    between workers processes (one per CPU by default).
+    REQ: every submission can be pickled, e.g. not a generator
+    REQ: number_of_cheeses > 0 and number_of_stools >= 3
+    '''
+    if (workers is None):
+        workers = os.cpu_count() or 1
+    jobs = [(moves, number_of_cheeses, number_of_stools, dest_stool)
+            for moves in submissions]
+    # Starting processes costs more than checking a few submissions
+    if (workers <= 1 or len(jobs) < _MIN_PARALLEL_SUBMISSIONS):
+        result = [_verify_job(job) for job in jobs]
+    else:
+        # Send the jobs in batches, a few per worker, to cut the messaging
+        chunksize = max(1, len(jobs) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            result = list(pool.map(_verify_job, jobs, chunksize=chunksize))
+    return result
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod(verbose=True)
@@ -0,0 +1,334 @@
+"""
+PatternDatabase: Precomputed distance tables that make TOAHSearch practical
+for games with 4 or more stools.
+
+build_pattern_database: Write the distance table for a number of cheeses
+PatternDatabase: A distance table file, read through a memory map
+PatternHeuristic: Lower bound on the moves left, for TOAHSearch.solve
+pattern_heuristic: PatternHeuristic backed by cached table files
+solve: TOAHSearch.solve using pattern_heuristic
+
+A table for g cheeses and k stools holds, for every one of the k ** g
+configurations of g cheeses, the least number of moves that puts all of
+them on the last stool. The cheeses of a bigger game are split into
+disjoint groups: looking only at the cheeses of one group, every move of
+the game is either a legal move of that group's smaller game or doesn't
+move any of its cheeses. So the distances of the groups can be added up
+and still never overestimate the real number of moves.
+"""
+
+from TOAHSearch import _bits_per_cheese, solve as _solve
+import mmap
+import os
+import struct
+import time
+
+# Every table file starts with this header: a magic string, then the
+# number of stools and cheeses it is for
+_MAGIC = b'TOAHPDB1'
+_HEADER = struct.Struct('<8sHH4x')
+# Distances are stored in a byte each; _UNSEEN marks configurations the
+# builder hasn't reached yet, and longer distances are stored as _FARTHEST,
+# which is still a lower bound
+_UNSEEN = 255
+_FARTHEST = 254
+# Tables are kept to at most this many entries when picking group sizes
+_MAX_ENTRIES = 1 << 20
+# Where pattern_heuristic keeps the table files by default
+DEFAULT_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 'pattern_databases')
+
+
+def _table_path(directory, num_cheese, num_stools):
+    '''
+    (str, int, int) -> str
+    Return the path of the table file for num_cheese cheeses and num_stools
+    stools in directory.
+    '''
+    return os.path.join(directory, 'pdb_' + str(num_stools) + 'x' +
+                        str(num_cheese) + '.bin')
+
+
+def build_pattern_database(num_cheese: int, num_stools: int,
+                           path: str) -> dict:
+    '''
+    (int, int, str) -> dict
+    Compute the distance to the last stool of every configuration of
+    num_cheese cheeses on num_stools stools with a breadth-first search
+    backwards from the goal, and write the table to path.
+    Return a report with the build time in seconds, the file size in bytes,
+    the number of entries and the largest distance.
+    The entry of a configuration is at sum(stool[i] * num_stools ** i),
+    where stool[i] is the stool of the cheese of size i + 1.
+    REQ: num_cheese >= 1 and num_stools >= 3
+    '''
+    start_time = time.perf_counter()
+    powers = [num_stools ** size for size in range(num_cheese)]
+    distances = bytearray([_UNSEEN]) * (num_stools ** num_cheese)
+    goal = (num_stools - 1) * sum(powers)
+    distances[goal] = 0
+    frontier = [goal]
+    level = 0
+    # Moves can be undone, so the distance from the goal is the distance to
+    # it
+    while (frontier != []):
+        level += 1
+        stored = min(level, _FARTHEST)
+        next_frontier = []
+        for index in frontier:
+            # The smallest cheese on each stool is its top one
+            tops = [-1] * num_stools
+            left = num_stools
+            rest = index
+            size = 0
+            while (left > 0 and size < num_cheese):
+                stool = rest % num_stools
+                rest //= num_stools
+                if (tops[stool] < 0):
+                    tops[stool] = size
+                    left -= 1
+                size += 1
+            for src in range(num_stools):
+                top = tops[src]
+                if (top >= 0):
+                    for dest in range(num_stools):
+                        if (dest != src and
+                                (tops[dest] < 0 or tops[dest] > top)):
+                            after = index + (dest - src) * powers[top]
+                            if (distances[after] == _UNSEEN):
+                                distances[after] = stored
+                                next_frontier.append(after)
+        frontier = next_frontier
+    # Write to a temporary name first, so a half written file is never used
+    directory = os.path.dirname(path)
+    if (directory != ''):
+        os.makedirs(directory, exist_ok=True)
+    with open(path + '.tmp', 'wb') as table:
+        table.write(_HEADER.pack(_MAGIC, num_stools, num_cheese))
+        table.write(distances)
+    os.replace(path + '.tmp', path)
+    return {'cheeses': num_cheese, 'stools': num_stools,
+            'entries': len(distances), 'max_distance': level - 1,
+            'build_seconds': time.perf_counter() - start_time,
+            'file_bytes': os.path.getsize(path)}
+
+
+class PatternDatabase:
+    """A distance table written by build_pattern_database.
+
+    The file is memory mapped, so the operating system only reads the parts
+    that are looked up, and shares them between every process using it.
+    """
+
+    def __init__(self: 'PatternDatabase', path: str):
+        '''
+        (PatternDatabase, str) -> NoneType
+        Open the table file at path.
+        REQ: path was written by build_pattern_database
+        '''
+        # REPRESENTATION INVARIANT
+        # self._file is the open table file, and self._map maps all of it
+        # self._number_of_stools and self._number_of_cheeses are the sizes
+        # of the game the table is for, read from its header
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, stools, cheeses = _HEADER.unpack_from(self._map, 0)
+        if (magic != _MAGIC or
+                len(self._map) != _HEADER.size + stools ** cheeses):
+            self.close()
+            raise ValueError(path + " is not a pattern database.")
+        self._number_of_stools = stools
+        self._number_of_cheeses = cheeses
+
+    def number_of_stools(self: 'PatternDatabase') -> int:
+        return self._number_of_stools
+
+    def number_of_cheeses(self: 'PatternDatabase') -> int:
+        return self._number_of_cheeses
+
+    def lookup(self: 'PatternDatabase', index: int) -> int:
+        '''
+        (PatternDatabase, int) -> int
+        Return the distance stored for the configuration at index.
+        REQ: 0 <= index < number_of_stools ** number_of_cheeses
+        '''
+        return self._map[_HEADER.size + index]
+
+    def distance(self: 'PatternDatabase', locations: list) -> int:
+        '''
+        (PatternDatabase, list of int) -> int
+        Return the least number of moves that puts every cheese on the last
+        stool, where the cheese of size i + 1 starts on stool locations[i].
+        REQ: len(locations) == number_of_cheeses
+        '''
+        index = 0
+        for size in range(len(locations) - 1, -1, -1):
+            index = index * self._number_of_stools + locations[size]
+        return self.lookup(index)
+
+    def close(self: 'PatternDatabase'):
+        self._map.close()
+        self._file.close()
+
+
+class PatternHeuristic:
+    """A lower bound on the moves left to put every cheese on one stool,
+    adding up pattern database distances of disjoint groups of cheeses.
+
+    Instances are called with a configuration encoded by
+    TOAHSearch.encode_state, so they can be given to TOAHSearch.solve.
+    """
+
+    def __init__(self: 'PatternHeuristic', groups: list, databases: list,
+                 num_stools: int, goal_stool: int):
+        '''
+        (PatternHeuristic, list of list of int, list of PatternDatabase, int,
+         int) -> NoneType
+        Create a heuristic for moving every cheese to goal_stool, where
+        groups[j] lists the sizes - 1 of the cheeses looked up in
+        databases[j], smallest first.
+        REQ: the groups don't share cheeses
+        REQ: databases[j] is for len(groups[j]) cheeses and num_stools stools
+        '''
+        bits = _bits_per_cheese(num_stools)
+        # The tables are for the last stool, so swap it with goal_stool
+        relabel = list(range(1 << bits))
+        relabel[goal_stool], relabel[num_stools - 1] = (
+            relabel[num_stools - 1], relabel[goal_stool])
+        self._relabel = relabel
+        self._mask = (1 << bits) - 1
+        # For each group, the table and the (bit shift, place value) of each
+        # of its cheeses, largest first
+        self._groups = []
+        for (group, database) in zip(groups, databases):
+            places = [(bits * size, num_stools ** place)
+                      for (place, size) in enumerate(group)]
+            places.reverse()
+            self._groups.append((database, places))
+
+    def __call__(self: 'PatternHeuristic', state: int) -> int:
+        result = 0
+        relabel = self._relabel
+        mask = self._mask
+        for (database, places) in self._groups:
+            index = 0
+            for (shift, value) in places:
+                index += relabel[(state >> shift) & mask] * value
+            result += database.lookup(index)
+        return result
+
+
+def default_group_size(num_stools: int) -> int:
+    '''
+    (int) -> int
+    Return the most cheeses a table for num_stools stools can hold
+    without going over _MAX_ENTRIES entries.
+    REQ: num_stools >= 3
+    '''
+    result = 1
+    while (num_stools ** (result + 1) <= _MAX_ENTRIES):
+        result += 1
+    return result
+
+
+def open_pattern_database(num_cheese: int, num_stools: int,
+                          directory: str=DEFAULT_DIRECTORY) -> \
+        PatternDatabase:
+    '''
+    (int, int, str) -> PatternDatabase
+    Return the table for num_cheese cheeses and num_stools stools in
+    directory, building and saving it first if it isn't there yet.
+    REQ: num_cheese >= 1 and num_stools >= 3
+    '''
+    path = _table_path(directory, num_cheese, num_stools)
+    if (not os.path.exists(path)):
+        build_pattern_database(num_cheese, num_stools, path)
+    return PatternDatabase(path)
+
+
+def pattern_heuristic(num_cheese: int, num_stools: int, goal_stool: int=-1,
+                      directory: str=DEFAULT_DIRECTORY,
+                      group_size: int=None) -> PatternHeuristic:
+    '''
+    (int, int, int, str, int) -> PatternHeuristic
+    Return a heuristic for moving num_cheese cheeses to goal_stool (the last
+    stool by default), splitting the cheeses into groups of at most
+    group_size cheeses. The largest cheeses get the biggest group, since
+    their distances are the largest. Tables are read from, or saved to,
+    directory.
+    REQ: num_cheese >= 1 and num_stools >= 3
+    '''
+    if (group_size is None):
+        group_size = default_group_size(num_stools)
+    goal_stool %= num_stools
+    groups = []
+    databases = []
+    top = num_cheese
+    while (top > 0):
+        bottom = max(0, top - group_size)
+        groups.append(list(range(bottom, top)))
+        databases.append(open_pattern_database(top - bottom, num_stools,
+                                               directory))
+        top = bottom
+    return PatternHeuristic(groups, databases, num_stools, goal_stool)
+
+
+def solve(model, goal_stool: int=-1, directory: str=DEFAULT_DIRECTORY,
+          group_size: int=None, max_states: int=None):
+    '''
+    (TOAHModel, int, str, int, int) -> MoveSequence
+    Return a shortest MoveSequence that puts every cheese of model on
+    goal_stool (the last stool by default), using TOAHSearch.solve with a
+    pattern_heuristic.
+    REQ: the cheeses in model have sizes 1 to number_of_cheeses
+    '''
+    num_stools = model.number_of_stools()
+    goal = [goal_stool % num_stools] * model.number_of_cheeses()
+    heuristic = pattern_heuristic(model.number_of_cheeses(), num_stools,
+                                  goal_stool, directory, group_size)
+    if (max_states is None):
+        result = _solve(model, goal, heuristic)
+    else:
+        result = _solve(model, goal, heuristic, max_states)
+    return result
+
+
+def measure_lookups(database: PatternDatabase, count: int=1000000) -> float:
+    '''
+    (PatternDatabase, int) -> float
+    Return how many lookups per second database answers, timing count
+    lookups spread over the whole table.
+    REQ: count > 0
+    '''
+    entries = database.number_of_stools() ** database.number_of_cheeses()
+    # Step through the table by a large odd stride to avoid cache luck
+    stride = 2654435761 % entries or 1
+    lookup = database.lookup
+    index = 0
+    start_time = time.perf_counter()
+    for i in range(count):
+        lookup(index)
+        index = (index + stride) % entries
+    return count / (time.perf_counter() - start_time)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Build pattern databases and report on them.")
+    parser.add_argument('stools', type=int, nargs='+',
+                        help="numbers of stools to build tables for")
+    parser.add_argument('--cheeses', type=int, default=None,
+                        help="cheeses per table (default: as many as fit)")
+    parser.add_argument('--directory', default=DEFAULT_DIRECTORY)
+    args = parser.parse_args()
+    for stools in args.stools:
+        cheeses = args.cheeses or default_group_size(stools)
+        path = _table_path(args.directory, cheeses, stools)
+        report = build_pattern_database(cheeses, stools, path)
+        database = PatternDatabase(path)
+        report['lookups_per_second'] = measure_lookups(database)
+        database.close()
+        print(path)
+        for key in sorted(report):
+            print('   ', key + ':', report[key])
@@ -0,0 +1,209 @@
+"""
+Snapshot: Save a game of Towers of Anne Hoy and load it back without
+replaying its moves.
+
+snapshot: Return the snapshot of a model, as bytes
+restore: Rebuild a model from a snapshot
+save_snapshot: Write the snapshot of a model to a file
+load_snapshot: Rebuild a model from a snapshot file
+
+A snapshot starts with a 32-byte header: the magic string b'TOAHSNP1',
+the number of stools and cheeses (4 bytes each, little endian), the number
+of moves the model counts (8 bytes), and the number of moves in the
+history that follows, or _NO_HISTORY if it was left out (8 bytes). Next
+comes the index of the stool each cheese is on, smallest first, a byte
+each (2 bytes with more than 256 stools), and last the history, packed as
+PackedMoveSequence packs it (or as pairs of 2-byte stool indexes with more
+than 16 stools). Loading puts every cheese straight on its stool, so it
+takes time for the cheeses and for copying the packed history, but none
+for its moves:
+
+    >>> from TOAHModel import TOAHModel
+    >>> model = TOAHModel(3)
+    >>> model.fill_first_stool(3)
+    >>> model.move(0, 2)
+    >>> model.move(0, 1)
+    >>> copy = restore(snapshot(model))
+    >>> copy.stool_assignment(), copy.number_of_moves()
+    ([2, 1, 0], 2)
+    >>> copy.get_move_seq()
+    PackedMoveSequence(3, [(0, 2), (0, 1)])
+"""
+
+from TOAHModel import (TOAHModel, MoveSequence, PackedMoveSequence,
+                       _PACKED_MAX_STOOLS, _NIBBLE_MAX_STOOLS, _invalid_codes)
+from array import array
+from itertools import chain
+import struct
+import sys
+
+_MAGIC = b'TOAHSNP1'
+_HEADER = struct.Struct('<8sIIQQ')
+# The history length in the header of a snapshot without the history
+_NO_HISTORY = (1 << 64) - 1
+# The most stools whose indexes fit in a byte
+_BYTE_MAX_STOOLS = 256
+# Moves of a packed history checked at a time
+_CHECK_MOVES = 1 << 20
+
+
+def _little_endian(numbers: array) -> bytes:
+    '''
+    (array) -> bytes
+    Return the bytes of numbers, little endian.
+    '''
+    if (sys.byteorder != 'little'):
+        numbers = array(numbers.typecode, numbers)
+        numbers.byteswap()
+    return numbers.tobytes()
+
+
+def _from_little_endian(typecode: str, data) -> array:
+    '''
+    (str, bytes-like) -> array
+    Return the array of typecode numbers stored little endian in data.
+    '''
+    result = array(typecode)
+    result.frombytes(data)
+    if (sys.byteorder != 'little'):
+        result.byteswap()
+    return result
+
+
+def _check_packed(moves: PackedMoveSequence):
+    '''
+    (PackedMoveSequence) -> NoneType
+    Raise ValueError if a move in moves isn't between two different stools
+    of its game.
+    '''
+    invalid = _invalid_codes(moves.number_of_stools())
+    length = moves.length()
+    for start in range(0, length, _CHECK_MOVES):
+        codes = moves.codes(start, min(start + _CHECK_MOVES, length))
+        if (len(codes.translate(None, invalid)) != len(codes)):
+            raise ValueError("The snapshot has a move that isn't between "
+                             "two different stools.")
+
+
+def snapshot(model: TOAHModel, history: bool=True) -> bytes:
+    '''
+    (TOAHModel, bool) -> bytes
+    Return the snapshot of model: where its cheeses are, its number of
+    moves, and if history, the moves it made.
+    REQ: the cheeses of model have sizes 1 to number_of_cheeses
+    REQ: model has at most 65536 stools
+    '''
+    number_of_stools = model.number_of_stools()
+    locations = model.stool_assignment()
+    if (number_of_stools <= _BYTE_MAX_STOOLS):
+        parts = [bytes(locations)]
+    else:
+        parts = [_little_endian(array('H', locations))]
+    length = _NO_HISTORY
+    if (history):
+        moves = model.get_move_seq()
+        length = moves.length()
+        if (isinstance(moves, PackedMoveSequence)):
+            parts.append(moves.to_bytes())
+        else:
+            parts.append(_little_endian(array('H',
+                                              chain.from_iterable(moves))))
+    parts.insert(0, _HEADER.pack(_MAGIC, number_of_stools,
+                                 model.number_of_cheeses(),
+                                 model.number_of_moves(), length))
+    return b''.join(parts)
+
+
+def restore(data, model: TOAHModel=None,
+            model_class: type=TOAHModel) -> TOAHModel:
+    '''
+    (bytes-like, TOAHModel, type) -> TOAHModel
+    Return model with the state saved in the snapshot data, or if model is
+    None, a new model_class model with it. Without a history in data, the
+    model's history is empty, but it still counts the saved number of moves.
+    Raise ValueError, leaving model as it was, if data isn't a whole
+    snapshot of a game that can be played.
+    REQ: model has the number of stools and cheeses of the snapshot, with
+         sizes 1 to number_of_cheeses
+    '''
+    if (len(data) < _HEADER.size):
+        raise ValueError("Not a snapshot.")
+    (magic, number_of_stools, number_of_cheeses, number_of_moves,
+     length) = _HEADER.unpack_from(data, 0)
+    if (magic != _MAGIC):
+        raise ValueError("Not a snapshot.")
+    data = memoryview(data)[_HEADER.size:]
+    # Each cheese's stool
+    if (number_of_stools <= _BYTE_MAX_STOOLS):
+        size = number_of_cheeses
+        locations = list(data[:size])
+    else:
+        size = 2 * number_of_cheeses
+        locations = list(_from_little_endian('H', data[:size]))
+    history = data[size:]
+    if (len(locations) != number_of_cheeses):
+        raise ValueError("The snapshot is cut short.")
+    if (locations != [] and max(locations) >= number_of_stools):
+        raise ValueError("The snapshot has a cheese on a stool that doesn't "
+                         "exist.")
+    if (model is None):
+        model = model_class(number_of_stools)
+        model.fill_first_stool(number_of_cheeses)
+    elif (model.number_of_stools() != number_of_stools or
+            model.number_of_cheeses() != number_of_cheeses):
+        raise ValueError("The snapshot is of a game with " +
+                         str(number_of_cheeses) + " cheeses and " +
+                         str(number_of_stools) + " stools.")
+    # Read the history the way model records it
+    if (number_of_stools <= _PACKED_MAX_STOOLS):
+        moves = PackedMoveSequence(number_of_stools)
+        if (length != _NO_HISTORY):
+            if (len(history) < ((length + 1) >> 1
+                                 if number_of_stools <= _NIBBLE_MAX_STOOLS
+                                 else length)):
+                raise ValueError("The snapshot is cut short.")
+            moves = PackedMoveSequence.from_bytes(number_of_stools, history,
+                                                  length)
+            _check_packed(moves)
+    else:
+        moves = MoveSequence([])
+        if (length != _NO_HISTORY):
+            if (len(history) < 4 * length):
+                raise ValueError("The snapshot is cut short.")
+            numbers = _from_little_endian('H', history[:4 * length])
+            if (length != 0 and max(numbers) >= number_of_stools):
+                raise ValueError("The snapshot has a move that isn't "
+                                 "between two different stools.")
+            moves = MoveSequence(list(zip(numbers[0::2], numbers[1::2])))
+    history.release()
+    data.release()
+    model.load_state(locations, moves, number_of_moves)
+    return model
+
+
+def save_snapshot(model: TOAHModel, path: str, history: bool=True):
+    '''
+    (TOAHModel, str, bool) -> NoneType
+    Write the snapshot of model, with its moves if history, to the file at
+    path, replacing it.
+    REQ: as for snapshot
+    '''
+    with open(path, 'wb') as output:
+        output.write(snapshot(model, history))
+
+
+def load_snapshot(path: str, model: TOAHModel=None,
+                  model_class: type=TOAHModel) -> TOAHModel:
+    '''
+    (str, TOAHModel, type) -> TOAHModel
+    Return model, or a new model_class model, with the state saved in the
+    snapshot file at path, as restore does.
+    REQ: as for restore
+    '''
+    with open(path, 'rb') as saved:
+        return restore(saved.read(), model, model_class)
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod(verbose=True)
@@ -1,13 +1,175 @@
 """
 TOAHModel:  Model a game of Towers of Anne Hoy
+CompactTOAHModel: TOAHModel that stores cheeses as sizes in flat arrays
 Cheese:   Model a cheese with a given (relative) size
 IllegalMoveError: Type of exceptions thrown when an illegal move is attempted
 MoveSequence: Record of a sequence of (not necessarily legal) moves. You will
 need to return MoveSequence object after solving an instance of the 4-stool
 Towers of Anne Hoy game, and we will use that to check the correctness of your
 algorithm.
+PackedMoveSequence: MoveSequence that stores each move in a byte or less
+RecursiveMoveSequence: MoveSequence stored as the rules of a grammar that
+generates its moves, such as the recursion of an optimal solution
 """
 
+from array import array
+from bisect import bisect_right
+from itertools import chain, islice
+from time import perf_counter_ns
+
+# Moves between the checkpoints a model keeps of its state, by default
+DEFAULT_CHECKPOINT_INTERVAL = 1024
+
+# Stool index stored for a cheese size that isn't in a CompactTOAHModel
+_NOWHERE = 255
+# The most stools a PackedMoveSequence can record, and the most for which
+# it packs two moves into each byte
+_PACKED_MAX_STOOLS = 16
+_NIBBLE_MAX_STOOLS = 4
+# Decoding tables for PackedMoveSequence: the move stored in a whole byte,
+# the move stored in a nibble, and the two moves stored in a byte of nibbles
+_BYTE_MOVES = tuple((code >> 4, code & 15) for code in range(256))
+_NIBBLE_MOVES = tuple((code >> 2, code & 3) for code in range(16))
+_NIBBLE_PAIRS = tuple((_NIBBLE_MOVES[code >> 4], _NIBBLE_MOVES[code & 15])
+                      for code in range(256))
+# Tables turning moves packed one per byte, (src << 4) | dest, into the high
+# and the low nibble of a byte, and turning a byte of nibbles back into its
+# first and its second move packed one per byte
+_HIGH_NIBBLES = bytes((((code >> 4) << 2 | (code & 3)) << 4) & 0xff
+                      for code in range(256))
+_LOW_NIBBLES = bytes(((code >> 4) << 2 | (code & 3)) & 0x0f
+                     for code in range(256))
+_FIRST_CODES = bytes(((code >> 6) << 4) | ((code >> 4) & 3)
+                     for code in range(256))
+_SECOND_CODES = bytes((((code >> 2) & 3) << 4) | (code & 3)
+                      for code in range(256))
+# Every move between stools below 16, packed one per byte
+_PAIR_CODES = {(src, dest): (src << 4) | dest
+               for src in range(16) for dest in range(16)}
+# The codes of moves packed one per byte that don't go between two
+# different stools of a game, by its number of stools
+_INVALID_CODES = {}
+# The most moves apply_moves packs at a time, the moves it makes at a time
+# from what they do to the stools, and the most of those effects it
+# remembers, by the packed moves
+_APPLY_MOVES = 1 << 16
+_WINDOW_MOVES = 64
+_MAX_WINDOWS = 1 << 12
+_WINDOWS = {}
+# The bytes.translate tables that relabel the stools of moves packed one
+# per byte, by the stools to use
+_RELABEL_TABLES = {}
+# The most moves of a rule of a RecursiveMoveSequence kept packed one per
+# byte, rather than made up from its parts when needed
+_RULE_MOVES = 1 << 10
+
+
+def _pack_nibbles(moves):
+    '''
+    (bytes) -> bytes
+    Return moves, packed one per byte, packed two per byte instead.
+    REQ: len(moves) is even, and every move is between stools below 4
+    >>> list(_pack_nibbles(bytes([0x01, 0x02, 0x12, 0x00])))
+    [18, 96]
+    '''
+    high = moves[0::2].translate(_HIGH_NIBBLES)
+    low = moves[1::2].translate(_LOW_NIBBLES)
+    # The nibbles don't overlap, so adding the bytes as one big number
+    # combines them without carrying
+    return (int.from_bytes(high, 'big') +
+            int.from_bytes(low, 'big')).to_bytes(len(high), 'big')
+
+
+def _relabel_table(labels):
+    '''
+    (tuple of int) -> bytes
+    Return the bytes.translate table that turns moves packed one per byte
+    between stools 0, 1, ... into the same moves between the stools in
+    labels.
+    REQ: every stool in labels is < 16
+    '''
+    table = _RELABEL_TABLES.get(labels)
+    if (table is None):
+        codes = list(range(256))
+        for (src, src_label) in enumerate(labels):
+            for (dest, dest_label) in enumerate(labels):
+                codes[(src << 4) | dest] = (src_label << 4) | dest_label
+        table = _RELABEL_TABLES[labels] = bytes(codes)
+    return table
+
+
+def _invalid_codes(num_stools):
+    '''
+    (int) -> bytes
+    Return the codes of the moves packed one per byte that aren't between
+    two different stools of a game with num_stools stools.
+    REQ: num_stools > 0
+    '''
+    codes = _INVALID_CODES.get(num_stools)
+    if (codes is None):
+        codes = _INVALID_CODES[num_stools] = bytes(
+            code for code in range(256)
+            if (code >> 4 >= num_stools or code & 15 >= num_stools or
+                code >> 4 == code & 15))
+    return codes
+
+
+def _window_effect(window):
+    '''
+    (bytes) -> (tuple of (int, int), tuple of (int, tuple of int))
+    Return what the moves in window, packed one per byte, do to the stools,
+    whatever cheeses are on them: the number of cheeses taken from the top
+    of each stool they dig into, as (stool, depth) pairs, and the cheeses
+    left on top of each stool they put cheeses on, bottom first, as
+    (stool, indexes) pairs. Each index is the place of a cheese in the
+    cheeses taken, in the order of the pairs, each stool's bottom first.
+    The effect is remembered, so moves that repeat are only worked out once.
+    >>> _window_effect(bytes([0x01, 0x02, 0x12]))
+    (((0, 2),), ((2, (0, 1)),))
+    '''
+    effect = _WINDOWS.get(window)
+    if (effect is None):
+        # The cheeses put on each stool by the moves so far, and how many
+        # they took from below them, naming the k-th one from the top of
+        # stool s as (s, k)
+        stacks = {}
+        depths = {}
+        for code in window:
+            stack = stacks.setdefault(code >> 4, [])
+            if (stack != []):
+                cheese = stack.pop()
+            else:
+                depth = depths[code >> 4] = depths.get(code >> 4, 0) + 1
+                cheese = (code >> 4, depth)
+            stacks.setdefault(code & 15, []).append(cheese)
+        digs = tuple(sorted(depths.items()))
+        start = {}
+        taken = 0
+        for (stool, depth) in digs:
+            start[stool] = taken
+            taken += depth
+        effect = (digs, tuple(
+            (stool, tuple(start[src] + depths[src] - k for (src, k) in stack))
+            for (stool, stack) in sorted(stacks.items()) if stack != []))
+        if (len(_WINDOWS) >= _MAX_WINDOWS):
+            _WINDOWS.clear()
+        _WINDOWS[window] = effect
+    return effect
+
+
+def _new_move_seq(num_stools):
+    '''
+    (int) -> MoveSequence
+    Return an empty MoveSequence to record the moves of a game with
+    num_stools stools, packed if the stools fit.
+    REQ: num_stools > 0
+    '''
+    if (num_stools <= _PACKED_MAX_STOOLS):
+        result = PackedMoveSequence(num_stools)
+    else:
+        result = MoveSequence([])
+    return result
+
 
 class TOAHModel:
     """Model a game of Towers Of Anne Hoy.
@@ -18,6 +180,8 @@ class TOAHModel:
     these may not be moved!
 
     fill_first_stool - put an existing model in the standard starting config
+    fill_stools - put cheeses on the stools given for each size
+    stool_assignment - index of the stool each cheese is on, by size
     move - move cheese from one stool to another
     add - add a cheese to a stool
     cheese_location - index of the stool that the given cheese is on
@@ -25,13 +189,43 @@ class TOAHModel:
     number_of_moves - number of moves so far
     number_of_stools - number of stools in this game
     get_move_seq - MoveSequence object that records the moves used so far
+    attach_observer - report every move to an observer, e.g. MoveMetrics
+    detach_observer - stop reporting moves to an observer
+    get_observers - list of the attached observers
+    undo - take back the last move
+    redo - make the last move taken back again
+    seek - undo or redo moves until a given number of them are made
+    load_state - put the cheeses where given, with a given move history
+    apply_moves - make many trusted moves at once, checking at most where
+                  the cheeses end up
+    set_checkpoint_interval - how often seek can start from a saved state
+
+    Moves that are undone are kept until a new move is made, so redo and
+    seek can make them again. Every checkpoint interval moves the model
+    keeps a checkpoint of where each cheese is, so seek never has to redo
+    more than one interval of moves:
+
+    >>> M = TOAHModel(3)
+    >>> M.fill_first_stool(2)
+    >>> M.move(0, 1)
+    >>> M.move(0, 2)
+    >>> M.undo()
+    (0, 2)
+    >>> M.stool_assignment()
+    [1, 0]
+    >>> M.seek(2)
+    >>> M.stool_assignment(), M.get_move_seq().length()
+    ([1, 2], 2)
     """
 
-    def __init__(self, num_stools):
+    def __init__(self, num_stools,
+                 checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL):
         '''
         (TOAHModel, int, int) -> NoneType
-        Create a TOAHModel to play Tower of Anne Hoy.
+        Create a TOAHModel to play Tower of Anne Hoy, keeping a checkpoint
+        every checkpoint_interval moves.
         REQ: cheeses > 0 and stools > 0
+        REQ: checkpoint_interval > 0
         '''
         # REPRESENTATION INVARIANT
         # self._number_of_stools is an integer representing the number of
@@ -49,14 +243,30 @@ class TOAHModel:
         #     then there are 4 cheeses on the first stool (using 0 indexing)
         #     cheese at self._stools[0] has size 4
         #     cheese at self._stools[-1] has size 1
+        # self._observers is a list of the observers told about each move;
+        # while it isn't empty, self.move is self._observed_move
+        # self._move_seq records the moves made, followed by the last
+        # self._undone of them, which were undone and can be redone
+        # self._checkpoints lists, in increasing order, numbers of moves
+        # made after which self._states holds the state the model was in,
+        # from self._save_state
+        # self._checkpoint_interval is the number of moves between
+        # checkpoints
+        # self._until_checkpoint is the number of moves to be made until
+        # _checkpoint has to be called, which is when one is due, or 1 if
+        # the next move has to forget the undone moves
         self._number_of_stools = num_stools
         self._number_of_cheese = 0
         self._number_of_moves = 0
-        self._move_seq = MoveSequence([])
+        self._move_seq = _new_move_seq(num_stools)
+        self._observers = []
         self._stools = []
         # Intitialize the number of requested stools as lists
         for i in range(0, num_stools):
             self._stools.append([])
+        self._undone = 0
+        self._checkpoint_interval = checkpoint_interval
+        self._clear_checkpoints()
 
     def cheese_location(self, cheese):
         '''
@@ -84,6 +294,43 @@ class TOAHModel:
             self._stools[0].append(cheese)
             # Raise cheese count
             self._number_of_cheese += 1
+        self._clear_checkpoints()
+
+    def fill_stools(self: 'TOAHModel', locations: list):
+        """
+        (TOAHModel, list of int) -> NoneType
+        Put a cheese of size i + 1 on the stool locations[i], for every i,
+        stacking the cheeses on each stool in order of size.
+        REQ: the stools are empty
+        REQ: 0 <= locations[i] < number_of_stools
+        >>> M = TOAHModel(3)
+        >>> M.fill_stools([2, 0, 2])
+        >>> M._cheese_at(2, 1).size
+        1
+        """
+        # Add the largest cheese first, so each stool ends up sorted
+        for size in range(len(locations), 0, -1):
+            self._stools[locations[size - 1]].append(Cheese(size))
+        self._number_of_cheese += len(locations)
+        self._clear_checkpoints()
+
+    def stool_assignment(self: 'TOAHModel') -> list:
+        """
+        (TOAHModel) -> list of int
+        Return a list whose i-th element is the index of the stool that
+        the cheese of size i + 1 is on.
+        REQ: the cheeses have sizes 1 to number_of_cheeses
+        >>> M = TOAHModel(3)
+        >>> M.fill_first_stool(3)
+        >>> M.move(0, 2)
+        >>> M.stool_assignment()
+        [2, 0, 0]
+        """
+        result = [0] * self._number_of_cheese
+        for stool in range(self._number_of_stools):
+            for cheese in self._stools[stool]:
+                result[cheese.size - 1] = stool
+        return result
 
     def add(self, stool_number, cheese):
         '''
@@ -102,6 +349,7 @@ class TOAHModel:
         self._stools[stool_number].append(cheese)
         # Raise cheese count
         self._number_of_cheese += 1
+        self._clear_checkpoints()
 
     def move(self, curr_stool, dest_stool):
         '''
@@ -124,11 +372,468 @@ class TOAHModel:
             self._stools[curr_stool][-1].size >=
                 self._stools[dest_stool][-1].size):
             raise IllegalMoveError("Impossible to stack a larger cheese on top.")
+        # Keep a checkpoint if one is due, and forget any undone moves
+        self._until_checkpoint -= 1
+        if (self._until_checkpoint == 0):
+            self._checkpoint()
         # Move the cheese from curr_stool to dest_stool
         self._stools[dest_stool].append(self._stools[curr_stool].pop())
         # Add it to the move sequence history
         self._move_seq.add_move(curr_stool, dest_stool)
 
+    def _check_move(self, curr_stool, dest_stool):
+        '''
+        (TOAHModel, int, int) -> NoneType
+        Raise the IllegalMoveError that move would raise for moving a cheese
+        from curr_stool to dest_stool, without changing anything.
+        REQ: None
+        '''
+        if (curr_stool < 0 or dest_stool < 0 or
+            curr_stool >= self._number_of_stools or
+                dest_stool >= self._number_of_stools):
+            raise IllegalMoveError("Invalid stool index.")
+        if (self._stools[curr_stool] == []):
+            raise IllegalMoveError("There is no cheese to be moved.")
+        if (self._stools[dest_stool] != [] and
+            self._stools[curr_stool][-1].size >=
+                self._stools[dest_stool][-1].size):
+            raise IllegalMoveError("Impossible to stack a larger cheese on top.")
+
+    def _apply_move(self, curr_stool, dest_stool):
+        '''
+        (TOAHModel, int, int) -> NoneType
+        Move a cheese from curr_stool to dest_stool and record it, without
+        checking that the move is legal.
+        REQ: _check_move(curr_stool, dest_stool) raises no error
+        '''
+        self._number_of_moves += 1
+        self._until_checkpoint -= 1
+        if (self._until_checkpoint == 0):
+            self._checkpoint()
+        self._stools[dest_stool].append(self._stools[curr_stool].pop())
+        self._move_seq.add_move(curr_stool, dest_stool)
+
+    def _shift(self, curr_stool, dest_stool):
+        '''
+        (TOAHModel, int, int) -> NoneType
+        Move the top cheese of curr_stool to dest_stool, without checking
+        or recording the move.
+        REQ: curr_stool has a cheese
+        '''
+        self._stools[dest_stool].append(self._stools[curr_stool].pop())
+
+    def apply_moves(self, moves, validate=False):
+        '''
+        (TOAHModel, iterable of (int, int) or bytes-like, bool) -> NoneType
+        Make every move in moves, in order, like move but without checking
+        that each one is legal: moves is a MoveSequence, an iterable of
+        (origin, destination) pairs, or bytes holding one move per byte,
+        (origin << 4) | destination, as Tour.iter_move_chunks yields them.
+        The moves are made a window at a time, from what the window does to
+        the stools, worked out once for windows that repeat. The moves are
+        recorded and counted, and checkpoints kept, as if move made them.
+        Moves with no cheese to move or between stools that don't exist
+        still raise IllegalMoveError, once the windows before theirs are
+        made.
+        If validate, the final state is checked as well: if a larger cheese
+        ends up on a smaller one, or a move raised IllegalMoveError, every
+        move is taken back and the error is raised. The states in between
+        aren't checked. With observers attached, or more than 16 stools, the
+        moves are made one at a time by move.
+        REQ: validate, or no move puts a larger cheese on a smaller one
+        >>> M = TOAHModel(3)
+        >>> M.fill_first_stool(2)
+        >>> M.apply_moves([(0, 1), (0, 2), (1, 2)])
+        >>> M.stool_assignment(), M.number_of_moves()
+        ([2, 2], 3)
+        >>> try:
+        ...     M.apply_moves(bytes([0x20, 0x20]), validate=True)
+        ... except IllegalMoveError as error:
+        ...     print(error)
+        Impossible to stack a larger cheese on top.
+        >>> M.stool_assignment(), M.number_of_moves()
+        ([2, 2], 3)
+        '''
+        made = self._move_seq.length() - self._undone
+        number_of_moves = self._number_of_moves
+        state = None
+        if (validate):
+            state = self._save_state()
+        try:
+            if (self._observers != [] or
+                    not isinstance(self._move_seq, PackedMoveSequence)):
+                if (isinstance(moves, (bytes, bytearray, memoryview))):
+                    moves = map(_BYTE_MOVES.__getitem__, moves)
+                for (curr_stool, dest_stool) in moves:
+                    self.move(curr_stool, dest_stool)
+            else:
+                for codes in self._move_codes(moves):
+                    self._apply_codes(codes)
+            if (validate and not self._stacked()):
+                raise IllegalMoveError(
+                    "Impossible to stack a larger cheese on top.")
+        except IllegalMoveError:
+            if (validate):
+                self._take_back(state, made, number_of_moves)
+            raise
+
+    def _move_codes(self, moves):
+        '''
+        (TOAHModel, iterable of (int, int) or bytes-like) -> generator of bytes
+        Yield the moves in moves, as apply_moves takes them, packed one per
+        byte, at most _APPLY_MOVES at a time. Raise IllegalMoveError for a
+        move that isn't between two different stools of the model.
+        REQ: None
+        '''
+        invalid = _invalid_codes(self._number_of_stools)
+        if (isinstance(moves, PackedMoveSequence) or
+                (isinstance(moves, RecursiveMoveSequence) and
+                 moves._packable)):
+            length = moves.length()
+            pieces = (moves.codes(start, min(start + _APPLY_MOVES, length))
+                      for start in range(0, length, _APPLY_MOVES))
+        elif (isinstance(moves, (bytes, bytearray, memoryview))):
+            data = memoryview(moves)
+            pieces = (bytes(data[start:start + _APPLY_MOVES])
+                      for start in range(0, len(data), _APPLY_MOVES))
+        else:
+            pieces = self._pair_codes(iter(moves))
+        for codes in pieces:
+            if (len(codes.translate(None, invalid)) != len(codes)):
+                # Report the first bad move the way move would
+                for code in codes:
+                    if (code >> 4 >= self._number_of_stools or
+                            code & 15 >= self._number_of_stools):
+                        raise IllegalMoveError("Invalid stool index.")
+                    if (code >> 4 == code & 15):
+                        raise IllegalMoveError(
+                            "Impossible to stack a larger cheese on top.")
+            yield codes
+
+    def _pair_codes(self, moves):
+        '''
+        (TOAHModel, iterator of (int, int)) -> generator of bytes
+        Yield the (origin, destination) pairs from moves packed one per byte,
+        at most _APPLY_MOVES at a time. Raise IllegalMoveError for a pair
+        that isn't two stools below 16.
+        REQ: None
+        '''
+        more = True
+        while (more):
+            try:
+                codes = bytes(map(_PAIR_CODES.__getitem__,
+                                  islice(moves, _APPLY_MOVES)))
+            except (KeyError, TypeError):
+                raise IllegalMoveError("Invalid stool index.")
+            more = len(codes) == _APPLY_MOVES
+            if (codes != b''):
+                yield codes
+
+    def _apply_codes(self, codes):
+        '''
+        (TOAHModel, bytes) -> NoneType
+        Make and record the moves in codes, packed one per byte, a window
+        at a time, keeping the checkpoints that come due on the way.
+        REQ: every move in codes is between two different stools
+        '''
+        position = 0
+        while (position < len(codes)):
+            # Keep a checkpoint if one is due, and forget any undone moves,
+            # as move does before the move that brings it due
+            if (self._until_checkpoint == 1):
+                self._checkpoint()
+                self._until_checkpoint += 1
+            part = codes[position:position + self._until_checkpoint - 1]
+            done = 0
+            try:
+                for start in range(0, len(part), _WINDOW_MOVES):
+                    window = part[start:start + _WINDOW_MOVES]
+                    effect = _WINDOWS.get(window)
+                    if (effect is None):
+                        effect = _window_effect(window)
+                    self._apply_window(effect[0], effect[1])
+                    done += len(window)
+            finally:
+                # Record the moves made, even if a window raised an error
+                self._move_seq.extend_codes(part[:done])
+                self._number_of_moves += done
+                self._until_checkpoint -= done
+                if (done < len(part)):
+                    self._until_checkpoint = 1
+            position += done
+
+    def _apply_window(self, digs, pushes):
+        '''
+        (TOAHModel, tuple of (int, int), tuple of (int, tuple of int))
+        -> NoneType
+        Make a window of moves from what they do to the stools, as returned
+        by _window_effect, without recording them. Raise IllegalMoveError,
+        changing nothing, if they take more cheeses from a stool than it has.
+        REQ: None
+        '''
+        stools = self._stools
+        for (stool, depth) in digs:
+            if (len(stools[stool]) < depth):
+                raise IllegalMoveError("There is no cheese to be moved.")
+        taken = []
+        for (stool, depth) in digs:
+            taken += stools[stool][-depth:]
+            del stools[stool][-depth:]
+        for (stool, indexes) in pushes:
+            stools[stool].extend([taken[i] for i in indexes])
+
+    def _stacked(self):
+        '''
+        (TOAHModel) -> bool
+        Return whether every cheese is on a larger one or on a stool.
+        REQ: None
+        '''
+        result = True
+        for stool in self._stools:
+            for i in range(1, len(stool)):
+                if (stool[i - 1].size <= stool[i].size):
+                    result = False
+        return result
+
+    def _take_back(self, state, made, number_of_moves):
+        '''
+        (TOAHModel, object, int, int) -> NoneType
+        Put the cheeses back in state, from _save_state, count
+        number_of_moves moves, and forget the moves recorded after the
+        first made.
+        REQ: state was saved after the first made moves
+        '''
+        self._restore_state(state)
+        self._number_of_moves = number_of_moves
+        if (self._move_seq.length() - self._undone != made):
+            self._move_seq.truncate(made)
+            self._undone = 0
+            while (self._checkpoints != [] and self._checkpoints[-1] > made):
+                self._checkpoints.pop()
+                self._states.pop()
+            self._until_checkpoint = 1
+
+    def _save_state(self):
+        '''
+        (TOAHModel) -> array of int
+        Return the index of the stool each cheese is on, smallest cheese
+        first.
+        REQ: None
+        '''
+        cheeses = []
+        for stool in range(self._number_of_stools):
+            for cheese in self._stools[stool]:
+                cheeses.append((cheese.size, stool))
+        cheeses.sort()
+        return array('H', [stool for (size, stool) in cheeses])
+
+    def _restore_state(self, state):
+        '''
+        (TOAHModel, array of int) -> NoneType
+        Put the cheeses back on the stools given by state, from _save_state.
+        REQ: the cheeses are the same as when state was saved
+        '''
+        cheeses = sorted(chain.from_iterable(self._stools),
+                         key=lambda cheese: cheese.size)
+        self._stools = [[] for stool in range(self._number_of_stools)]
+        # Add the largest cheese first, so each stool ends up sorted
+        for i in range(len(cheeses) - 1, -1, -1):
+            self._stools[state[i]].append(cheeses[i])
+
+    def _clear_checkpoints(self):
+        '''
+        (TOAHModel) -> NoneType
+        Forget the checkpoints, which no longer hold the same cheeses, and
+        keep the next one when it is due.
+        REQ: None
+        '''
+        self._checkpoints = []
+        self._states = []
+        self._until_checkpoint = 1
+
+    def _checkpoint(self):
+        '''
+        (TOAHModel) -> NoneType
+        Get ready for a new move: forget the undone moves, and the
+        checkpoints after them, keep a checkpoint of the state if one is due,
+        and count the moves until the next one is.
+        REQ: None
+        '''
+        made = self._move_seq.length() - self._undone
+        if (self._undone != 0):
+            self._move_seq.truncate(made)
+            self._undone = 0
+            while (self._checkpoints != [] and self._checkpoints[-1] > made):
+                self._checkpoints.pop()
+                self._states.pop()
+        interval = self._checkpoint_interval
+        if (made % interval == 0 and
+                (self._checkpoints == [] or self._checkpoints[-1] < made)):
+            self._checkpoints.append(made)
+            self._states.append(self._save_state())
+        self._until_checkpoint = interval - made % interval
+
+    def undo(self):
+        '''
+        (TOAHModel) -> (int, int)
+        Take back the last move made, putting its cheese back, and return
+        the move. Observers are not told about it.
+        REQ: a move was made since the cheeses were added
+        '''
+        made = self._move_seq.length() - self._undone
+        if (made == 0):
+            raise IllegalMoveError("There is no move to undo.")
+        (curr_stool, dest_stool) = self._move_seq.get_move(made - 1)
+        self._shift(dest_stool, curr_stool)
+        self._undone += 1
+        self._number_of_moves -= 1
+        # The next move has to forget the undone moves
+        self._until_checkpoint = 1
+        return (curr_stool, dest_stool)
+
+    def redo(self):
+        '''
+        (TOAHModel) -> (int, int)
+        Make the last move undone again, and return it. Observers are not
+        told about it.
+        REQ: a move was undone, and no move was made since
+        '''
+        if (self._undone == 0):
+            raise IllegalMoveError("There is no move to redo.")
+        move = self._move_seq.get_move(self._move_seq.length() - self._undone)
+        self._shift(move[0], move[1])
+        self._undone -= 1
+        self._number_of_moves += 1
+        return move
+
+    def seek(self, position):
+        '''
+        (TOAHModel, int) -> NoneType
+        Undo or redo moves until position moves are made, starting from the
+        last checkpoint up to position if that is closer, so that at most
+        one checkpoint interval of moves is redone. Observers are not told
+        about it.
+        REQ: 0 <= position <= moves made plus moves undone
+        '''
+        end = self._move_seq.length()
+        if (position < 0 or position > end):
+            raise IndexError("Move index out of range.")
+        made = end - self._undone
+        index = bisect_right(self._checkpoints, position) - 1
+        if (index >= 0 and
+                position - self._checkpoints[index] < abs(position - made)):
+            self._restore_state(self._states[index])
+            self._number_of_moves += self._checkpoints[index] - made
+            made = self._checkpoints[index]
+            self._undone = end - made
+        while (made > position):
+            self.undo()
+            made -= 1
+        while (made < position):
+            self.redo()
+            made += 1
+        self._until_checkpoint = 1
+
+    def load_state(self, locations, move_seq, number_of_moves):
+        '''
+        (TOAHModel, list of int, MoveSequence, int) -> NoneType
+        Put the cheese of size i + 1 on the stool locations[i], for every i,
+        and take move_seq as the moves made and number_of_moves as their
+        number, without making any moves. Undone moves are forgotten, and
+        the state is kept as a checkpoint.
+        REQ: the cheeses have sizes 1 to number_of_cheeses
+        REQ: len(locations) == number_of_cheeses
+        REQ: 0 <= locations[i] < number_of_stools
+        '''
+        self._restore_state(self._assignment_state(locations))
+        self._move_seq = move_seq
+        self._number_of_moves = number_of_moves
+        self._undone = 0
+        self._clear_checkpoints()
+        self._checkpoints.append(move_seq.length())
+        self._states.append(self._save_state())
+
+    def _assignment_state(self, locations):
+        '''
+        (TOAHModel, list of int) -> array of int
+        Return the state, as _save_state returns it, with the cheese of size
+        i + 1 on the stool locations[i].
+        REQ: the cheeses have sizes 1 to number_of_cheeses
+        '''
+        return array('H', locations)
+
+    def set_checkpoint_interval(self, interval):
+        '''
+        (TOAHModel, int) -> NoneType
+        Keep a checkpoint every interval moves from now on: more memory for
+        shorter interval, but less to redo in seek.
+        REQ: interval > 0
+        '''
+        self._checkpoint_interval = interval
+        self._until_checkpoint = 1
+
+    def checkpoint_interval(self):
+        '''
+        (TOAHModel) -> int
+        Return the number of moves between checkpoints.
+        REQ: None
+        '''
+        return self._checkpoint_interval
+
+    def _observed_move(self, curr_stool, dest_stool):
+        '''
+        (TOAHModel, int, int) -> NoneType
+        Move a cheese from curr_stool to dest_stool like move does, and tell
+        every attached observer about it, with the time spent checking the
+        move and the time spent making and recording it.
+        REQ: The cheese to be moved has size < dest_stool's top cheese
+        '''
+        start = perf_counter_ns()
+        try:
+            self._check_move(curr_stool, dest_stool)
+        except IllegalMoveError as error:
+            checked = perf_counter_ns()
+            for observer in self._observers:
+                observer.illegal_move(self, curr_stool, dest_stool, error,
+                                      checked - start)
+            # Let move raise the error, so the model changes the same way
+            type(self).move(self, curr_stool, dest_stool)
+        checked = perf_counter_ns()
+        self._apply_move(curr_stool, dest_stool)
+        done = perf_counter_ns()
+        for observer in self._observers:
+            observer.moved(self, curr_stool, dest_stool, checked - start,
+                           done - checked)
+
+    def attach_observer(self, observer):
+        '''
+        (TOAHModel, MoveObserver) -> NoneType
+        Tell observer about every move from now on, as described in
+        MoveMetrics.MoveObserver. Without observers, move has no extra cost.
+        REQ: None
+        '''
+        self._observers.append(observer)
+        # Replace move for this model only
+        self.move = self._observed_move
+
+    def detach_observer(self, observer):
+        '''
+        (TOAHModel, MoveObserver) -> NoneType
+        Stop telling observer about moves.
+        REQ: observer is attached
+        '''
+        self._observers.remove(observer)
+        if (self._observers == []):
+            del self.move
+
+    def get_observers(self):
+        '''
+        (TOAHModel) -> list of MoveObserver
+        Return the observers attached to this model.
+        REQ: None
+        '''
+        return list(self._observers)
+
     def number_of_cheeses(self):
         '''
         (TOAHModel) -> int
@@ -188,10 +893,15 @@ class TOAHModel:
     def get_move_seq(self: 'TOAHModel') -> 'MoveSequence':
         '''
         (TOAHModel) -> MoveSequence
-        Return out the players' move history.
+        Return out the players' move history, without the moves undone.
         REQ: User started the game
         '''
-        return self._move_seq
+        result = self._move_seq
+        # The undone moves are only dropped at the next move, so copy the
+        # ones made until then
+        if (self._undone != 0):
+            result = result[:result.length() - self._undone]
+        return result
 
     def __eq__(self: 'TOAHModel', other: 'TOAHModel') -> bool:
         """
@@ -201,6 +911,7 @@ class TOAHModel:
         More precisely, for all h,s, the h-th cheese on the s-th
         stool of self should be equivalent the h-th cheese on the s-th
         stool of other
+        REQ: None
         >>> m1 = TOAHModel(4)
         >>> m1.fill_first_stool(7)
         >>> m1.move(0,1)
@@ -213,13 +924,25 @@ class TOAHModel:
         >>> m2.move(3,2)
         >>> m1 == m2
         True
-        REQ: None
         """
         # If the other object is not a TOAHModel, raise an error
-        if (type(other) is not TOAHModel):
+        if (not isinstance(other, TOAHModel)):
             raise IllegalMoveError("Must compare 2 TOAHModels.")
-        # Return if self is equivalent to the other TOAHModel
-        return self == other
+        # Compare the stools one cheese at a time, so that models with
+        # different representations can be compared too
+        result = self.number_of_stools() == other.number_of_stools()
+        stool = 0
+        while (result and stool < self.number_of_stools()):
+            height = 0
+            mine = self._cheese_at(stool, height)
+            theirs = other._cheese_at(stool, height)
+            while (result and (mine is not None or theirs is not None)):
+                result = mine == theirs
+                height += 1
+                mine = self._cheese_at(stool, height)
+                theirs = other._cheese_at(stool, height)
+            stool += 1
+        return result
 
     def __str__(self: 'TOAHModel') -> str:
         """
@@ -254,6 +977,327 @@ class TOAHModel:
         return lines
 
 
+class CompactTOAHModel(TOAHModel):
+    """Model a game of Towers Of Anne Hoy, storing cheeses by their sizes.
+
+    Works like TOAHModel, but each cheese only takes one byte for the index
+    of the stool it is on and one slot in an integer array holding the
+    sizes on that stool, rather than a full Cheese object. This makes
+    cheese_location, top_cheese and the checks in move O(1).
+    Cheeses given to add are kept, so callers get the same objects back
+    from top_cheese; cheeses created by fill_first_stool are made on demand.
+    """
+
+    def __init__(self, num_stools,
+                 checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL):
+        '''
+        (CompactTOAHModel, int, int) -> NoneType
+        Create a CompactTOAHModel to play Tower of Anne Hoy, keeping a
+        checkpoint every checkpoint_interval moves.
+        REQ: 0 < num_stools < 255
+        REQ: checkpoint_interval > 0
+        '''
+        # REPRESENTATION INVARIANT
+        # self._number_of_stools, self._number_of_cheese,
+        # self._number_of_moves, self._move_seq, self._undone and the
+        # checkpoints are as in TOAHModel
+        # self._stools is a list of arrays of cheese sizes, one per stool
+        # self._location is a bytearray where self._location[size] is the
+        # index of the stool holding the cheese of that size, or _NOWHERE
+        # if there is no cheese of that size
+        # self._cheese_objects maps the size of a cheese that was added
+        # with add to the Cheese object that was added
+        # self._observers is as in TOAHModel
+        # if self._stools[0] == array('I', [4, 3, 2, 1]):
+        #     then there are 4 cheeses on the first stool (using 0 indexing)
+        #     cheese at self._stools[0][0] has size 4
+        #     cheese at self._stools[0][-1] has size 1
+        #     self._location[1] == self._location[4] == 0
+        self._number_of_stools = num_stools
+        self._number_of_cheese = 0
+        self._number_of_moves = 0
+        self._move_seq = _new_move_seq(num_stools)
+        self._observers = []
+        self._stools = [array('I') for i in range(num_stools)]
+        self._location = bytearray()
+        self._cheese_objects = {}
+        self._undone = 0
+        self._checkpoint_interval = checkpoint_interval
+        self._clear_checkpoints()
+
+    def _make_room(self, size):
+        '''
+        (CompactTOAHModel, int) -> NoneType
+        Grow self._location so that it has an entry for a cheese of size.
+        REQ: size >= 0
+        '''
+        if (len(self._location) <= size):
+            self._location.extend(
+                bytes([_NOWHERE]) * (size + 1 - len(self._location)))
+
+    def _cheese(self, size):
+        '''
+        (CompactTOAHModel, int) -> Cheese
+        Return the Cheese that was added with the given size, or a new
+        Cheese of that size if none was.
+        REQ: A cheese of size is in the model
+        '''
+        cheese = self._cheese_objects.get(size)
+        if (cheese is None):
+            cheese = Cheese(size)
+        return cheese
+
+    def cheese_location(self, cheese):
+        '''
+        (CompactTOAHModel, Cheese) -> int
+        Return the index of the stool the given cheese is on.
+        REQ: The cheese exists in the current model
+        '''
+        result = None
+        if (cheese.size < len(self._location) and
+                self._location[cheese.size] != _NOWHERE):
+            result = self._location[cheese.size]
+        return result
+
+    def fill_first_stool(self, number_of_cheeses):
+        '''
+        (CompactTOAHModel, int) -> NoneType
+        Put number_of_cheeses cheeses on the first (i.e. 0-th) stool, in order
+        of size, with a cheese of size == number_of_cheeses on bottom and
+        a cheese of size == 1 on top.
+        REQ: number_of_cheeses > 0
+        '''
+        self._make_room(number_of_cheeses)
+        # Add every size at once, largest first
+        self._stools[0].extend(range(number_of_cheeses, 0, -1))
+        self._location[1:number_of_cheeses + 1] = bytes(number_of_cheeses)
+        self._number_of_cheese += number_of_cheeses
+        self._clear_checkpoints()
+
+    def fill_stools(self, locations):
+        '''
+        (CompactTOAHModel, list of int) -> NoneType
+        Put a cheese of size i + 1 on the stool locations[i], for every i,
+        stacking the cheeses on each stool in order of size.
+        REQ: the stools are empty
+        REQ: 0 <= locations[i] < number_of_stools
+        '''
+        self._make_room(len(locations))
+        self._location[1:len(locations) + 1] = bytes(locations)
+        # Add the largest cheese first, so each stool ends up sorted
+        for size in range(len(locations), 0, -1):
+            self._stools[locations[size - 1]].append(size)
+        self._number_of_cheese += len(locations)
+        self._clear_checkpoints()
+
+    def stool_assignment(self):
+        '''
+        (CompactTOAHModel) -> list of int
+        Return a list whose i-th element is the index of the stool that
+        the cheese of size i + 1 is on.
+        REQ: the cheeses have sizes 1 to number_of_cheeses
+        '''
+        return list(self._location[1:self._number_of_cheese + 1])
+
+    def add(self, stool_number, cheese):
+        '''
+        (CompactTOAHModel, int, Cheese) -> NoneType
+        Add a cheese to the stool_number'th stool.
+        REQ: Cheese has a size < the current top Cheese on the stool
+        '''
+        # If the stool does not exist, raise an error
+        if (stool_number < 0 or stool_number >= self._number_of_stools):
+            raise IllegalMoveError("Invalid stool index.")
+        stool = self._stools[stool_number]
+        # If the user attempts to add a larger cheese on top, raise an error
+        if (len(stool) != 0 and cheese.size >= stool[-1]):
+            raise IllegalMoveError("Can only stack cheese of smaller sizes.")
+        # Record the cheese's size and where it is
+        self._make_room(cheese.size)
+        stool.append(cheese.size)
+        self._location[cheese.size] = stool_number
+        self._cheese_objects[cheese.size] = cheese
+        # Raise cheese count
+        self._number_of_cheese += 1
+        self._clear_checkpoints()
+
+    def move(self, curr_stool, dest_stool):
+        '''
+        (CompactTOAHModel, int, int) -> NoneType
+        Move a cheese from curr_stool to dest_stool.
+        REQ: The cheese to be moved has size < dest_stool's top cheese
+        '''
+        # If the user enters a non-existing stool number, raise an error
+        if (curr_stool < 0 or dest_stool < 0 or
+            curr_stool >= self._number_of_stools or
+                dest_stool >= self._number_of_stools):
+            raise IllegalMoveError("Invalid stool index.")
+        # Increase the amount of moves
+        self._number_of_moves += 1
+        origin = self._stools[curr_stool]
+        dest = self._stools[dest_stool]
+        # If the current stool has no cheese to be moved, raise an error
+        if (len(origin) == 0):
+            raise IllegalMoveError("There is no cheese to be moved.")
+        # If the cheese from current is larger or equal in size, raise error
+        if (len(dest) != 0 and origin[-1] >= dest[-1]):
+            raise IllegalMoveError("Impossible to stack a larger cheese on top.")
+        # Keep a checkpoint if one is due, and forget any undone moves
+        self._until_checkpoint -= 1
+        if (self._until_checkpoint == 0):
+            self._checkpoint()
+        # Move the size from curr_stool to dest_stool, and record where it is
+        size = origin.pop()
+        dest.append(size)
+        self._location[size] = dest_stool
+        # Add it to the move sequence history
+        self._move_seq.add_move(curr_stool, dest_stool)
+
+    def _check_move(self, curr_stool, dest_stool):
+        '''
+        (CompactTOAHModel, int, int) -> NoneType
+        Raise the IllegalMoveError that move would raise for moving a cheese
+        from curr_stool to dest_stool, without changing anything.
+        REQ: None
+        '''
+        if (curr_stool < 0 or dest_stool < 0 or
+            curr_stool >= self._number_of_stools or
+                dest_stool >= self._number_of_stools):
+            raise IllegalMoveError("Invalid stool index.")
+        origin = self._stools[curr_stool]
+        dest = self._stools[dest_stool]
+        if (len(origin) == 0):
+            raise IllegalMoveError("There is no cheese to be moved.")
+        if (len(dest) != 0 and origin[-1] >= dest[-1]):
+            raise IllegalMoveError("Impossible to stack a larger cheese on top.")
+
+    def _apply_move(self, curr_stool, dest_stool):
+        '''
+        (CompactTOAHModel, int, int) -> NoneType
+        Move a cheese from curr_stool to dest_stool and record it, without
+        checking that the move is legal.
+        REQ: _check_move(curr_stool, dest_stool) raises no error
+        '''
+        self._number_of_moves += 1
+        self._until_checkpoint -= 1
+        if (self._until_checkpoint == 0):
+            self._checkpoint()
+        size = self._stools[curr_stool].pop()
+        self._stools[dest_stool].append(size)
+        self._location[size] = dest_stool
+        self._move_seq.add_move(curr_stool, dest_stool)
+
+    def _shift(self, curr_stool, dest_stool):
+        '''
+        (CompactTOAHModel, int, int) -> NoneType
+        Move the top cheese of curr_stool to dest_stool, without checking
+        or recording the move.
+        REQ: curr_stool has a cheese
+        '''
+        size = self._stools[curr_stool].pop()
+        self._stools[dest_stool].append(size)
+        self._location[size] = dest_stool
+
+    def _apply_window(self, digs, pushes):
+        '''
+        (CompactTOAHModel, tuple of (int, int),
+         tuple of (int, tuple of int)) -> NoneType
+        Make a window of moves from what they do to the stools, as returned
+        by _window_effect, without recording them. Raise IllegalMoveError,
+        changing nothing, if they take more cheeses from a stool than it has.
+        REQ: None
+        '''
+        stools = self._stools
+        for (stool, depth) in digs:
+            if (len(stools[stool]) < depth):
+                raise IllegalMoveError("There is no cheese to be moved.")
+        taken = []
+        for (stool, depth) in digs:
+            taken += stools[stool][-depth:]
+            del stools[stool][-depth:]
+        location = self._location
+        for (stool, indexes) in pushes:
+            sizes = [taken[i] for i in indexes]
+            stools[stool].extend(sizes)
+            for size in sizes:
+                location[size] = stool
+
+    def _stacked(self):
+        '''
+        (CompactTOAHModel) -> bool
+        Return whether every cheese is on a larger one or on a stool.
+        REQ: None
+        '''
+        result = True
+        for stool in self._stools:
+            for i in range(1, len(stool)):
+                if (stool[i - 1] <= stool[i]):
+                    result = False
+        return result
+
+    def _save_state(self):
+        '''
+        (CompactTOAHModel) -> bytes
+        Return the index of the stool holding each size, as stored.
+        REQ: None
+        '''
+        return bytes(self._location)
+
+    def _assignment_state(self, locations):
+        '''
+        (CompactTOAHModel, list of int) -> bytes
+        Return the state, as _save_state returns it, with the cheese of size
+        i + 1 on the stool locations[i].
+        REQ: the cheeses have sizes 1 to number_of_cheeses
+        '''
+        return bytes([_NOWHERE]) + bytes(locations)
+
+    def _restore_state(self, state):
+        '''
+        (CompactTOAHModel, bytes) -> NoneType
+        Put the cheeses back on the stools given by state, from _save_state.
+        REQ: the cheeses are the same as when state was saved
+        '''
+        self._location[:] = state
+        self._stools = [array('I') for i in range(self._number_of_stools)]
+        # Add the largest cheese first, so each stool ends up sorted
+        for size in range(len(state) - 1, -1, -1):
+            if (state[size] != _NOWHERE):
+                self._stools[state[size]].append(size)
+
+    def top_cheese(self, stool_index):
+        '''
+        (CompactTOAHModel, int) -> Cheese
+        Return the top cheese at the given stool.
+        REQ: 0 <= stool_index < number_of_stools
+        '''
+        # Raise an error if invalid stool index is given
+        if (stool_index < 0 or stool_index >= self._number_of_stools):
+            raise IllegalMoveError("Given stool does not exist.")
+        return self._cheese(self._stools[stool_index][-1])
+
+    def _cheese_at(self, stool_index, stool_height):
+        """
+        (CompactTOAHModel, int, int) -> Cheese
+        If there are at least stool_height+1 cheeses
+        on stool stool_index then return the (stool_height)-th one.
+        Otherwise return None.
+        REQ: 0 <= stool_index < number_of_stools
+        >>> M = CompactTOAHModel(4)
+        >>> M.fill_first_stool(5)
+        >>> M._cheese_at(0,3).size
+        2
+        >>> M.move(0, 2)
+        >>> M.cheese_location(Cheese(1))
+        2
+        """
+        result = None
+        if (stool_index >= 0 and stool_index < self._number_of_stools and
+                stool_height < len(self._stools[stool_index])):
+            result = self._cheese(self._stools[stool_index][stool_height])
+        return result
+
+
 class Cheese:
     def __init__(self: 'Cheese', size: int):
         """
@@ -301,6 +1345,10 @@ class MoveSequence(object):
     def length(self: 'MoveSequence') -> int:
         return len(self._moves)
 
+    def truncate(self: 'MoveSequence', length: int):
+        # Keep only the first length moves
+        del self._moves[length:]
+
     def generate_TOAHModel(self: 'MoveSequence', number_of_stools: int,
                            number_of_cheeses: int) -> 'TOAHModel':
         """
@@ -311,14 +1359,480 @@ class MoveSequence(object):
         """
         model = TOAHModel(number_of_stools)
         model.fill_first_stool(number_of_cheeses)
-        for move in self._moves:
+        for move in self:
             model.move(move[0], move[1])
         return model
 
+    def __iter__(self: 'MoveSequence'):
+        return iter(self._moves)
+
+    def __getitem__(self: 'MoveSequence', index):
+        # A slice is a new MoveSequence, like for PackedMoveSequence
+        if (isinstance(index, slice)):
+            return MoveSequence(self._moves[index])
+        return self._moves[index]
+
     def __repr__(self: 'MoveSequence') -> str:
         return "MoveSequence(" + repr(self._moves) + ")"
 
 
+class PackedMoveSequence(MoveSequence):
+    """A MoveSequence that packs its moves into a bytearray.
+
+    With at most 4 stools each move takes a nibble, (src << 2) | dest, with
+    the earlier of two moves in the high nibble of their byte. With at most
+    16 stools each move takes a byte, (src << 4) | dest.
+    """
+
+    def __init__(self: 'PackedMoveSequence', number_of_stools: int,
+                 moves: list=None):
+        '''
+        (PackedMoveSequence, int, list of (int, int)) -> NoneType
+        Create a PackedMoveSequence for a game with number_of_stools stools,
+        holding moves if they are given.
+        REQ: 0 < number_of_stools <= 16
+        >>> seq = PackedMoveSequence(3, [(0, 1), (0, 2), (1, 2)])
+        >>> seq.get_move(1)
+        (0, 2)
+        >>> seq[1:]
+        PackedMoveSequence(3, [(0, 2), (1, 2)])
+        '''
+        # REPRESENTATION INVARIANT
+        # self._number_of_stools is the number of stools moves can use
+        # self._nibbles is True iff each move is stored in half a byte
+        # self._data is a bytearray holding the packed moves, in order
+        # self._length is the number of moves stored in self._data
+        # if self._nibbles and self._length is odd:
+        #     then the low nibble of self._data[-1] is 0
+        if (number_of_stools > _PACKED_MAX_STOOLS):
+            raise IllegalMoveError("Too many stools to pack the moves.")
+        self._number_of_stools = number_of_stools
+        self._nibbles = number_of_stools <= _NIBBLE_MAX_STOOLS
+        self._data = bytearray()
+        self._length = 0
+        if (moves is not None):
+            for (src_stool, dest_stool) in moves:
+                self.add_move(src_stool, dest_stool)
+
+    def get_move(self: 'PackedMoveSequence', i: int):
+        # Exception if not (-self.length <= i < self.length)
+        if (i < 0):
+            i += self._length
+        if (i < 0 or i >= self._length):
+            raise IndexError("Move index out of range.")
+        if (self._nibbles):
+            code = self._data[i >> 1]
+            # Even moves are in the high nibble, odd ones in the low
+            if (i & 1 == 0):
+                code >>= 4
+            result = _NIBBLE_MOVES[code & 15]
+        else:
+            result = _BYTE_MOVES[self._data[i]]
+        return result
+
+    def add_move(self: 'PackedMoveSequence', src_stool: int,
+                 dest_stool: int):
+        if (src_stool < 0 or dest_stool < 0 or
+                src_stool >= self._number_of_stools or
+                dest_stool >= self._number_of_stools):
+            raise IllegalMoveError("Invalid stool index.")
+        if (not self._nibbles):
+            self._data.append((src_stool << 4) | dest_stool)
+        # Start a new byte for an even move, fill the low nibble for an odd
+        elif (self._length & 1 == 0):
+            self._data.append(((src_stool << 2) | dest_stool) << 4)
+        else:
+            self._data[-1] |= (src_stool << 2) | dest_stool
+        self._length += 1
+
+    def length(self: 'PackedMoveSequence') -> int:
+        return self._length
+
+    def truncate(self: 'PackedMoveSequence', length: int):
+        '''
+        (PackedMoveSequence, int) -> NoneType
+        Keep only the first length moves.
+        REQ: 0 <= length <= self.length()
+        '''
+        del self._data[length if not self._nibbles else (length + 1) >> 1:]
+        self._length = length
+        # Clear the move after the last one, if it shares the last byte
+        if (self._nibbles and length & 1 == 1):
+            self._data[-1] &= 0xf0
+
+    def codes(self: 'PackedMoveSequence', start: int, stop: int) -> bytes:
+        '''
+        (PackedMoveSequence, int, int) -> bytes
+        Return the moves from start up to stop packed one per byte,
+        (src << 4) | dest, whichever way they are stored.
+        REQ: 0 <= start <= stop <= self.length()
+        >>> list(PackedMoveSequence(3, [(0, 1), (0, 2), (1, 2)]).codes(1, 3))
+        [2, 18]
+        '''
+        if (not self._nibbles):
+            result = bytes(self._data[start:stop])
+        else:
+            data = bytes(self._data[start >> 1:(stop + 1) >> 1])
+            # Unpack the first and the second move of every byte in turn
+            codes = bytearray(2 * len(data))
+            codes[0::2] = data.translate(_FIRST_CODES)
+            codes[1::2] = data.translate(_SECOND_CODES)
+            result = bytes(codes[start & 1:(start & 1) + stop - start])
+        return result
+
+    def extend_codes(self: 'PackedMoveSequence', codes: bytes):
+        '''
+        (PackedMoveSequence, bytes) -> NoneType
+        Add the moves in codes, packed one per byte, (src << 4) | dest, as
+        codes returns them, without checking them one at a time.
+        REQ: every move in codes is between stools below number_of_stools
+        >>> seq = PackedMoveSequence(3, [(0, 1)])
+        >>> seq.extend_codes(bytes([0x02, 0x12]))
+        >>> seq
+        PackedMoveSequence(3, [(0, 1), (0, 2), (1, 2)])
+        '''
+        length = len(codes)
+        if (not self._nibbles):
+            self._data += codes
+        elif (length > 0):
+            # Fill the low nibble of the last byte first, if it is free
+            if (self._length & 1 == 1):
+                self._data[-1] |= _LOW_NIBBLES[codes[0]]
+                codes = codes[1:]
+            self._data += _pack_nibbles(bytes(codes) +
+                                        b'\0' * (len(codes) & 1))
+        self._length += length
+
+    def to_bytes(self: 'PackedMoveSequence') -> bytes:
+        '''
+        (PackedMoveSequence) -> bytes
+        Return the packed moves, as stored.
+        >>> list(PackedMoveSequence(3, [(0, 1), (0, 2), (1, 2)]).to_bytes())
+        [18, 96]
+        '''
+        return bytes(self._data)
+
+    @classmethod
+    def from_bytes(cls, number_of_stools: int, data: bytes,
+                   length: int) -> 'PackedMoveSequence':
+        '''
+        (type, int, bytes, int) -> PackedMoveSequence
+        Return a PackedMoveSequence holding the first length moves packed
+        in data by to_bytes, for a game with number_of_stools stools.
+        REQ: 0 < number_of_stools <= 16
+        REQ: data holds at least length moves
+        >>> PackedMoveSequence.from_bytes(3, bytes([18, 96]), 3)
+        PackedMoveSequence(3, [(0, 1), (0, 2), (1, 2)])
+        '''
+        result = cls(number_of_stools)
+        size = length if not result._nibbles else (length + 1) >> 1
+        result._data = bytearray(data[:size])
+        result._length = length
+        # Clear the move after the last one, if it shares the last byte
+        if (result._nibbles and length & 1 == 1):
+            result._data[-1] &= 0xf0
+        return result
+
+    def number_of_stools(self: 'PackedMoveSequence') -> int:
+        return self._number_of_stools
+
+    def __len__(self: 'PackedMoveSequence') -> int:
+        return self._length
+
+    def __iter__(self: 'PackedMoveSequence'):
+        # Decode whole bytes through the tables instead of one move at a time
+        if (not self._nibbles):
+            result = map(_BYTE_MOVES.__getitem__, self._data)
+        elif (self._length & 1 == 0):
+            result = chain.from_iterable(
+                map(_NIBBLE_PAIRS.__getitem__, self._data))
+        # The last byte only holds one move
+        else:
+            result = chain(chain.from_iterable(
+                map(_NIBBLE_PAIRS.__getitem__, memoryview(self._data)[:-1])),
+                [_NIBBLE_MOVES[self._data[-1] >> 4]])
+        return result
+
+    def __getitem__(self: 'PackedMoveSequence', index):
+        '''
+        (PackedMoveSequence, int or slice) -> (int, int) or PackedMoveSequence
+        Return the move at index, or a new PackedMoveSequence holding the
+        moves in the slice index.
+        '''
+        if (not isinstance(index, slice)):
+            return self.get_move(index)
+        start, stop, step = index.indices(self._length)
+        result = PackedMoveSequence(self._number_of_stools)
+        # Contiguous byte-aligned slices are copied without decoding
+        if (step == 1 and stop > start and not self._nibbles):
+            result._data = self._data[start:stop]
+            result._length = stop - start
+        elif (step == 1 and stop > start and start & 1 == 0):
+            result._data = self._data[start >> 1:(stop + 1) >> 1]
+            result._length = stop - start
+            # Clear the move after the slice, if it shares the last byte
+            if (result._length & 1 == 1):
+                result._data[-1] &= 0xf0
+        else:
+            for i in range(start, stop, step):
+                result.add_move(*self.get_move(i))
+        return result
+
+    def __repr__(self: 'PackedMoveSequence') -> str:
+        return ("PackedMoveSequence(" + str(self._number_of_stools) + ", " +
+                repr(list(self)) + ")")
+
+
+class RecursiveMoveSequence(MoveSequence):
+    """A MoveSequence stored as the rules of a grammar that generates it.
+
+    Each rule is a tuple of parts, and each part is either a single move,
+    (None, (src, dest)), or the moves of an earlier rule with its stools
+    relabeled, (rule, labels), where stool s of rules[rule] becomes
+    labels[s]. The sequence is the moves of the last rule, followed by any
+    moves added with add_move. An optimal solution takes one rule per size
+    of sub-tower it moves, however many moves it has, and its moves are
+    only made up from the rules as they are needed:
+
+    >>> one = ((None, (0, 2)),)
+    >>> two = ((0, (0, 2, 1)), (None, (0, 2)), (0, (1, 0, 2)))
+    >>> seq = RecursiveMoveSequence([one, two])
+    >>> list(seq), seq.length(), seq.get_move(2)
+    ([(0, 1), (0, 2), (1, 2)], 3, (1, 2))
+    """
+
+    def __init__(self: 'RecursiveMoveSequence', rules: list):
+        '''
+        (RecursiveMoveSequence, list of tuple) -> NoneType
+        Create a RecursiveMoveSequence holding the moves of the last of
+        rules, which may be empty.
+        REQ: every part of rules[r] is a move or uses a rule before r
+        '''
+        # REPRESENTATION INVARIANT
+        # self._rules is the list of rules, each only using rules before it
+        # self._lengths[r] is the number of moves of self._rules[r]
+        # self._packable is True iff every stool used is below 16
+        # self._blocks maps every rule with at most _RULE_MOVES moves to
+        # its moves packed one per byte, (src << 4) | dest, if
+        # self._packable
+        # self._length is the number of moves of the last rule that are
+        # kept, and self._tail lists the moves added after them
+        self._rules = list(rules)
+        self._lengths = []
+        self._packable = True
+        for rule in self._rules:
+            length = 0
+            for (sub, labels) in rule:
+                if (sub is None):
+                    length += 1
+                elif (sub < 0 or sub >= len(self._lengths)):
+                    raise ValueError("A rule can only use the rules before "
+                                     "it.")
+                else:
+                    length += self._lengths[sub]
+                if (max(labels) >= _PACKED_MAX_STOOLS):
+                    self._packable = False
+            self._lengths.append(length)
+        # Pack the short rules, each from the packed rules it uses
+        self._blocks = {}
+        for (r, rule) in enumerate(self._rules):
+            if (self._packable and self._lengths[r] <= _RULE_MOVES):
+                self._blocks[r] = b''.join(
+                    [bytes([(labels[0] << 4) | labels[1]]) if sub is None
+                     else self._blocks[sub].translate(_relabel_table(labels))
+                     for (sub, labels) in rule])
+        self._length = 0
+        if (self._rules != []):
+            self._length = self._lengths[-1]
+        self._tail = []
+
+    def _pieces(self: 'RecursiveMoveSequence', start: int, stop: int):
+        '''
+        (RecursiveMoveSequence, int, int) -> generator of tuple
+        Yield, in order, the pieces that make up the moves of the last rule
+        from start up to stop: (None, move, 0, 1) for a single move, or
+        (rule, labels, first, last) for the moves from first up to last
+        of a packed rule, with its stools relabeled by labels, or not
+        relabeled if labels is None. Only the rules on the way to the
+        pieces are looked at, so this takes time for the depth of the
+        rules and for the pieces.
+        REQ: 0 <= start <= stop <= the number of moves of the last rule
+        '''
+        pending = []
+        if (start < stop):
+            pending.append((len(self._rules) - 1, None, start, stop))
+        while (pending != []):
+            piece = pending.pop()
+            (rule, labels, first, last) = piece
+            if (rule is None or rule in self._blocks):
+                yield piece
+            else:
+                # Find the parts of the rule in the range, relabeled, and
+                # push them in reverse so they come out in order
+                parts = []
+                offset = 0
+                for (sub, sub_labels) in self._rules[rule]:
+                    size = 1 if sub is None else self._lengths[sub]
+                    if (offset < last and offset + size > first):
+                        if (labels is not None):
+                            sub_labels = tuple([labels[stool]
+                                                for stool in sub_labels])
+                        parts.append((sub, sub_labels,
+                                      max(first - offset, 0),
+                                      min(last - offset, size)))
+                    offset += size
+                parts.reverse()
+                pending.extend(parts)
+
+    def _chunks(self: 'RecursiveMoveSequence', start: int, stop: int):
+        '''
+        (RecursiveMoveSequence, int, int) -> generator of bytes
+        Yield the moves of the last rule from start up to stop, packed one
+        per byte, a piece at a time.
+        REQ: self._packable
+        REQ: 0 <= start <= stop <= the number of moves of the last rule
+        '''
+        for (rule, labels, first, last) in self._pieces(start, stop):
+            if (rule is None):
+                yield bytes([(labels[0] << 4) | labels[1]])
+            elif (labels is None):
+                yield self._blocks[rule][first:last]
+            else:
+                yield self._blocks[rule][first:last].translate(
+                    _relabel_table(labels))
+
+    def _moves(self: 'RecursiveMoveSequence', start: int, stop: int):
+        '''
+        (RecursiveMoveSequence, int, int) -> iterator of (int, int)
+        Return an iterator over the moves of the last rule from start up to
+        stop.
+        REQ: 0 <= start <= stop <= the number of moves of the last rule
+        '''
+        if (self._packable):
+            result = chain.from_iterable(
+                map(_BYTE_MOVES.__getitem__, chunk)
+                for chunk in self._chunks(start, stop))
+        else:
+            result = (piece[1] for piece in self._pieces(start, stop))
+        return result
+
+    def get_move(self: 'RecursiveMoveSequence', i: int):
+        # Exception if not (-self.length <= i < self.length)
+        if (i < 0):
+            i += self.length()
+        if (i < 0 or i >= self.length()):
+            raise IndexError("Move index out of range.")
+        if (i >= self._length):
+            result = self._tail[i - self._length]
+        else:
+            (rule, labels, first, last) = next(self._pieces(i, i + 1))
+            if (rule is None):
+                result = labels
+            else:
+                result = _BYTE_MOVES[self._blocks[rule][first]]
+                if (labels is not None):
+                    result = (labels[result[0]], labels[result[1]])
+        return result
+
+    def add_move(self: 'RecursiveMoveSequence', src_stool: int,
+                 dest_stool: int):
+        self._tail.append((src_stool, dest_stool))
+
+    def length(self: 'RecursiveMoveSequence') -> int:
+        return self._length + len(self._tail)
+
+    def truncate(self: 'RecursiveMoveSequence', length: int):
+        '''
+        (RecursiveMoveSequence, int) -> NoneType
+        Keep only the first length moves, without changing the rules.
+        REQ: 0 <= length <= self.length()
+        '''
+        if (length <= self._length):
+            self._length = length
+            self._tail = []
+        else:
+            del self._tail[length - self._length:]
+
+    def codes(self: 'RecursiveMoveSequence', start: int, stop: int) -> bytes:
+        '''
+        (RecursiveMoveSequence, int, int) -> bytes
+        Return the moves from start up to stop packed one per byte,
+        (src << 4) | dest, as PackedMoveSequence.codes does, copying whole
+        packed rules with their stools relabeled by bytes.translate.
+        REQ: every stool used is below 16
+        REQ: 0 <= start <= stop <= self.length()
+        >>> seq = RecursiveMoveSequence([((None, (0, 1)), (None, (1, 2)))])
+        >>> list(seq.codes(0, 2))
+        [1, 18]
+        '''
+        tail = [(src << 4) | dest for (src, dest) in
+                self._tail[max(start - self._length, 0):
+                           max(stop - self._length, 0)]]
+        return b''.join(self._chunks(min(start, self._length),
+                                     min(stop, self._length))) + bytes(tail)
+
+    def generate_trusted_TOAHModel(self: 'RecursiveMoveSequence',
+                                   number_of_stools: int,
+                                   number_of_cheeses: int) -> 'TOAHModel':
+        """
+        Like generate_TOAHModel, but the moves are made in bulk by
+        TOAHModel.apply_moves, which skips checking each move: only the
+        final state is checked, so a larger cheese put on a smaller one
+        and moved off again goes unnoticed. Use it for sequences known to
+        be legal, such as those from Tour.recursive_solution.
+        >>> seq = RecursiveMoveSequence([((None, (0, 1)), (None, (0, 2)),
+        ...                               (None, (1, 2)))])
+        >>> seq.generate_trusted_TOAHModel(3, 2).stool_assignment()
+        [2, 2]
+        """
+        model = TOAHModel(number_of_stools)
+        model.fill_first_stool(number_of_cheeses)
+        model.apply_moves(self, True)
+        return model
+
+    def __len__(self: 'RecursiveMoveSequence') -> int:
+        return self.length()
+
+    def __iter__(self: 'RecursiveMoveSequence'):
+        return chain(self._moves(0, self._length), self._tail)
+
+    def __getitem__(self: 'RecursiveMoveSequence', index):
+        '''
+        (RecursiveMoveSequence, int or slice) -> (int, int) or MoveSequence
+        Return the move at index, or the moves in the slice index: a
+        RecursiveMoveSequence sharing the rules for the first moves, or a
+        MoveSequence holding them otherwise.
+        '''
+        if (not isinstance(index, slice)):
+            return self.get_move(index)
+        start, stop, step = index.indices(self.length())
+        if (start == 0 and step == 1):
+            # Share the rules, which are never changed
+            result = RecursiveMoveSequence([])
+            result._rules = self._rules
+            result._lengths = self._lengths
+            result._packable = self._packable
+            result._blocks = self._blocks
+            result._length = self._length
+            result._tail = self._tail[:]
+            result.truncate(stop)
+        elif (step > 0):
+            result = MoveSequence(list(islice(self, start, stop, step)))
+        else:
+            result = MoveSequence(list(self)[index])
+        return result
+
+    def __repr__(self: 'RecursiveMoveSequence') -> str:
+        # The rules only say what the moves are if none were cut off or
+        # added
+        full = self._lengths[-1] if self._rules != [] else 0
+        if (self._length != full or self._tail != []):
+            result = "MoveSequence(" + repr(list(self)) + ")"
+        else:
+            result = "RecursiveMoveSequence(" + repr(self._rules) + ")"
+        return result
+
+
 if __name__ == '__main__':
     import doctest
     doctest.testmod(verbose=True)
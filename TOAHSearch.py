@@ -0,0 +1,272 @@
+"""
+TOAHSearch: Find shortest solutions from any configuration of a game of
+Towers of Anne Hoy to any other.
+
+solve: Return a shortest MoveSequence between two configurations
+encode_state: Pack the stool of every cheese into one integer
+decode_state: Unpack an integer made by encode_state
+misplaced_heuristic: Lower bound on the moves left, for any goal
+SearchLimitError: Raised when a search would need too much memory
+
+Configurations are lists whose i-th element is the index of the stool that
+the cheese of size i + 1 is on, as returned by
+TOAHModel.stool_assignment. Since the cheeses on a stool are always in
+order of size, this is all there is to know about a configuration.
+
+The search is exact, so what it can solve is bounded by the configurations
+it has to keep. Within DEFAULT_MAX_STATES, on 4 stools, that is about 12
+cheeses with the default heuristic (around a minute and a half), and about
+13 from any configuration with PatternDatabase.solve, which also manages 14
+from some. Optimal solutions from any configuration of 15 or more cheeses
+on 4 stools are out of its reach; Tour.four_stool_hanoi moves a whole tower
+in the fewest moves known, the Frame-Stewart number.
+"""
+
+from TOAHModel import TOAHModel, MoveSequence
+import heapq
+
+# The most configurations solve keeps by default, about a gigabyte
+DEFAULT_MAX_STATES = 5000000
+
+
+class SearchLimitError(Exception):
+    '''
+    An error to be raised when a search needs to keep more configurations
+    than it is allowed to.
+    '''
+    pass
+
+
+def _bits_per_cheese(num_stools):
+    '''
+    (int) -> int
+    Return how many bits encode_state uses for the stool of each cheese.
+    REQ: num_stools >= 1
+    '''
+    return max(1, (num_stools - 1).bit_length())
+
+
+def encode_state(locations, num_stools):
+    '''
+    (list of int, int) -> int
+    Return the configuration locations packed into one integer, with the
+    stool of the cheese of size i + 1 in the i-th group of bits.
+    REQ: 0 <= locations[i] < num_stools
+    >>> encode_state([1, 0, 3], 4)
+    49
+    '''
+    bits = _bits_per_cheese(num_stools)
+    result = 0
+    for size in range(len(locations) - 1, -1, -1):
+        result = (result << bits) | locations[size]
+    return result
+
+
+def decode_state(state, num_cheese, num_stools):
+    '''
+    (int, int, int) -> list of int
+    Return the configuration that encode_state packed into state.
+    REQ: state was made by encode_state for num_cheese cheeses and
+         num_stools stools
+    >>> decode_state(49, 3, 4)
+    [1, 0, 3]
+    '''
+    bits = _bits_per_cheese(num_stools)
+    mask = (1 << bits) - 1
+    return [(state >> (bits * size)) & mask for size in range(num_cheese)]
+
+
+def _successors(state, num_cheese, num_stools):
+    '''
+    (int, int, int) -> list of (int, int, int)
+    Return (next state, origin, destination) for every legal move from the
+    encoded configuration state.
+    REQ: state was made by encode_state for num_cheese cheeses and
+         num_stools stools
+    '''
+    bits = _bits_per_cheese(num_stools)
+    mask = (1 << bits) - 1
+    # The smallest cheese on each stool is its top one
+    tops = [None] * num_stools
+    left = num_stools
+    size = 0
+    while (size < num_cheese and left > 0):
+        stool = (state >> (bits * size)) & mask
+        if (tops[stool] is None):
+            tops[stool] = size
+            left -= 1
+        size += 1
+    result = []
+    for src in range(num_stools):
+        top = tops[src]
+        if (top is not None):
+            for dest in range(num_stools):
+                # A cheese can go to an empty stool or onto a larger one
+                if (dest != src and (tops[dest] is None or tops[dest] > top)):
+                    result.append((state + ((dest - src) << (bits * top)),
+                                   src, dest))
+    return result
+
+
+def _canonical_function(goal, num_stools):
+    '''
+    (list of int, int) -> function
+    Return a function that maps an encoded configuration to the same
+    representative for every configuration that only differs from it by
+    swapping stools that are empty in goal. Those configurations are the
+    same distance from goal, so the search only needs to visit one of them.
+    REQ: 0 <= goal[i] < num_stools
+    '''
+    num_cheese = len(goal)
+    spare = [stool for stool in range(num_stools) if stool not in goal]
+    bits = _bits_per_cheese(num_stools)
+    mask = (1 << bits) - 1
+
+    def canonical(state):
+        # Label the spare stools in the order their largest cheeses appear,
+        # from the largest cheese down
+        relabel = {}
+        result = 0
+        for size in range(num_cheese - 1, -1, -1):
+            stool = (state >> (bits * size)) & mask
+            if (stool in relabel):
+                stool = relabel[stool]
+            elif (stool in spare):
+                relabel[stool] = spare[len(relabel)]
+                stool = relabel[stool]
+            result = (result << bits) | stool
+        return result
+
+    def unchanged(state):
+        return state
+
+    # With fewer than two spare stools there is nothing to swap
+    if (len(spare) < 2):
+        canonical = unchanged
+    return canonical
+
+
+def misplaced_heuristic(goal, num_stools):
+    '''
+    (list of int, int) -> function
+    Return a function giving a lower bound on the number of moves from an
+    encoded configuration to goal. Every cheese that is not on its goal
+    stool needs a move. Let L be the largest such cheese: every smaller
+    cheese that is already on its goal stool, but sits on L's stool or on
+    L's goal stool, has to get out of L's way and come back, two moves.
+    The bound never drops by more than one per move, so A* can close every
+    configuration the first time it is taken from the queue.
+    REQ: 0 <= goal[i] < num_stools
+    '''
+    num_cheese = len(goal)
+    bits = _bits_per_cheese(num_stools)
+    mask = (1 << bits) - 1
+
+    def heuristic(state):
+        result = 0
+        blocked = None
+        for size in range(num_cheese - 1, -1, -1):
+            stool = (state >> (bits * size)) & mask
+            if (stool != goal[size]):
+                result += 1
+                # The first misplaced cheese found is the largest one
+                if (blocked is None):
+                    blocked = (stool, goal[size])
+            elif (blocked is not None and stool in blocked):
+                result += 2
+        return result
+
+    return heuristic
+
+
+def solve(model: TOAHModel, goal=None, heuristic=None,
+          max_states: int=DEFAULT_MAX_STATES) -> MoveSequence:
+    '''
+    (TOAHModel, TOAHModel or list of int, function, int) -> MoveSequence
+    Return a shortest MoveSequence that takes the cheeses of model to the
+    configuration goal, without changing model. goal is a TOAHModel or a
+    list whose i-th element is the goal stool of the cheese of size i + 1,
+    and defaults to every cheese on the last stool.
+    The search is A*: configurations are packed with encode_state and kept
+    in a table of the best known predecessor of each one, configurations
+    that differ by swapping stools empty in goal are kept once, and
+    heuristic (misplaced_heuristic by default) is a function giving a lower
+    bound on the moves left from an encoded configuration. A weak heuristic
+    costs memory and time, not correctness.
+    Raise SearchLimitError if more than max_states configurations are needed.
+    REQ: the cheeses in model have sizes 1 to number_of_cheeses
+    REQ: goal has a cheese for each cheese in model
+    >>> M = TOAHModel(4)
+    >>> M.fill_first_stool(3)
+    >>> M.move(0, 1)
+    >>> solve(M).length()
+    4
+    '''
+    num_stools = model.number_of_stools()
+    start = model.stool_assignment()
+    if (goal is None):
+        goal = [num_stools - 1] * len(start)
+    elif (isinstance(goal, TOAHModel)):
+        goal = goal.stool_assignment()
+    num_cheese = len(start)
+    if (heuristic is None):
+        heuristic = misplaced_heuristic(goal, num_stools)
+    canonical = _canonical_function(goal, num_stools)
+    start_state = canonical(encode_state(start, num_stools))
+    goal_state = canonical(encode_state(goal, num_stools))
+    # The transposition table: the best known number of moves to each
+    # configuration, and the configuration it was reached from
+    best = {start_state: 0}
+    parent = {start_state: None}
+    # Entries are (lower bound on the total moves, -moves so far, state),
+    # so that ties go to the configuration closest to the goal
+    queue = [(heuristic(start_state), 0, start_state)]
+    found = start_state == goal_state
+    while (not found and queue != []):
+        bound, moves, state = heapq.heappop(queue)
+        moves = -moves
+        # The first time the goal leaves the queue, no shorter way is left
+        found = state == goal_state
+        # Skip entries for configurations reached faster since they were
+        # queued
+        if (not found and moves == best[state]):
+            for (after, src, dest) in _successors(state, num_cheese,
+                                                  num_stools):
+                after = canonical(after)
+                if (after not in best or best[after] > moves + 1):
+                    best[after] = moves + 1
+                    parent[after] = state
+                    heapq.heappush(queue, (moves + 1 + heuristic(after),
+                                           -(moves + 1), after))
+            if (len(best) > max_states):
+                raise SearchLimitError(
+                    "The search needs more than " + str(max_states) +
+                    " configurations for " + str(num_cheese) +
+                    " cheeses on " + str(num_stools) + " stools. On 4 "
+                    "stools, exact search reaches about 12 cheeses, or 13 "
+                    "with PatternDatabase.solve.")
+    if (not found):
+        raise SearchLimitError("The goal can't be reached.")
+    # Walk back from the goal to list the configurations on the way
+    path = []
+    state = goal_state
+    while (state is not None):
+        path.append(state)
+        state = parent[state]
+    path.reverse()
+    # Stools may have been swapped along the way, so find the real moves by
+    # following the path from the real starting configuration
+    result = MoveSequence([])
+    state = encode_state(start, num_stools)
+    for step in path[1:]:
+        for (after, src, dest) in _successors(state, num_cheese, num_stools):
+            if (canonical(after) == step):
+                result.add_move(src, dest)
+                state = after
+                break
+    return result
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod(verbose=True)
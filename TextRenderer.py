@@ -0,0 +1,178 @@
+"""
+TextRenderer: Draw a TOAHModel as text, updating only what moves change.
+
+TextRenderer: MoveObserver keeping the rows of the picture up to date
+
+The picture is the same as str(model), but each row is kept as a byte
+array, and a move only rewrites the two cells it touches: the one the
+cheese left and the one it landed on. Attached to a model, the renderer
+follows its moves in O(1) rows per move, and redraw writes only the rows
+that changed since the last frame, moving the cursor to them with ANSI
+escape codes:
+
+    >>> from TOAHModel import TOAHModel
+    >>> model = TOAHModel(3)
+    >>> model.fill_first_stool(2)
+    >>> renderer = TextRenderer(model)
+    >>> model.attach_observer(renderer)
+    >>> renderer.render() == str(model)
+    True
+    >>> model.move(0, 1)
+    >>> renderer.changed_rows()
+    [0, 1]
+    >>> renderer.render() == str(model)
+    True
+"""
+
+from MoveMetrics import MoveObserver
+import sys
+
+# Written between the cells of a row
+_SPACING = b"  "
+# ANSI escape codes moving the cursor up and down a number of lines
+_UP = "\x1b[{}A"
+_DOWN = "\x1b[{}B"
+# ANSI escape code erasing from the cursor to the end of the screen
+_ERASE_BELOW = "\x1b[J"
+
+
+class TextRenderer(MoveObserver):
+    """The text picture of a TOAHModel, kept up to date as moves are made
+    on it.
+    """
+
+    def __init__(self: 'TextRenderer', model):
+        '''
+        (TextRenderer, TOAHModel) -> NoneType
+        Create a renderer for the current state of model. Attach it to
+        model to keep up with its moves.
+        '''
+        # REPRESENTATION INVARIANT
+        # self._stacks[s] lists the sizes of the cheeses on stool s, bottom
+        # first
+        # self._cells[size] is the text of a cell holding a cheese of that
+        # size, or of an empty cell for size 0, all self._width long
+        # self._rows[h] is the row of cheeses at height h, as a bytearray
+        # self._base is the bottom row, of stools
+        # self._changed is the set of heights of rows changed since the
+        # last redraw
+        self._width = 2 * model.number_of_cheeses() + 1
+        self._stride = self._width + len(_SPACING)
+        self._cells = [b" " * self._width]
+        self._base = (b"=" * self._width + _SPACING) * model.number_of_stools()
+        self._changed = set()
+        self.sync(model)
+
+    def _cell(self: 'TextRenderer', size: int) -> bytes:
+        '''
+        (TextRenderer, int) -> bytes
+        Return the text of a cell holding a cheese of size, drawn like
+        TOAHModel.__str__ does.
+        '''
+        while (len(self._cells) <= size):
+            part = "-" + "--" * (len(self._cells) - 1)
+            filler = " " * int((self._width - len(part)) / 2)
+            self._cells.append((filler + part + filler).encode())
+        return self._cells[size]
+
+    def sync(self: 'TextRenderer', model):
+        '''
+        (TextRenderer, TOAHModel) -> NoneType
+        Redo the picture from scratch for the current state of model, e.g.
+        after cheeses were added to it. Every row counts as changed.
+        '''
+        self._stacks = []
+        for stool in range(model.number_of_stools()):
+            sizes = []
+            cheese = model._cheese_at(stool, 0)
+            while (cheese is not None):
+                sizes.append(int(cheese.size))
+                cheese = model._cheese_at(stool, len(sizes))
+            self._stacks.append(sizes)
+        empty = (self._cells[0] + _SPACING) * model.number_of_stools()
+        self._rows = [bytearray(empty)
+                      for height in range(model.number_of_cheeses())]
+        for (stool, sizes) in enumerate(self._stacks):
+            for (height, size) in enumerate(sizes):
+                self._write(stool, height, size)
+        self._changed.update(range(len(self._rows)))
+
+    def _write(self: 'TextRenderer', stool: int, height: int, size: int):
+        '''
+        (TextRenderer, int, int, int) -> NoneType
+        Draw a cheese of size, or nothing if size is 0, in the cell of
+        stool at height.
+        '''
+        start = stool * self._stride
+        self._rows[height][start:start + self._width] = self._cell(size)
+        self._changed.add(height)
+
+    def moved(self: 'TextRenderer', model, curr_stool: int, dest_stool: int,
+              check_ns: int, apply_ns: int):
+        size = self._stacks[curr_stool].pop()
+        self._write(curr_stool, len(self._stacks[curr_stool]), 0)
+        self._write(dest_stool, len(self._stacks[dest_stool]), size)
+        self._stacks[dest_stool].append(size)
+
+    def render(self: 'TextRenderer') -> str:
+        '''
+        (TextRenderer) -> str
+        Return the whole picture, the same as str(model), and count every
+        row as drawn.
+        '''
+        self._changed.clear()
+        rows = [bytes(row) for row in reversed(self._rows)]
+        rows.append(self._base)
+        return b"\n".join(rows).decode()
+
+    def changed_rows(self: 'TextRenderer') -> list:
+        '''
+        (TextRenderer) -> list of int
+        Return the heights of the rows changed since the last frame,
+        lowest first.
+        '''
+        return sorted(self._changed)
+
+    def redraw(self: 'TextRenderer', output=None, lines_after: int=0):
+        '''
+        (TextRenderer, file, int) -> NoneType
+        Rewrite the rows changed since the last frame on output (standard
+        output by default), which must be a terminal showing the last
+        frame, with the cursor lines_after lines below the line after it.
+        Those lines are erased first, leaving the cursor on the line after
+        the frame.
+        REQ: lines_after >= 0
+        >>> from TOAHModel import TOAHModel
+        >>> from io import StringIO
+        >>> model = TOAHModel(2)
+        >>> model.fill_first_stool(1)
+        >>> renderer = TextRenderer(model)
+        >>> model.attach_observer(renderer)
+        >>> renderer.render() == str(model)
+        True
+        >>> model.move(0, 1)
+        >>> out = StringIO()
+        >>> renderer.redraw(out, 3)
+        >>> print(out.getvalue().replace(chr(27), '^').replace(chr(13), '|'))
+        ^[3A|^[J^[2A|      -   ^[2B|
+        '''
+        output = output or sys.stdout
+        parts = []
+        if (lines_after > 0):
+            parts.append(_UP.format(lines_after) + "\r" + _ERASE_BELOW)
+        for height in sorted(self._changed):
+            # The line one up from the line after the frame is the stools
+            # row, the last of the frame, and the row at height is height
+            # + 1 lines above that, so height + 2 lines up in all
+            up = height + 2
+            parts.append(_UP.format(up) + "\r" +
+                         self._rows[height].decode() +
+                         _DOWN.format(up) + "\r")
+        self._changed.clear()
+        output.write("".join(parts))
+        output.flush()
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod(verbose=True)
@@ -1,78 +1,619 @@
 
 from ConsoleController import ConsoleController
-from GUIController import GUIController
-from TOAHModel import TOAHModel
+from TOAHModel import (TOAHModel, CompactTOAHModel, RecursiveMoveSequence,
+                       _pack_nibbles, _relabel_table, _PACKED_MAX_STOOLS)
+from ConsoleAnimator import animate
 
 import time
 NUM_CHEESES = 3
 
+# Memoized Frame-Stewart table shared by every solve.
+# _FS_MOVES[k][n] is the least number of moves needed to move n cheeses
+# using k stools, and _FS_SPLIT[k][n] is how many of the largest cheeses
+# should be moved with k - 1 stools to reach that number.
+_FS_MOVES = {}
+_FS_SPLIT = {}
+# Solutions packed one move per byte, (origin << 4) | destination, for the
+# games from the first stool to the last that take at most _BLOCK_MOVES
+# moves, by (cheeses, stools); TOAHModel._relabel_table relabels them
+_BLOCK_MOVES = 1 << 20
+_MOVE_BLOCKS = {}
+# The same solutions packed two moves per byte, as PackedMoveSequence packs
+# games with at most 4 stools: starting in the high nibble of the first
+# byte, and starting in its low nibble; and the tables that relabel them
+_NIBBLE_BLOCKS = {}
+_NIBBLE_TABLES = {}
 
-def _find_i(num_cheese):
+
+def _extend_split_table(num_cheese, num_stools):
+    '''
+    (int, int) -> NoneType
+    Grow the memoized Frame-Stewart table so that it covers every game with
+    at most num_cheese cheeses and at most num_stools stools. Rows that
+    were computed by an earlier call are reused, not rebuilt.
+    REQ: num_cheese >= 0 and num_stools >= 3
+    '''
+    # Fill the rows with fewer stools first, since each row needs the one
+    # below it
+    for stools in range(3, num_stools + 1):
+        moves = _FS_MOVES.setdefault(stools, [0])
+        split = _FS_SPLIT.setdefault(stools, [0])
+        # Only compute the entries that aren't in the table yet
+        for cheese in range(len(moves), num_cheese + 1):
+            # With 3 stools the only choice is to move the largest cheese
+            # on its own
+            if (stools == 3):
+                best_moves = 2 * moves[cheese - 1] + 1
+                best_i = 1
+            # Otherwise try every split and keep the cheapest one
+            else:
+                fewer_stools = _FS_MOVES[stools - 1]
+                best_moves = None
+                best_i = None
+                for i in range(1, cheese + 1):
+                    total = 2 * moves[cheese - i] + fewer_stools[i]
+                    # Prefer the larger split on ties, it recurses less
+                    if (best_moves is None or total <= best_moves):
+                        best_moves = total
+                        best_i = i
+            moves.append(best_moves)
+            split.append(best_i)
+
+
+def frame_stewart_moves(num_cheese, num_stools):
+    '''
+    (int, int) -> int
+    Return the number of moves the Frame-Stewart solution needs to move
+    num_cheese cheeses from the first stool to the last of num_stools stools.
+    REQ: num_cheese >= 0 and num_stools >= 3
+    >>> frame_stewart_moves(5, 4)
+    13
+    >>> frame_stewart_moves(5, 5)
+    11
     '''
-    (int) -> int
-    Find the optimal value of variable, i, which determines how much cheese
-    should be left over to move from the origin stool to the destination stool
-    after moving num_cheese - i to a temporary stool.
-    REQ: num_cheese >= 2
+    # Build the table only when the requested entry is missing
+    if (num_stools not in _FS_MOVES or
+            len(_FS_MOVES[num_stools]) <= num_cheese):
+        _extend_split_table(num_cheese, num_stools)
+    return _FS_MOVES[num_stools][num_cheese]
+
+
+def frame_stewart_split(num_cheese, num_stools):
+    '''
+    (int, int) -> int
+    Return the optimal i for num_cheese cheeses and num_stools stools: the
+    number of largest cheeses to move using num_stools - 1 stools, after the
+    other num_cheese - i cheeses were moved out of the way.
+    REQ: num_cheese >= 1 and num_stools >= 3
+    >>> frame_stewart_split(6, 4)
+    3
     '''
-    # The formula to find i comes from the summation of k, where k is some
-    # real number; i(i+1)/2 = num_cheese, which was found from the formula
-    # to calculate the amount of steps required to solve TOAH with 4 stools
-    i = (((8*num_cheese+1)**.5)-1)/2
-    # Round down the value to the nearest integer and return
-    return int(i)
+    # Build the table only when the requested entry is missing
+    if (num_stools not in _FS_SPLIT or
+            len(_FS_SPLIT[num_stools]) <= num_cheese):
+        _extend_split_table(num_cheese, num_stools)
+    return _FS_SPLIT[num_stools][num_cheese]
+
+
+def _three_stool_labels(num_cheese, stl0, stl1, stl2):
+    '''
+    (int, int, int, int) -> tuple of int
+    Return the stools that the 3 stool formulas call 0, 1 and 2, when
+    moving num_cheese cheeses from stl0 to stl2. The formulas end on stool
+    2 for an odd number of cheeses and on stool 1 for an even one.
+    REQ: num_cheese >= 0
+    '''
+    if (num_cheese % 2 == 1):
+        labels = (stl0, stl1, stl2)
+    else:
+        labels = (stl0, stl2, stl1)
+    return labels
+
+
+def _iter_three_stool_moves(num_cheese, stl0, stl1, stl2):
+    '''
+    (int, int, int, int) -> generator of (int, int)
+    Yield the moves that take num_cheese cheeses from stl0 to stl2 using
+    stl1, without recursion. The m-th move (counting from 1) goes from
+    stool (m & (m - 1)) % 3 to stool ((m | (m - 1)) + 1) % 3.
+    REQ: num_cheese >= 0
+    '''
+    # Pick the labels so that the tower always ends on stl2
+    labels = _three_stool_labels(num_cheese, stl0, stl1, stl2)
+    # Every (from, to) pair the formula can produce, indexed by 3 * from + to
+    pairs = [(labels[src], labels[dest]) for src in range(3)
+             for dest in range(3)]
+    for m in range(1, 1 << num_cheese):
+        yield pairs[(m & (m - 1)) % 3 * 3 + ((m | (m - 1)) + 1) % 3]
+
+
+def _sub_towers(cheese, labels):
+    '''
+    (int, tuple of int) -> tuple
+    Return the split i for moving cheese cheeses across the stools in labels,
+    followed by the stools used by each of the three steps of the move:
+    the smaller cheeses to the temporary stool, the i largest cheeses to
+    the destination, and the smaller cheeses to the destination.
+    REQ: cheese >= 1 and len(labels) >= 4
+    '''
+    i = frame_stewart_split(cheese, len(labels))
+    temp = labels[1]
+    others = labels[2:-1]
+    return (i, (labels[0],) + others + (labels[-1], temp),
+            (labels[0],) + others + (labels[-1],),
+            (temp, labels[0]) + others + (labels[-1],))
+
+
+def iter_moves(num_cheese, num_stools, stools=None):
+    '''
+    (int, int, list of int) -> generator of (int, int)
+    Yield, one at a time, the (origin, destination) moves of the
+    Frame-Stewart solution that takes num_cheese cheeses from the first
+    stool to the last. No TOAHModel is needed, and the generator keeps
+    O(num_cheese) pending sub-towers instead of recursing.
+    stools - the stool indexes to use, from origin to destination; defaults
+             to 0, 1, ..., num_stools - 1
+    REQ: num_cheese >= 0 and num_stools >= 3
+    REQ: stools is None or len(stools) == num_stools
+    >>> list(iter_moves(2, 3))
+    [(0, 1), (0, 2), (1, 2)]
+    >>> list(iter_moves(3, 4, [3, 2, 1, 0]))
+    [(3, 2), (3, 1), (3, 0), (1, 0), (2, 0)]
+    '''
+    if (stools is None):
+        stools = range(num_stools)
+    # A stack of the sub-towers still to move, the next one on top
+    pending = [(num_cheese, tuple(stools))]
+    while (pending != []):
+        cheese, labels = pending.pop()
+        # With no cheese there is nothing to move
+        if (cheese == 0):
+            pass
+        # Three stools have no choice to make, count through the moves
+        elif (len(labels) == 3):
+            yield from _iter_three_stool_moves(cheese, labels[0], labels[1],
+                                               labels[2])
+        # If there is only 1 cheese, move it to the destination
+        elif (cheese == 1):
+            yield (labels[0], labels[-1])
+        else:
+            # Look up how many of the largest cheeses to move with one less
+            # stool, and which stools each step uses
+            i, first, middle, last = _sub_towers(cheese, labels)
+            # Push the three steps in reverse, so they're done in order:
+            # move the smaller cheeses out of the way using every stool,
+            # move the largest cheeses without touching the temporary stool,
+            # then move the smaller cheeses back on top of them
+            pending.append((cheese - i, last))
+            pending.append((i, middle))
+            pending.append((cheese - i, first))
+
+
+def _move_block(num_cheese, num_stools):
+    '''
+    (int, int) -> bytes
+    Return the moves of iter_moves(num_cheese, num_stools) packed one per
+    byte. They are put together from the packed solutions of the smaller
+    games, relabeled with bytes.translate, and remembered if there are at
+    most _BLOCK_MOVES of them.
+    REQ: num_cheese >= 0 and 3 <= num_stools <= 16
+    '''
+    block = _MOVE_BLOCKS.get((num_cheese, num_stools))
+    if (block is None):
+        labels = tuple(range(num_stools))
+        if (num_cheese == 0):
+            block = b''
+        elif (num_cheese == 1):
+            block = bytes([num_stools - 1])
+        # The largest cheese moves once, between two moves of the others
+        elif (num_stools == 3):
+            smaller = _move_block(num_cheese - 1, 3)
+            block = (smaller.translate(_relabel_table((0, 2, 1))) +
+                     bytes([2]) + smaller.translate(_relabel_table((1, 0, 2))))
+        else:
+            i, first, middle, last = _sub_towers(num_cheese, labels)
+            smaller = _move_block(num_cheese - i, num_stools)
+            block = (smaller.translate(_relabel_table(first)) +
+                     _move_block(i, num_stools - 1).translate(
+                         _relabel_table(middle)) +
+                     smaller.translate(_relabel_table(last)))
+        if (len(block) <= _BLOCK_MOVES):
+            _MOVE_BLOCKS[(num_cheese, num_stools)] = block
+    return block
+
+
+def _iter_move_pieces(num_cheese, stools, most=_BLOCK_MOVES):
+    '''
+    (int, tuple of int, int) -> generator of (int, tuple of int)
+    Yield, in order, the pieces of the Frame-Stewart solution that takes
+    num_cheese cheeses across stools: (cheeses, stools) for a sub-tower of
+    at most most moves, whose _move_block is remembered if most is
+    _BLOCK_MOVES, or (None, stools) for a single move from the first of
+    stools to the last.
+    REQ: num_cheese >= 0 and 3 <= len(stools) <= 16
+    '''
+    _extend_split_table(num_cheese, len(stools))
+    # A stack of the sub-towers still to move, the next one on top, as in
+    # iter_moves
+    pending = [(num_cheese, stools)]
+    while (pending != []):
+        cheese, labels = pending.pop()
+        # With no cheese there is nothing to move
+        if (cheese == 0):
+            pass
+        elif (cheese is None or _FS_MOVES[len(labels)][cheese] <= most):
+            yield (cheese, labels)
+        elif (len(labels) == 3):
+            pending.append((cheese - 1, (labels[1], labels[0], labels[2])))
+            pending.append((None, labels))
+            pending.append((cheese - 1, (labels[0], labels[2], labels[1])))
+        else:
+            i, first, middle, last = _sub_towers(cheese, labels)
+            pending.append((cheese - i, last))
+            pending.append((i, middle))
+            pending.append((cheese - i, first))
+
+
+def iter_move_chunks(num_cheese, num_stools, stools=None):
+    '''
+    (int, int, list of int) -> generator of bytes
+    Yield the moves of iter_moves(num_cheese, num_stools, stools) in
+    chunks of bytes, one move per byte, (origin << 4) | destination. Whole
+    sub-towers of up to _BLOCK_MOVES moves come out as one chunk, copied
+    from a remembered solution with its stools relabeled by
+    bytes.translate, so no tuple is made per move.
+    REQ: num_cheese >= 0 and 3 <= num_stools <= 16
+    REQ: stools is None or len(stools) == num_stools
+    >>> [list(chunk) for chunk in iter_move_chunks(2, 3)]
+    [[1, 2, 18]]
+    '''
+    if (stools is None):
+        stools = range(num_stools)
+    for (cheese, labels) in _iter_move_pieces(num_cheese, tuple(stools)):
+        if (cheese is None):
+            yield bytes([(labels[0] << 4) | labels[-1]])
+        else:
+            yield _move_block(cheese, len(labels)).translate(
+                _relabel_table(labels))
+
+
+def _nibble_block(num_cheese, num_stools):
+    '''
+    (int, int) -> (bytes, bytes)
+    Return the moves of _move_block(num_cheese, num_stools) packed two per
+    byte, starting in the high nibble of the first byte, and starting in
+    its low nibble after an empty high nibble. Unused nibbles are 0.
+    REQ: _move_block(num_cheese, num_stools) is remembered
+    REQ: num_stools <= 4
+    '''
+    blocks = _NIBBLE_BLOCKS.get((num_cheese, num_stools))
+    if (blocks is None):
+        moves = _move_block(num_cheese, num_stools)
+        length = len(moves)
+        aligned = _pack_nibbles(moves + b'\0' * (length & 1))
+        # Shift every nibble one place to the right, growing a byte if the
+        # last nibble was in use
+        value = int.from_bytes(aligned, 'big')
+        size = (length + 2) >> 1
+        shift = 2 * size - 1 - 2 * len(aligned)
+        if (shift >= 0):
+            value <<= 4 * shift
+        else:
+            value >>= -4 * shift
+        blocks = (aligned, value.to_bytes(size, 'big'))
+        _NIBBLE_BLOCKS[(num_cheese, num_stools)] = blocks
+    return blocks
+
+
+def _nibble_table(labels):
+    '''
+    (tuple of int) -> bytes
+    Return the bytes.translate table that relabels the stools of both moves
+    in a byte of moves packed two per byte, as _relabel_table does for
+    moves packed one per byte. An unused nibble, 0, stays 0.
+    REQ: every stool in labels is < 4
+    '''
+    table = _NIBBLE_TABLES.get(labels)
+    if (table is None):
+        nibbles = list(range(16))
+        for (src, src_label) in enumerate(labels):
+            for (dest, dest_label) in enumerate(labels):
+                if (src != dest):
+                    nibbles[(src << 2) | dest] = (src_label << 2) | dest_label
+        table = _NIBBLE_TABLES[labels] = bytes(
+            (nibbles[code >> 4] << 4) | nibbles[code & 15]
+            for code in range(256))
+    return table
+
+
+def iter_packed_chunks(num_cheese, num_stools, stools=None, odd=False):
+    '''
+    (int, int, list of int, bool) -> generator of bytes-like
+    Yield the moves of iter_moves(num_cheese, num_stools, stools) packed as
+    PackedMoveSequence packs them, in chunks that are whole bytes; the
+    last nibble of the last byte is 0 if it isn't used. With at most 4
+    stools remembered sub-towers are copied already packed two moves per
+    byte, relabeled with bytes.translate, and if odd, the first move goes
+    in the low nibble of the first byte, after a high nibble of 0, as it
+    would after an odd number of moves.
+    REQ: num_cheese >= 0 and 3 <= num_stools <= 16
+    REQ: stools is None or len(stools) == num_stools, with every stool
+         below 4 if num_stools <= 4
+    >>> [list(chunk) for chunk in iter_packed_chunks(2, 3)]
+    [[18], [96]]
+    >>> [list(chunk) for chunk in iter_packed_chunks(2, 3, odd=True)]
+    [[1], [38]]
+    '''
+    if (stools is None):
+        stools = range(num_stools)
+    if (num_stools > 4):
+        yield from iter_move_chunks(num_cheese, num_stools, stools)
+        return
+    # The high nibble of a byte whose low nibble is the next move, or None
+    carry = None
+    if (odd):
+        carry = 0
+    for (cheese, labels) in _iter_move_pieces(num_cheese, tuple(stools)):
+        if (cheese is None):
+            move = (labels[0] << 2) | labels[-1]
+            length = 1
+            aligned = bytes([move << 4])
+            shifted = bytes([move])
+        else:
+            length = _FS_MOVES[len(labels)][cheese]
+            aligned, shifted = _nibble_block(cheese, len(labels))
+            table = _nibble_table(labels)
+            if (carry is None):
+                aligned = aligned.translate(table)
+            else:
+                shifted = shifted.translate(table)
+        if (carry is None):
+            data = memoryview(aligned)
+        else:
+            # Fill the low nibble of the carried byte with the first move
+            yield bytes([carry | shifted[0]])
+            data = memoryview(shifted)[1:]
+            length -= 1
+        # An odd number of moves leaves a byte half full
+        carry = None
+        if (length & 1 == 1):
+            carry = data[-1]
+            data = data[:-1]
+        if (len(data) > 0):
+            yield data
+    if (carry is not None):
+        yield bytes([carry])
+
+
+def recursive_solution(num_cheese, num_stools):
+    '''
+    (int, int) -> RecursiveMoveSequence
+    Return the moves of iter_moves(num_cheese, num_stools) as a
+    RecursiveMoveSequence with a rule for each sub-tower the Frame-Stewart
+    solution moves: at most num_cheese * num_stools rules, however many
+    moves there are, so it can be kept, passed around and indexed for games
+    far too big to play out.
+    REQ: num_cheese >= 0 and num_stools >= 3
+    >>> seq = recursive_solution(40, 4)
+    >>> seq.length() == frame_stewart_moves(40, 4)
+    True
+    >>> seq.get_move(1000) == move_at(40, 4, 1000)
+    True
+    >>> list(recursive_solution(3, 4)) == list(iter_moves(3, 4))
+    True
+    '''
+    _extend_split_table(num_cheese, num_stools)
+    # Find every sub-tower the solution moves, as (cheeses, stools)
+    games = set()
+    pending = [(num_cheese, num_stools)]
+    while (pending != []):
+        cheese, stools = pending.pop()
+        if ((cheese, stools) not in games):
+            games.add((cheese, stools))
+            if (cheese <= 1):
+                pass
+            elif (stools == 3):
+                pending.append((cheese - 1, 3))
+            else:
+                i = _FS_SPLIT[stools][cheese]
+                pending.append((cheese - i, stools))
+                pending.append((i, stools - 1))
+    # Every sub-tower only uses ones with fewer stools or fewer cheeses, so
+    # in that order each rule only uses the rules before it, and the whole
+    # solution comes last
+    rules = []
+    rule_of = {}
+    for (stools, cheese) in sorted([(stools, cheese)
+                                    for (cheese, stools) in games]):
+        labels = tuple(range(stools))
+        if (cheese == 0):
+            rule = ()
+        elif (cheese == 1):
+            rule = ((None, (0, stools - 1)),)
+        # The largest cheese moves once, between two moves of the others
+        elif (stools == 3):
+            smaller = rule_of[(cheese - 1, 3)]
+            rule = ((smaller, (0, 2, 1)), (None, (0, 2)),
+                    (smaller, (1, 0, 2)))
+        else:
+            i, first, middle, last = _sub_towers(cheese, labels)
+            smaller = rule_of[(cheese - i, stools)]
+            rule = ((smaller, first), (rule_of[(i, stools - 1)], middle),
+                    (smaller, last))
+        rule_of[(cheese, stools)] = len(rules)
+        rules.append(rule)
+    return RecursiveMoveSequence(rules)
+
+
+def state_after(num_cheese, num_stools, k):
+    '''
+    (int, int, int) -> list of int
+    Return a list whose i-th element is the index of the stool that the
+    cheese of size i + 1 is on after the first k moves of
+    iter_moves(num_cheese, num_stools), without making any of the moves.
+    This takes O(num_cheese) steps, however large k is.
+    REQ: num_cheese >= 0 and num_stools >= 3
+    REQ: 0 <= k <= frame_stewart_moves(num_cheese, num_stools)
+    >>> state_after(3, 3, 3)
+    [1, 1, 0]
+    >>> state_after(5, 4, 13)
+    [3, 3, 3, 3, 3]
+    '''
+    result = [0] * num_cheese
+    # The sub-tower that the k-th move belongs to, and the size of the
+    # cheese just below its smallest one
+    cheese = num_cheese
+    labels = tuple(range(num_stools))
+    base = 0
+    while (cheese > 0):
+        # With 3 stools, the m-th move of the formula in
+        # _iter_three_stool_moves moves the cheese of size d exactly
+        # ((m >> (d - 1)) + 1) >> 1 times after m moves, odd sizes
+        # always going 0 -> 2 -> 1 and even sizes 0 -> 1 -> 2
+        if (len(labels) == 3):
+            spots = _three_stool_labels(cheese, *labels)
+            for size in range(1, cheese + 1):
+                times = ((k >> (size - 1)) + 1) >> 1
+                step = 2 if size % 2 == 1 else 1
+                result[base + size - 1] = spots[times * step % 3]
+            cheese = 0
+        elif (cheese == 1):
+            result[base] = labels[-1] if k > 0 else labels[0]
+            cheese = 0
+        else:
+            i, first, middle, last = _sub_towers(cheese, labels)
+            smaller_moves = frame_stewart_moves(cheese - i, len(labels))
+            larger_moves = frame_stewart_moves(i, len(labels) - 1)
+            # Still moving the smaller cheeses out of the way, so the
+            # largest ones haven't left the origin
+            if (k < smaller_moves):
+                for size in range(base + cheese - i, base + cheese):
+                    result[size] = labels[0]
+                cheese -= i
+                labels = first
+            # Moving the largest cheeses, with the smaller ones waiting
+            elif (k < smaller_moves + larger_moves):
+                for size in range(base, base + cheese - i):
+                    result[size] = labels[1]
+                k -= smaller_moves
+                base += cheese - i
+                cheese = i
+                labels = middle
+            # Moving the smaller cheeses back, the largest ones are done
+            else:
+                for size in range(base + cheese - i, base + cheese):
+                    result[size] = labels[-1]
+                k -= smaller_moves + larger_moves
+                cheese -= i
+                labels = last
+    return result
+
+
+def move_at(num_cheese, num_stools, k):
+    '''
+    (int, int, int) -> (int, int)
+    Return the k-th move (counting from 0) of
+    iter_moves(num_cheese, num_stools), in O(num_cheese) steps.
+    REQ: num_cheese >= 1 and num_stools >= 3
+    REQ: 0 <= k < frame_stewart_moves(num_cheese, num_stools)
+    >>> move_at(3, 3, 3)
+    (0, 2)
+    '''
+    cheese = num_cheese
+    labels = tuple(range(num_stools))
+    result = None
+    while (result is None):
+        # With 3 stools use the formula from _iter_three_stool_moves
+        if (len(labels) == 3):
+            spots = _three_stool_labels(cheese, *labels)
+            m = k + 1
+            result = (spots[(m & (m - 1)) % 3], spots[((m | (m - 1)) + 1) % 3])
+        elif (cheese == 1):
+            result = (labels[0], labels[-1])
+        else:
+            # Find which of the three steps the k-th move is in
+            i, first, middle, last = _sub_towers(cheese, labels)
+            smaller_moves = frame_stewart_moves(cheese - i, len(labels))
+            larger_moves = frame_stewart_moves(i, len(labels) - 1)
+            if (k < smaller_moves):
+                cheese -= i
+                labels = first
+            elif (k < smaller_moves + larger_moves):
+                k -= smaller_moves
+                cheese = i
+                labels = middle
+            else:
+                k -= smaller_moves + larger_moves
+                cheese -= i
+                labels = last
+    return result
+
+
+def model_after(num_cheese, num_stools, k):
+    '''
+    (int, int, int) -> CompactTOAHModel
+    Return a model of the game after the first k moves of
+    iter_moves(num_cheese, num_stools), built without replaying them.
+    REQ: num_cheese >= 0 and 3 <= num_stools < 255
+    REQ: 0 <= k <= frame_stewart_moves(num_cheese, num_stools)
+    '''
+    model = CompactTOAHModel(num_stools)
+    model.fill_stools(state_after(num_cheese, num_stools, k))
+    return model
+
+
+def _play_moves(model, num_cheese, stools, ani, delay_btw_moves=0):
+    '''
+    (TOAHModel, int, list of int, bool, float) -> NoneType
+    Make the moves of iter_moves(num_cheese, len(stools), stools) in model.
+    If ani is True, animate them in the console with a ConsoleAnimator,
+    delay_btw_moves seconds apart. Otherwise make them in bulk with
+    TOAHModel.apply_moves, in the chunks of iter_move_chunks if the stools
+    fit, checking only the state each chunk leaves.
+    REQ: every move is legal in model
+    '''
+    if (ani is True):
+        animate(model, iter_moves(num_cheese, len(stools), stools),
+                delay_btw_moves)
+    elif (max(stools) < _PACKED_MAX_STOOLS):
+        for chunk in iter_move_chunks(num_cheese, len(stools), stools):
+            model.apply_moves(chunk, True)
+    else:
+        model.apply_moves(iter_moves(num_cheese, len(stools), stools), True)
 
 
 def three_stool_hanoi(model, num_cheese, stl0, stl1, stl2, ani):
     '''
-    (TOAHModel, int, int, int, int) -> NoneType
-    Solve the Tower of Hanoi for 3 stools, given num_cheese cheese's.
+    (TOAHModel, int, int, int, int, bool) -> NoneType
+    Solve the Tower of Hanoi for 3 stools, given num_cheese cheese's, moving
+    them from stl0 to stl2.
     REQ: Atleast 1 cheese in the game
     '''
-    # Base Case
-    if (num_cheese == 1):
-        # if there is only 1 cheese, move it to the destination
-        model.move(stl0, stl2)
-        # if animation option is true, then print the current model
-        if (ani is True):
-            print(model)
-    # Recursive Decomposition
-    else:
-        # Otherwise, we want to move num - 1 cheese to a temporary stool
-        three_stool_hanoi(model, num_cheese - 1, stl0, stl2, stl1, ani)
-        # Call the model's move method
-        model.move(stl0, stl2)
-        # Move the rest to the destination stool
-        three_stool_hanoi(model, num_cheese - 1, stl1, stl0, stl2, ani)
+    _play_moves(model, num_cheese, [stl0, stl1, stl2], ani)
 
 
 def four_stool_hanoi(model, num_cheese, stl0, stl1, stl2, stl3, ani):
     '''
-    (TOAHModel, int, int, int, int, int, int) -> NoneType
-    Given 4 stools, num_cheese cheese's and an integer i, which will determine
-    how much cheese to move at a given step, solve the tower to that all
+    (TOAHModel, int, int, int, int, int, bool) -> NoneType
+    Given 4 stools and num_cheese cheese's, solve the tower so that all
     the cheese ends up from the first stool to fourth stool.
     NOTE: the variable stl0,stl1,stl2,stl3 are just integers
     REQ: Atleast 1 cheese in the game
     '''
-    # Base Case 1:
-    if (num_cheese == 1):
-        # If there is only 1 cheese, move it to the destination
-        model.move(stl0, stl3)
-        # if animation option is true, then print the current model
-        if (ani is True):
-            print(model)
-    # Recursive Decomposition:
-    else:
-        # Find the i value, which differs for each number of cheeses
-        i = _find_i(num_cheese)
-        # we move n-1 cheese using 4 stools first
-        four_stool_hanoi(model, num_cheese - i, stl0, stl3, stl1, stl2, ani)
-        # Call the function to move with 3 stools, such that stool 2 is ignored
-        # we're now moving i cheeses using 3 stools to the desired stool
-        three_stool_hanoi(model, i, stl0, stl1, stl3, ani)
-        # now move the rest from the temporary stool to the desired stool
-        four_stool_hanoi(model, num_cheese - i, stl2, stl0, stl1, stl3, ani)
+    _play_moves(model, num_cheese, [stl0, stl1, stl2, stl3], ani)
+
+
+def k_stool_hanoi(model, num_cheese, stools, ani):
+    '''
+    (TOAHModel, int, list of int, bool) -> NoneType
+    Move num_cheese cheeses from the stool stools[0] to the stool stools[-1]
+    using every stool in stools, splitting the tower with the memoized
+    Frame-Stewart table so the number of moves is as small as possible.
+    NOTE: the elements of stools are just integers
+    REQ: num_cheese >= 0
+    REQ: len(stools) >= 3
+    '''
+    _play_moves(model, num_cheese, stools, ani)
 
 
 def tour_of_four_stools(model: TOAHModel, delay_btw_moves: float=0.5,
@@ -86,16 +627,28 @@ def tour_of_four_stools(model: TOAHModel, delay_btw_moves: float=0.5,
                          console_animate == True
                          no effect if console_animate == False
     """
-    # Call helper functions to move the cheese
-    # If console_animate is true, print each step
-    if (console_animate is True):
-        # Pass true in the parameter to print
-        four_stool_hanoi(model, model.number_of_cheeses(), 0, 1, 2, 3,
-                         True)
-    # Otherwise don't print it
-    else:
-        four_stool_hanoi(model, model.number_of_cheeses(), 0, 1, 2, 3,
-                         False)
+    # Stream the moves straight from the generator into the model,
+    # animating them if console_animate is true
+    _play_moves(model, model.number_of_cheeses(), range(4),
+                console_animate is True, delay_btw_moves)
+
+
+def tour_of_k_stools(model: TOAHModel, delay_btw_moves: float=0.5,
+                     console_animate: bool=False):
+    """Move a tower of cheeses from the first stool in model to the last,
+       using every stool in model.
+
+       model - a TOAHModel with a tower of cheese on the first stool
+                and at least two other empty stools
+       console_animate - whether to use ConsoleController to animate the tour
+       delay_btw_moves - time delay between moves in seconds IF
+                         console_animate == True
+                         no effect if console_animate == False
+    """
+    # Use every stool, from the first to the last
+    _play_moves(model, model.number_of_cheeses(),
+                range(model.number_of_stools()), console_animate is True,
+                delay_btw_moves)
 
 
 if __name__ == '__main__':